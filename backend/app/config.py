@@ -10,6 +10,78 @@ class Settings(BaseSettings):
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
     DATABASE_URL: str = "sqlite:///./data/reminders.db"
     CUSTOM_RAG_PATH: str = "./data/custom_rag"
+    # Chroma: "persistent" opens CUSTOM_RAG_PATH in-process, "http" shares one local Chroma server
+    CHROMA_MODE: str = "persistent"
+    CHROMA_HOST: str = "127.0.0.1"
+    CHROMA_PORT: int = 8001
+    CHROMA_AUTOSTART: bool = True  # start_all.py launches the server in http mode
+    CHROMA_CONNECT_TIMEOUT: int = 30
+    # Near-duplicates: a new memory within this cosine distance of an existing one with the same
+    # words updates it (opt-in, 0 disables; e.g. 0.05)
+    MEMORY_DEDUP_DISTANCE: float = 0.0
+    # Periodic compaction deleting near-duplicate memories, run by the API process (opt-in, 0 disables)
+    MEMORY_COMPACTION_INTERVAL_HOURS: int = 0
+    # Long texts (over MEMORY_CHUNK_CHARS) are stored as overlapping chunks of a parent document.
+    # Retrieval returns the whole parent when it is at most MEMORY_PARENT_MAX_CHARS long.
+    MEMORY_CHUNK_CHARS: int = 1000
+    MEMORY_CHUNK_OVERLAP: int = 150
+    MEMORY_PARENT_MAX_CHARS: int = 4000
+    # Memory partitioning: "shared" (one collection), "user" (one collection per user)
+    # or "bucket" (users hashed into MEMORY_PARTITION_BUCKETS collections)
+    MEMORY_PARTITIONING: str = "shared"
+    MEMORY_PARTITION_BUCKETS: int = 64
+    MEMORY_PARTITION_CACHE_SIZE: int = 128  # Open partition collection handles kept per process
+    # HNSW index of memory collections (see README for per-size profiles).
+    # M and construction_ef only apply when a collection is created, search_ef also to existing ones.
+    MEMORY_HNSW_M: int = 16
+    MEMORY_HNSW_CONSTRUCTION_EF: int = 100
+    MEMORY_HNSW_SEARCH_EF: int = 50
+    # Vectors of new collections: "" (in Chroma's HNSW index), or "int8"/"float16" codes searched in process,
+    # with full-precision vectors on disk to rescore the best MEMORY_RESCORE_CANDIDATES per requested result.
+    # Existing collections are converted by the re-embedding migration.
+    MEMORY_QUANTIZATION: str = ""
+    MEMORY_RESCORE_CANDIDATES: int = 4
+    # Embeddings: "gemini" (remote), "local" (sentence-transformers on CPU) or "hashing" (tests/offline)
+    EMBEDDING_PROVIDER: str = "gemini"
+    EMBEDDING_MODEL: str = ""  # Empty means the provider's default model
+    EMBEDDING_DIMENSION: int = 256  # Only used by the hashing provider
+    # Memory search: "vector", "keyword" (BM25 only, no embedding call) or "hybrid" (both, fused with RRF)
+    MEMORY_SEARCH_MODE: str = "hybrid"
+    # Candidates fetched from each ranker per requested result in hybrid mode
+    MEMORY_HYBRID_CANDIDATES: int = 4
+    # Write-behind queue: store_memory acknowledges immediately, a worker embeds and indexes in batches
+    MEMORY_WRITE_BEHIND: bool = True
+    MEMORY_QUEUE_BATCH_SIZE: int = 32
+    MEMORY_QUEUE_POLL_SECONDS: float = 2.0
+    MEMORY_QUEUE_MAX_BACKOFF_SECONDS: int = 300
+    MEMORY_QUEUE_MAX_ATTEMPTS: int = 8  # A memory failing this many times is dead-lettered
+    MEMORY_QUEUE_LEASE_SECONDS: int = 300  # A crashed worker's batch is retried after this
+    # Reminder scheduler: sleeps until the next due reminder, woken up by change notifications on this UDP port
+    SCHEDULER_NOTIFY_HOST: str = "127.0.0.1"
+    SCHEDULER_NOTIFY_PORT: int = 8002
+    SCHEDULER_LOOKAHEAD_SECONDS: int = 3600  # Upcoming reminders kept in memory, reloaded when the window ends
+    # Failed deliveries are retried after SCHEDULER_RETRY_SECONDS, doubling up to SCHEDULER_RETRY_MAX_SECONDS,
+    # and dead-lettered after SCHEDULER_MAX_ATTEMPTS attempts or a permanent error
+    SCHEDULER_RETRY_SECONDS: int = 5
+    SCHEDULER_RETRY_MAX_SECONDS: int = 3600
+    SCHEDULER_MAX_ATTEMPTS: int = 8
+    NOTIFIER_POOL_SIZE: int = 8  # HTTP connections of the scheduler's Telegram client
+    NOTIFIER_GLOBAL_RATE: float = 30.0  # Telegram allows about 30 messages/s per bot
+    NOTIFIER_PER_CHAT_RATE: float = 1.0  # and about 1 message/s per chat
+    SCHEDULER_COMMIT_BATCH: int = 50  # Delivered reminders marked inactive per commit
+    SCHEDULER_CLAIM_BATCH: int = 200  # Due reminders leased by a worker at a time
+    SCHEDULER_LEASE_SECONDS: int = 120  # A crashed worker's reminders are retried after this
+    # A user's reminders due within this many seconds of one that is due are sent with it
+    # as one digest message (users can opt out with /digest off; 0 disables digests)
+    SCHEDULER_DIGEST_WINDOW_SECONDS: int = 60
+    # Inactive reminders due more than REMINDER_ARCHIVE_AFTER_DAYS ago are moved to the archive table
+    # by the scheduler every REMINDER_ARCHIVE_INTERVAL_SECONDS, REMINDER_ARCHIVE_BATCH rows per transaction (0 disables)
+    REMINDER_ARCHIVE_AFTER_DAYS: int = 30
+    REMINDER_ARCHIVE_INTERVAL_SECONDS: int = 3600
+    REMINDER_ARCHIVE_BATCH: int = 1000
+    # Scheduler metrics in the Prometheus text format, rewritten after each dispatch ("" disables).
+    # Give each scheduler process on a host its own file.
+    SCHEDULER_METRICS_FILE: str = "scheduler_metrics.prom"
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding='utf-8')
 
 settings = Settings()
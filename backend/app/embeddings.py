@@ -0,0 +1,161 @@
+import math
+import re
+import zlib
+from .config import settings
+
+# Model used by every collection created before embedding providers were configurable
+LEGACY_EMBEDDING_MODEL = "gemini/text-embedding-004"
+LEGACY_EMBEDDING_DIMENSION = 768
+
+# Output size of the Gemini embedding models, others are measured on their first embedding
+GEMINI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-004": 768,
+    "embedding-001": 768,
+    "gemini-embedding-001": 3072,
+    "gemini-embedding-exp-03-07": 3072,
+}
+
+
+class EmbeddingError(Exception):
+    """Raised when a provider cannot produce embeddings."""
+
+
+class EmbeddingProvider:
+    """
+    Base class for embedding backends.
+
+    Subclasses set `name` (recorded in the collection metadata, so vectors from
+    different models are never compared) and `dimension`, and implement `embed`.
+    """
+    name = None
+    dimension = None
+
+    def embed(self, texts):
+        """Returns one embedding (list of floats) per text. Raises EmbeddingError on failure."""
+        raise NotImplementedError
+
+    def embed_one(self, text):
+        return self.embed([text])[0]
+
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    """Remote embeddings through the Gemini API (one network round trip per call)."""
+
+    def __init__(self, model="text-embedding-004", dimension=None):
+        from google import genai
+
+        self.model = model
+        self.name = f"gemini/{model}"
+        self._dimension = dimension or GEMINI_EMBEDDING_DIMENSIONS.get(model)
+        self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
+
+    @property
+    def dimension(self):
+        """Embedding size of the model, measured with one embedding call if the model is not known."""
+        if self._dimension is None:
+            self.embed(["dimension"])
+        return self._dimension
+
+    def embed(self, texts):
+        try:
+            response = self.client.models.embed_content(model=self.model, contents=list(texts))
+            # Extract numerical values from ContentEmbedding objects
+            vectors = [list(embedding.values) for embedding in response.embeddings]
+        except Exception as e:
+            raise EmbeddingError(f"Gemini embedding failed: {e}") from e
+        if vectors and self._dimension is None:
+            self._dimension = len(vectors[0])
+        return vectors
+
+
+class SentenceTransformerEmbeddingProvider(EmbeddingProvider):
+    """Local CPU embeddings with a small sentence-transformers model (optional dependency)."""
+
+    def __init__(self, model="sentence-transformers/all-MiniLM-L6-v2"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise EmbeddingError(
+                "The 'local' embedding provider requires the sentence-transformers package"
+            ) from e
+
+        self.model = SentenceTransformer(model, device="cpu")
+        self.name = f"local/{model}"
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts):
+        try:
+            vectors = self.model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True)
+            return [vector.tolist() for vector in vectors]
+        except Exception as e:
+            raise EmbeddingError(f"Local embedding failed: {e}") from e
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Dependency-free feature-hashing vectorizer over words and character trigrams.
+
+    It has no semantic understanding, but it is deterministic, instantaneous and
+    good at exact tokens, which makes it suitable for tests and offline setups.
+    """
+
+    _word_re = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, dimension=256):
+        self.dimension = dimension
+        self.name = f"hashing/{dimension}"
+
+    def _features(self, text):
+        for word in self._word_re.findall(text.lower()):
+            yield "w:" + word
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield "c:" + padded[i:i + 3]
+
+    def embed(self, texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimension
+            for feature in self._features(text):
+                digest = zlib.crc32(feature.encode("utf-8"))
+                # Signed hashing keeps collisions unbiased
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                vector[digest % self.dimension] += sign
+            norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+            vectors.append([value / norm for value in vector])
+        return vectors
+
+
+def get_embedding_provider(provider=None, model=None):
+    """Builds the embedding provider configured in settings (or the one given explicitly)."""
+    provider = provider or settings.EMBEDDING_PROVIDER
+    model = model or settings.EMBEDDING_MODEL
+
+    if provider == "gemini":
+        return GeminiEmbeddingProvider(model=model or "text-embedding-004")
+    if provider == "local":
+        return SentenceTransformerEmbeddingProvider(model=model or "sentence-transformers/all-MiniLM-L6-v2")
+    if provider == "hashing":
+        return HashingEmbeddingProvider(dimension=settings.EMBEDDING_DIMENSION)
+    raise ValueError(f"Unknown embedding provider: {provider}")
+
+
+def provider_from_name(name):
+    """Rebuilds the provider recorded on a collection (e.g. "gemini/text-embedding-004", "hashing/256")."""
+    kind, _, model = name.partition("/")
+    if kind == "gemini":
+        return GeminiEmbeddingProvider(model=model)
+    if kind == "local":
+        return SentenceTransformerEmbeddingProvider(model=model)
+    if kind == "hashing":
+        return HashingEmbeddingProvider(dimension=int(model))
+    raise ValueError(f"Unknown embedding model: {name}")
+
+
+def collection_embedding_info(collection_metadata):
+    """Returns (model name, dimension) recorded on a collection, assuming the legacy model when absent."""
+    metadata = collection_metadata or {}
+    return (
+        metadata.get("embedding_model", LEGACY_EMBEDDING_MODEL),
+        metadata.get("embedding_dimension", LEGACY_EMBEDDING_DIMENSION),
+    )
@@ -22,7 +22,16 @@ create_reminder_declaration = types.FunctionDeclaration(
             "text": types.Schema(type=types.Type.STRING, description="The reminder text content."),
             "due_date": types.Schema(
                 type=types.Type.STRING,
-                description="Reminder date and time (ISO 8601 format, e.g. 2024-12-25T10:00:00).",
+                description="Reminder date and time (ISO 8601 format, e.g. 2024-12-25T10:00:00). For a recurring reminder, its first occurrence.",
+            ),
+            "recurrence": types.Schema(
+                type=types.Type.STRING,
+                description=(
+                    "Optional recurrence rule (RRULE subset) for repeating reminders: FREQ=DAILY|WEEKLY|MONTHLY|YEARLY, "
+                    "INTERVAL=n, BYDAY=MO,TU,WE,TH,FR,SA,SU (weekly only), COUNT=n or UNTIL=YYYYMMDD. "
+                    "E.g. every Monday: FREQ=WEEKLY;BYDAY=MO, every other day: FREQ=DAILY;INTERVAL=2. "
+                    "Create ONE reminder with a rule instead of one reminder per occurrence."
+                ),
             ),
         },
         required=["text", "due_date"],
@@ -31,21 +40,59 @@ create_reminder_declaration = types.FunctionDeclaration(
 
 get_reminders_declaration = types.FunctionDeclaration(
     name="get_reminders",
-    description="Retrieve user's reminders.",
+    description=(
+        "Retrieve user's reminders, filtered and sorted. Use the filters to fetch only what is needed, "
+        "e.g. for 'what do I have tomorrow?' pass due_after and due_before bounding tomorrow. "
+        "Reminders delivered long ago are archived, use get_reminder_history for those."
+    ),
     parameters=types.Schema(
         type=types.Type.OBJECT,
         properties={
-            "skip": types.Schema(
-                type=types.Type.INTEGER, description="Number of reminders to skip (for pagination)."
+            "active_only": types.Schema(
+                type=types.Type.BOOLEAN, description="Only reminders that still have to fire (default true)."
+            ),
+            "due_after": types.Schema(
+                type=types.Type.STRING, description="Only reminders due at or after this date and time (ISO 8601)."
+            ),
+            "due_before": types.Schema(
+                type=types.Type.STRING, description="Only reminders due before this date and time (ISO 8601)."
+            ),
+            "text": types.Schema(
+                type=types.Type.STRING, description="Only reminders whose text contains this (case-insensitive)."
+            ),
+            "sort": types.Schema(
+                type=types.Type.STRING,
+                enum=["due_asc", "due_desc", "created_desc"],
+                description="Sort order: soonest due first (default), latest due first, or most recently created first.",
+            ),
+            "after_id": types.Schema(
+                type=types.Type.INTEGER, description="ID of the last reminder of the previous page, to get the next page."
             ),
             "limit": types.Schema(
-                type=types.Type.INTEGER, description="Maximum number of reminders to return."
+                type=types.Type.INTEGER, description="Maximum number of reminders to return (default 20)."
             ),
         },
         required=[],  # No required parameters
     ),
 )
 
+get_reminder_history_declaration = types.FunctionDeclaration(
+    name="get_reminder_history",
+    description="Retrieve the user's archived reminders (delivered or deactivated long ago), most recent first.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "before_id": types.Schema(
+                type=types.Type.INTEGER, description="ID of the last reminder of the previous page, to get the next page."
+            ),
+            "limit": types.Schema(
+                type=types.Type.INTEGER, description="Maximum number of reminders to return."
+            ),
+        },
+        required=[],
+    ),
+)
+
 update_reminder_declaration = types.FunctionDeclaration(
     name="update_reminder",
     description="Update an existing reminder.",
@@ -61,6 +108,10 @@ update_reminder_declaration = types.FunctionDeclaration(
             "is_active": types.Schema(
                 type=types.Type.BOOLEAN, description="New reminder status, True if active, False otherwise."
             ),
+            "recurrence": types.Schema(
+                type=types.Type.STRING,
+                description="New recurrence rule (same format as create_reminder), empty string to stop repeating. Omit to keep the current one.",
+            ),
         },
         required=["reminder_id","text", "due_date", "is_active"],
     ),
@@ -135,7 +186,7 @@ def get_user_id_from_identifier(db, identifier: int | str) -> int:
     
     return user.id if user else None
 
-def create_reminder_tool(user_id: int | str, text: str, due_date: str) -> Dict[str, Any]:
+def create_reminder_tool(user_id: int | str, text: str, due_date: str, recurrence: str | None = None) -> Dict[str, Any]:
     print(f"Creating reminder for user identifier: {user_id}")
     db = SessionLocal()
     try:
@@ -151,9 +202,14 @@ def create_reminder_tool(user_id: int | str, text: str, due_date: str) -> Dict[s
         reminder_data = {
             "user_id": real_user_id,
             "text": text,
-            "due_date": due_date_dt
+            "due_date": due_date_dt,
+            "recurrence": recurrence or None
         }
-        result = reminders.create_reminder(db, schemas.ReminderCreate(**reminder_data))
+        try:
+            reminder = schemas.ReminderCreate(**reminder_data)
+        except ValueError as e:
+            return {"error": f"Invalid recurrence rule: {e}"}
+        result = reminders.create_reminder(db, reminder)
         
         # Create a serializable dictionary instead of using __dict__
         return {
@@ -161,6 +217,7 @@ def create_reminder_tool(user_id: int | str, text: str, due_date: str) -> Dict[s
             "text": result.text,
             "due_date": result.due_date.isoformat(),
             "is_active": result.is_active,
+            "recurrence": result.recurrence,
             "created_at": result.created_at.isoformat(),
             "updated_at": result.updated_at.isoformat() if result.updated_at else None,
             "user_id": result.user_id
@@ -168,7 +225,9 @@ def create_reminder_tool(user_id: int | str, text: str, due_date: str) -> Dict[s
     finally:
         db.close()
 
-def get_reminders_tool(user_id: int | str, skip: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+def get_reminders_tool(user_id: int | str, active_only: bool = True, due_after: str | None = None,
+                       due_before: str | None = None, text: str | None = None, sort: str = "due_asc",
+                       after_id: int | None = None, limit: int = 20, skip: int = 0) -> List[Dict[str, Any]]:
     print(f"Fetching reminders for user identifier: {user_id}")
     db = SessionLocal()
     try:
@@ -176,7 +235,18 @@ def get_reminders_tool(user_id: int | str, skip: int = 0, limit: int = 100) -> L
         if not real_user_id:
             return {"error": "User not found"}
 
-        reminders_list = reminders.get_reminders(db, real_user_id, skip, limit)
+        try:
+            reminders_list = reminders.get_reminders(
+                db, real_user_id, skip, limit,
+                active_only=active_only,
+                due_after=datetime.fromisoformat(due_after) if due_after else None,
+                due_before=datetime.fromisoformat(due_before) if due_before else None,
+                text=text,
+                sort=sort,
+                after_id=after_id
+            )
+        except ValueError as e:
+            return {"error": f"Invalid filter: {e}"}
         # Proper serialization of reminder objects
         serialized_reminders = [
             {
@@ -184,6 +254,7 @@ def get_reminders_tool(user_id: int | str, skip: int = 0, limit: int = 100) -> L
                 "text": reminder.text,
                 "due_date": reminder.due_date.isoformat(),
                 "is_active": reminder.is_active,
+                "recurrence": reminder.recurrence,
                 "created_at": reminder.created_at.isoformat(),
                 "updated_at": reminder.updated_at.isoformat() if reminder.updated_at else None,
                 "user_id": reminder.user_id
@@ -194,7 +265,31 @@ def get_reminders_tool(user_id: int | str, skip: int = 0, limit: int = 100) -> L
     finally:
         db.close()
 
-def update_reminder_tool(reminder_id: int, text: str | None = None, due_date: str | None = None, is_active: bool | None = None, user_id: int | None = None) -> Dict[str, Any]:
+def get_reminder_history_tool(user_id: int | str, before_id: int | None = None, limit: int = 20) -> List[Dict[str, Any]]:
+    print(f"Fetching reminder history for user identifier: {user_id}")
+    db = SessionLocal()
+    try:
+        real_user_id = get_user_id_from_identifier(db, user_id)
+        if not real_user_id:
+            return {"error": "User not found"}
+
+        history = reminders.get_reminder_history(db, real_user_id, before_id, limit)
+        return [
+            {
+                "id": reminder.id,
+                "original_id": reminder.original_id,
+                "text": reminder.text,
+                "due_date": reminder.due_date.isoformat(),
+                "recurrence": reminder.recurrence,
+                "delivery_status": reminder.delivery_status,
+                "archived_at": reminder.archived_at.isoformat() if reminder.archived_at else None
+            }
+            for reminder in history
+        ]
+    finally:
+        db.close()
+
+def update_reminder_tool(reminder_id: int, text: str | None = None, due_date: str | None = None, is_active: bool | None = None, recurrence: str | None = None, user_id: int | None = None) -> Dict[str, Any]:
     print(f"Updating reminder: {reminder_id}")
     db = SessionLocal()
     try:
@@ -209,8 +304,14 @@ def update_reminder_tool(reminder_id: int, text: str | None = None, due_date: st
                 return {"error": "Invalid date format. Use ISO 8601 (YYYY-MM-DDTHH:MM:SS)."}
         if is_active is not None:
             update_data["is_active"] = is_active
+        if recurrence is not None:
+            update_data["recurrence"] = recurrence or None
 
-        result = reminders.update_reminder(db, reminder_id, schemas.ReminderUpdate(**update_data), user_id)
+        try:
+            reminder = schemas.ReminderUpdate(**update_data)
+        except ValueError as e:
+            return {"error": str(e)}
+        result = reminders.update_reminder(db, reminder_id, reminder, user_id)
         
         if result:
             return {
@@ -218,6 +319,7 @@ def update_reminder_tool(reminder_id: int, text: str | None = None, due_date: st
                 "text": result.text,
                 "due_date": result.due_date.isoformat(),
                 "is_active": result.is_active,
+                "recurrence": result.recurrence,
                 "created_at": result.created_at.isoformat(),
                 "updated_at": result.updated_at.isoformat() if result.updated_at else None,
                 "user_id": result.user_id
@@ -239,6 +341,7 @@ def delete_reminder_tool(reminder_id: int, user_id: int | None = None) -> Dict[s
                 "text": result.text,
                 "due_date": result.due_date.isoformat(),
                 "is_active": result.is_active,
+                "recurrence": result.recurrence,
                 "created_at": result.created_at.isoformat(),
                 "updated_at": result.updated_at.isoformat() if result.updated_at else None,
                 "user_id": result.user_id
@@ -90,6 +90,7 @@ class IntentRecognizer:
                 # Reminder tools
                 gemini_tools.create_reminder_declaration,
                 gemini_tools.get_reminders_declaration,
+                gemini_tools.get_reminder_history_declaration,
                 gemini_tools.update_reminder_declaration,
                 gemini_tools.delete_reminder_declaration,
                 
@@ -127,6 +128,7 @@ class IntentRecognizer:
             # Reminder tools
             "create_reminder": gemini_tools.create_reminder_tool,
             "get_reminders": gemini_tools.get_reminders_tool,
+            "get_reminder_history": gemini_tools.get_reminder_history_tool,
             "update_reminder": gemini_tools.update_reminder_tool,
             "delete_reminder": gemini_tools.delete_reminder_tool,
             
@@ -1,5 +1,9 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Body, Request
+import json
+from datetime import datetime
+from fastapi import FastAPI, Depends, HTTPException, status, Body, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from . import reminders, database, schemas, models
 from .database import get_db, SessionLocal
@@ -21,11 +25,25 @@ app.add_middleware(
 @app.on_event("startup")
 def startup_event():
     # Inizializza SQLite
-    models.Base.metadata.create_all(bind=database.engine)
+    from .migrations import upgrade_schema
+    upgrade_schema(database.engine)
     
     # Inizializza esplicitamente ChromaDB
-    from .memory_db import get_memory_db
-    get_memory_db()
+    from .memory_db import warmup_memory_db
+    warmup_memory_db()
+    
+    # Drain memories left in the write-behind queue by a previous run
+    from .memory_queue import start_worker
+    start_worker()
+    
+    # Periodically merge near-duplicate memories
+    from .config import settings
+    if settings.MEMORY_COMPACTION_INTERVAL_HOURS > 0:
+        from apscheduler.schedulers.background import BackgroundScheduler
+        from .memory_compaction import compact_all
+        compaction_scheduler = BackgroundScheduler()
+        compaction_scheduler.add_job(compact_all, "interval", hours=settings.MEMORY_COMPACTION_INTERVAL_HOURS)
+        compaction_scheduler.start()
     
     # Crea le liste predefinite per tutti gli utenti esistenti
     from . import lists
@@ -75,18 +93,43 @@ def read_reminders(
     current_user: models.User = Depends(get_current_user),
     skip: int = 0,
     limit: int = 100,
+    active_only: bool = False,
+    due_after: datetime | None = None,
+    due_before: datetime | None = None,
+    text: str | None = None,
+    sort: str = "due_asc",
+    after_id: int | None = None,
     db: Session = Depends(get_db)
 ):
     # print(f"Reading reminders for user {current_user.id}")
-    reminders_list = reminders.get_reminders(
-        db=db, 
-        user_id=current_user.id,
-        skip=skip, 
-        limit=limit
-    )
+    try:
+        reminders_list = reminders.get_reminders(
+            db=db, 
+            user_id=current_user.id,
+            skip=skip, 
+            limit=limit,
+            active_only=active_only,
+            due_after=due_after,
+            due_before=due_before,
+            text=text,
+            sort=sort,
+            after_id=after_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     # print(f"Found {len(reminders_list)} reminders")
     return reminders_list
 
+@app.get("/reminders/history", response_model=list[schemas.ArchivedReminder])
+def read_reminder_history(
+    current_user: models.User = Depends(get_current_user),
+    before_id: int | None = None,
+    limit: int = 50,
+    db: Session = Depends(get_db)
+):
+    """Archived reminders, most recent first. Pass the last ID of a page as before_id to get the next one."""
+    return reminders.get_reminder_history(db=db, user_id=current_user.id, before_id=before_id, limit=limit)
+
 @app.get("/reminders/{reminder_id}", response_model=schemas.Reminder)
 def read_reminder(
     reminder_id: int,
@@ -134,6 +177,87 @@ def delete_reminder(
         raise HTTPException(status_code=404, detail="Reminder not found")
     return db_reminder
 
+@app.get("/memories")
+def stream_memories(
+    current_user: models.User = Depends(get_current_user),
+    category: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    page_size: int = Query(200, ge=1, le=1000)
+):
+    """Streams all of the user's memories as NDJSON, reading them page by page."""
+    from .memory_db import memory_db
+    
+    def generate():
+        for memory in memory_db.iter_user_memories(
+            user_id=current_user.id,
+            page_size=page_size,
+            created_after=created_after,
+            created_before=created_before,
+            category=category
+        ):
+            yield json.dumps(memory, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.get("/metrics/scheduler", response_class=PlainTextResponse)
+def read_scheduler_metrics():
+    """Latest metrics written by the scheduler process, in the Prometheus text format."""
+    from .config import settings
+    try:
+        with open(settings.SCHEDULER_METRICS_FILE, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        raise HTTPException(status_code=404, detail="No scheduler metrics available")
+
+@app.get("/export")
+def export_data(
+    current_user: models.User = Depends(get_current_user),
+    include_embeddings: bool = False
+):
+    """Streams the user's reminders, lists and memories as an NDJSON archive."""
+    from .user_data import export_user_data
+    
+    def generate():
+        # The request session is closed once the response starts, the stream needs its own
+        with SessionLocal() as db:
+            for record in export_user_data(db, current_user.id, include_embeddings=include_embeddings):
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=memogenius-export.ndjson"}
+    )
+
+@app.post("/import")
+async def import_data(
+    request: Request,
+    current_user: models.User = Depends(get_current_user)
+):
+    """Imports an NDJSON archive produced by /export, reading the request body as a stream."""
+    from .user_data import UserDataImporter
+    from .embeddings import EmbeddingError
+    
+    with SessionLocal() as db:
+        importer = await run_in_threadpool(UserDataImporter, db, current_user.id)
+        buffer = b""
+        try:
+            async for chunk in request.stream():
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                if lines:
+                    # Database and embedding calls block, keep them off the event loop
+                    await run_in_threadpool(importer.feed_lines, [line.decode("utf-8") for line in lines])
+            await run_in_threadpool(importer.feed_lines, [buffer.decode("utf-8")])
+            counts = await run_in_threadpool(importer.close)
+        except (ValueError, KeyError, TypeError) as e:
+            # Batches written before the error stay imported, importing the archive again completes it
+            raise HTTPException(status_code=400, detail={"message": f"Invalid archive: {e}", "imported": importer.counts})
+        except EmbeddingError as e:
+            raise HTTPException(status_code=503, detail={"message": str(e), "imported": importer.counts})
+    return {"status": "success", "imported": counts}
+
 @app.post("/alexa/intent")
 async def handle_alexa_intent(request: Request):
     data = await request.json()
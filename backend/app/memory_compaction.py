@@ -0,0 +1,98 @@
+"""
+Periodic compaction of near-duplicate memories.
+
+Each user's memories are visited from the most recently updated. A visited
+memory is kept, and the older memories with the same words found within
+`max_distance` of it by MemoryDB.nearest_memories are deleted. Memories are only ever compared with
+the memory they are merged into, so a chain of small differences (A close to
+B, B close to C) never merges A and C.
+
+Usage (from the backend directory):
+    python -m app.memory_compaction [--max-distance 0.05] [--dry-run]
+"""
+import argparse
+import time
+from .config import settings
+from .database import SessionLocal
+from . import models
+from .memory_index import same_words
+
+
+def compact_user_memories(memory_db, user_id, max_distance, neighbours=5, dry_run=False):
+    """
+    Merges the near-duplicate memories of one user into the most recently updated one.
+
+    Returns:
+        (memories before, memories removed)
+    """
+    updated = {}
+    total = 0
+    for memory in memory_db.iter_user_memories(user_id):
+        total += 1
+        # Chunks of a document overlap on purpose and are left alone
+        if "parent_id" not in (memory["metadata"] or {}):
+            updated[memory["id"]] = (memory["metadata"] or {}).get("updated_ts", 0)
+
+    # The most recently updated memory is the one the user stated last
+    kept, removed = set(), set()
+    for memory_id in sorted(updated, key=lambda memory_id: updated[memory_id], reverse=True):
+        if memory_id in removed:
+            continue
+        kept.add(memory_id)
+        # One nearest-neighbour query per kept memory keeps the work O(n log n) instead of comparing all pairs
+        memory = memory_db.get_memory(memory_id, user_id, include_embedding=True)
+        if not memory or not memory.get("embedding"):
+            continue
+        result = memory_db.nearest_memories(user_id, [memory["embedding"]], neighbours)
+        for other_id, distance, document in zip(result["ids"][0], result["distances"][0], result["documents"][0]):
+            if other_id not in updated or other_id in kept or other_id in removed or distance > max_distance:
+                continue
+            # Close but distinct facts ("dentist on Monday" / "on Tuesday") are both kept
+            if not same_words(document, memory["content"]):
+                continue
+            if dry_run or memory_db.delete_memory(other_id, user_id=user_id):
+                removed.add(other_id)
+    return total, len(removed)
+
+
+def compact_all(max_distance=None, dry_run=False):
+    """Compacts the memories of every user and prints how much smaller the index got."""
+    from .memory_db import get_memory_db
+
+    max_distance = max_distance if max_distance is not None else settings.MEMORY_DEDUP_DISTANCE
+    memory_db = get_memory_db()
+
+    db = SessionLocal()
+    try:
+        user_ids = [user_id for (user_id,) in db.query(models.User.id).all()]
+    finally:
+        db.close()
+
+    started = time.monotonic()
+    before = removed = 0
+    for user_id in user_ids:
+        user_total, user_removed = compact_user_memories(memory_db, user_id, max_distance, dry_run=dry_run)
+        before += user_total
+        removed += user_removed
+
+    reduction = removed / before * 100 if before else 0.0
+    print(
+        f"Memory compaction{' (dry run)' if dry_run else ''}: {before} -> {before - removed} memories "
+        f"({removed} duplicates merged, {reduction:.1f}% smaller) in {time.monotonic() - started:.1f}s"
+    )
+    return {"before": before, "removed": removed, "reduction_percent": reduction}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-distance", type=float, default=None, help="Cosine distance under which memories are duplicates")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be merged")
+    args = parser.parse_args()
+    # The memory store's bookkeeping tables are created by the schema upgrade
+    from .migrations import upgrade_schema
+    upgrade_schema()
+    compact_all(max_distance=args.max_distance, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
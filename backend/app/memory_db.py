@@ -1,56 +1,274 @@
+import base64
+import fcntl
+import functools
+import heapq
 import os
-import chromadb
-from chromadb.config import Settings
-from google import genai
 from .config import settings
+from .embeddings import get_embedding_provider, provider_from_name, collection_embedding_info, EmbeddingError
+from .memory_index import KeywordIndex, reciprocal_rank_fusion, RRF_K, same_words
+from .memory_facets import normalize_category, adjust_category_counts
+from .memory_versions import get_user_version, bump_user_version
 import json
 import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 
+# Name of the collection used before versioned collections existed
+DEFAULT_COLLECTION = "user_memories"
+
+# Largest page read from Chroma at once by the paginated readers
+MAX_PAGE_SIZE = 1000
+
+# What Chroma stores instead of the vector when a quantized store holds the vectors
+PLACEHOLDER_EMBEDDING = [1.0]
+
+# Writes wait at most this long for a migration cutover; an older barrier is left over from a crash
+WRITE_BARRIER_TIMEOUT = 120
+
+# A Chroma server query racing with another process's write can fail with "Error finding id"; retried
+QUERY_RETRIES = 3
+
 # Global variable for singleton instance
 _memory_db = None
 # Lock for thread-safe initialization
 _init_lock = threading.Lock()
 
+def _memory_write(method):
+    """Makes a MemoryDB writer wait for a write barrier, then hold the write lock while it runs."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        wait_for_write_barrier()
+        with write_lock():
+            return method(*args, **kwargs)
+    return wrapper
+
 class MemoryDB:
     def __init__(self):
-        """Initializes ChromaDB and the Gemini client for embeddings."""        
+        """Initializes ChromaDB and the embedding provider."""
+        # Imported here so that processes which never touch memories don't pay for chromadb
+        import chromadb
+        from chromadb.config import Settings
+        
         # Make sure the directory exists
         os.makedirs(settings.CUSTOM_RAG_PATH, exist_ok=True)
         
         # Initialize the ChromaDB client
-        self.client = chromadb.PersistentClient(
-            path=settings.CUSTOM_RAG_PATH,
-            settings=Settings(allow_reset=True)
-        )
+        if settings.CHROMA_MODE == "http":
+            # One shared server per host: a single HNSW index in memory and no SQLite lock contention
+            self.client = self._connect_http_client(chromadb, Settings)
+        else:
+            self.client = chromadb.PersistentClient(
+                path=settings.CUSTOM_RAG_PATH,
+                settings=Settings(allow_reset=True)
+            )
         
-        # Initialize the Gemini client for embeddings
-        self.gemini_client = genai.Client(api_key=settings.GEMINI_API_KEY)
+        # Open the active (possibly migrated) collection and its embedding provider
+        self._active_pointer_mtime = None
+        self._open_active_collection()
         
-        # Create or get the collection
+        # Per-user BM25 index, loaded lazily from the collection and reloaded after other processes' writes
+        self.keyword_index = KeywordIndex(loader=self._load_user_documents, version=get_user_version)
+    
+    @staticmethod
+    def _connect_http_client(chromadb, Settings):
+        """Connects to the shared Chroma server, waiting for it to come up."""
+        deadline = time.monotonic() + settings.CHROMA_CONNECT_TIMEOUT
+        while True:
+            try:
+                client = chromadb.HttpClient(
+                    host=settings.CHROMA_HOST,
+                    port=settings.CHROMA_PORT,
+                    settings=Settings(allow_reset=True)
+                )
+                client.heartbeat()
+                return client
+            except Exception as e:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(
+                        f"Chroma server not reachable at {settings.CHROMA_HOST}:{settings.CHROMA_PORT}: {e}"
+                    ) from e
+                time.sleep(0.5)
+    
+    @property
+    def collection(self):
+        """The active collection, reopened when a migration cutover switched it in any process."""
+        if self._pointer_mtime() != self._active_pointer_mtime:
+            self._open_active_collection()
+        return self._collection
+    
+    def _pointer_mtime(self):
         try:
-            self.collection = self.client.get_collection("user_memories")
-        except:
-            print("Creating new 'user_memories' collection for RAG")
-            self.collection = self.client.create_collection(
-                name="user_memories",
-                metadata={"hnsw:space": "cosine"}
+            return os.stat(active_collection_pointer_path()).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def _open_active_collection(self):
+        """Opens the collection named by the active pointer and the embedding provider it was built with."""
+        self._active_pointer_mtime = self._pointer_mtime()
+        name = get_active_collection_name()
+        
+        embedder = None
+        try:
+            collection = self.client.get_collection(name)
+        except Exception:
+            # Only the default collection is created on the fly, migrated ones must exist
+            if name != DEFAULT_COLLECTION:
+                raise
+            embedder = get_embedding_provider()
+            print(f"Creating new '{name}' collection for RAG")
+            # Another process may be creating it at the same time
+            collection = self.client.get_or_create_collection(
+                name=name,
+                metadata=collection_metadata(embedder)
             )
+        
+        apply_search_ef(collection)
+        
+        # Vectors must always be compared with the model that produced them
+        model, dimension = collection_embedding_info(collection.metadata)
+        if embedder is None:
+            embedder = provider_from_name(model)
+        if not model.startswith(settings.EMBEDDING_PROVIDER + "/"):
+            print(f"Collection '{name}' uses {model}, not the configured '{settings.EMBEDDING_PROVIDER}' "
+                  "provider: run `python -m app.memory_migration` to re-embed it")
+        
+        # Vectors are in Chroma, or in a quantized store when the collection was created with one
+        storage = vector_storage(collection)
+        if storage != settings.MEMORY_QUANTIZATION:
+            print(f"Collection '{name}' stores vectors as '{storage or 'chroma'}', not MEMORY_QUANTIZATION="
+                  f"'{settings.MEMORY_QUANTIZATION}': run `python -m app.memory_migration` to convert it")
+        
+        self._collection = collection
+        self.embedder = embedder
+        self.vector_index = open_vector_store(collection.name, dimension or embedder.dimension, storage) if storage else None
+        # Partition handles belong to the previous active collection
+        self._partitions = OrderedDict()
+        self._partitions_lock = threading.Lock()
+        if hasattr(self, "keyword_index"):
+            self.keyword_index.invalidate()
+    
+    def partition_name(self, user_id, strategy=None):
+        """Name of the collection holding a user's memories, or None for the shared collection."""
+        strategy = strategy or settings.MEMORY_PARTITIONING
+        if strategy == "user":
+            return f"{self._collection.name}_u{user_id}"
+        if strategy == "bucket":
+            bucket = zlib.crc32(str(user_id).encode("utf-8")) % settings.MEMORY_PARTITION_BUCKETS
+            return f"{self._collection.name}_b{bucket:03d}"
+        return None
+    
+    def collection_for(self, user_id, strategy=None):
+        """
+        Returns the collection holding a user's memories.
+        
+        Partition collections are opened lazily and kept in an LRU-bounded cache of handles.
+        """
+        base = self.collection  # Also picks up a cutover to another active collection
+        name = self.partition_name(user_id, strategy) if user_id else None
+        if name is None:
+            return base
+        
+        with self._partitions_lock:
+            collection = self._partitions.get(name)
+            if collection is not None:
+                self._partitions.move_to_end(name)
+                return collection
+            
+            collection = self.client.get_or_create_collection(
+                name=name,
+                metadata=collection_metadata(self.embedder, partition_of=base.name)
+            )
+            apply_search_ef(collection)
+            self._partitions[name] = collection
+            if len(self._partitions) > settings.MEMORY_PARTITION_CACHE_SIZE:
+                self._partitions.popitem(last=False)
+            return collection
+    
+    @staticmethod
+    def user_from_memory_id(memory_id):
+        """Extracts the owner encoded in a memory ID by make_memory_id, if any."""
+        parts = memory_id.split("_", 2)
+        if len(parts) == 3 and parts[0] == "memory" and parts[1] not in ("", "None"):
+            return parts[1]
+        return None
+    
+    @staticmethod
+    def _chroma_where(where_condition):
+        """Converts a flat filter dict into a Chroma where clause."""
+        if not where_condition:
+            return None
+        where_condition = dict(where_condition)
+        if settings.MEMORY_PARTITIONING == "user":
+            # The partition already contains only this user's memories
+            where_condition.pop("user_id", None)
+        if not where_condition:
+            return None
+        # Chroma's where only accepts one key (and one operator per key) unless combined with $and
+        clauses = []
+        for key, value in where_condition.items():
+            if isinstance(value, dict):
+                clauses.extend({key: {operator: operand}} for operator, operand in value.items())
+            else:
+                clauses.append({key: value})
+        if len(clauses) > 1:
+            return {"$and": clauses}
+        return clauses[0]
+    
+    def _load_user_documents(self, user_id):
+        """Yields (memory_id, document) pairs of a user, used to build the keyword index."""
+        results = self.collection_for(user_id).get(
+            where=self._chroma_where({"user_id": str(user_id)}),
+            include=["documents"]
+        )
+        return zip(results["ids"] or [], results["documents"] or [])
+    
+    def _chroma_embeddings(self, embeddings):
+        """What Chroma stores for these vectors: themselves, or placeholders when the quantized store holds them."""
+        if self.vector_index is None:
+            return embeddings
+        return [PLACEHOLDER_EMBEDDING] * len(embeddings)
     
     def create_embedding(self, content):
-        """Creates an embedding for the provided content using Gemini."""
+        """Creates an embedding for the provided content using the configured provider."""
         try:
-            response = self.gemini_client.models.embed_content(
-                model='text-embedding-004',
-                contents=[content]
-            )
-            # Extract numerical values from ContentEmbedding object
-            return response.embeddings[0].values
-        except Exception as e:
-            print(f"Error creating embedding: {e}")
+            return self.embedder.embed_one(content)
+        except EmbeddingError as e:
+            print(f"Error creating embedding with {self.embedder.name}: {e}")
             # Return an empty embedding in case of error
             return []
     
+    def create_embeddings(self, contents):
+        """Creates embeddings for several contents in a single provider call."""
+        try:
+            return self.embedder.embed(contents)
+        except EmbeddingError as e:
+            print(f"Error creating embeddings with {self.embedder.name}: {e}")
+            return []
+    
+    @staticmethod
+    def make_memory_id(content, user_id=None):
+        """Builds the ID of a new memory."""
+        return f"memory_{user_id}_{hash(content)}"
+    
+    @staticmethod
+    def _prepare_metadata(metadata, user_id):
+        # Prepare metadata
+        if metadata is None:
+            metadata = {}
+            
+        # Add timestamps if not already present
+        if "created_at" not in metadata:
+            metadata["created_at"] = datetime.now().isoformat()
+        if "updated_at" not in metadata:
+            metadata["updated_at"] = datetime.now().isoformat()
+            
+        if user_id:
+            metadata["user_id"] = str(user_id)
+        return with_filter_fields(metadata)
+    
     def add_memory(self, content, metadata=None, user_id=None):
         """
         Adds a new memory to the database.
@@ -64,41 +282,168 @@ class MemoryDB:
             memory_id: The ID of the saved memory or None in case of error
         """
         try:
-            # Create an ID for the memory
-            memory_id = f"memory_{user_id}_{hash(content)}"
+            return self.add_memories([{
+                "id": self.make_memory_id(content, user_id),
+                "content": content,
+                "metadata": metadata,
+                "user_id": user_id
+            }])[0]
+        except Exception as e:
+            print(f"Error adding memory: {e}")
+            return None
+    
+    @_memory_write
+    def add_memories(self, memories):
+        """
+        Adds several memories with a single embedding call and a single collection write.
+        
+        Args:
+            memories: List of dicts with "content" and optional "id", "metadata", "user_id"
+                      and "embedding" (reused as is, it must come from the collection's model)
+        
+        Returns:
+            List of the saved memory IDs
+        
+        Raises:
+            EmbeddingError or Chroma errors, so callers can retry the whole batch
+        """
+        if not memories:
+            return []
+        
+        ids, documents, metadatas = [], [], []
+        for memory in memories:
+            user_id = memory.get("user_id")
+            ids.append(memory.get("id") or self.make_memory_id(memory["content"], user_id))
+            documents.append(memory["content"])
+            metadatas.append(self._prepare_metadata(memory.get("metadata"), user_id))
+        
+        # Create the embeddings that were not provided
+        embeddings = [memory.get("embedding") for memory in memories]
+        missing = [i for i, embedding in enumerate(embeddings) if not embedding]
+        if missing:
+            for i, embedding in zip(missing, self.embedder.embed([documents[i] for i in missing])):
+                embeddings[i] = embedding
+        
+        # Group the writes by target collection (a single group unless memories are partitioned)
+        groups = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(metadata.get("user_id"), []).append(i)
+        
+        category_deltas = {}
+        versions = {}
+        for user_id, indexes in groups.items():
+            collection = self.collection_for(user_id)
             
-            # Create the embedding
-            embedding = self.create_embedding(content)
-            if not embedding:
-                return None
+            # Chunks of a document overlap on purpose and are never merged
+            standalone = [i for i in indexes if "parent_id" not in metadatas[i]]
+            if standalone and user_id and settings.MEMORY_DEDUP_DISTANCE > 0:
+                self._merge_near_duplicates(collection, user_id, standalone, ids, documents, embeddings, metadatas)
             
-            # Prepare metadata
-            if metadata is None:
-                metadata = {}
-                
-            # Add timestamps if not already present
-            if "created_at" not in metadata:
-                metadata["created_at"] = datetime.now().isoformat()
-            if "updated_at" not in metadata:
-                metadata["updated_at"] = datetime.now().isoformat()
-                
-            if user_id:
-                metadata["user_id"] = str(user_id)
+            # The same ID twice in one upsert is rejected by Chroma: the last write wins
+            indexes = list({ids[i]: i for i in indexes}.values())
             
-            # Add to collection
-            self.collection.add(
-                ids=[memory_id],
-                embeddings=[embedding],
-                documents=[content],
-                metadatas=[metadata]
-            )
+            # Overwritten memories (e.g. a retried batch) must not be counted twice in the facets
+            previous = collection.get(ids=[ids[i] for i in indexes], include=["metadatas"])
+            for metadata in previous["metadatas"] or []:
+                if metadata and metadata.get("user_id"):
+                    key = (metadata["user_id"], metadata.get("category_key") or normalize_category(metadata.get("category")))
+                    category_deltas[key] = category_deltas.get(key, 0) - 1
+            for i in indexes:
+                if metadatas[i].get("user_id"):
+                    key = (metadatas[i]["user_id"], metadatas[i]["category_key"])
+                    category_deltas[key] = category_deltas.get(key, 0) + 1
             
-            return memory_id
+            # Upsert so that retried batches do not fail on already written IDs
+            collection.upsert(
+                ids=[ids[i] for i in indexes],
+                embeddings=self._chroma_embeddings([embeddings[i] for i in indexes]),
+                documents=[documents[i] for i in indexes],
+                metadatas=[metadatas[i] for i in indexes]
+            )
+            if self.vector_index is not None:
+                self.vector_index.add(user_id, [ids[i] for i in indexes], [embeddings[i] for i in indexes])
+            if user_id:
+                versions[user_id] = bump_user_version(user_id)
+        
+        for memory_id, document, metadata in zip(ids, documents, metadatas):
+            if metadata.get("user_id"):
+                self.keyword_index.add(metadata["user_id"], memory_id, document, versions.get(metadata["user_id"]))
+        
+        adjust_category_counts(category_deltas)
+        return ids
+    
+    def _merge_near_duplicates(self, collection, user_id, indexes, ids, documents, embeddings, metadatas):
+        """
+        Points new memories that nearly duplicate an existing one at that memory's ID,
+        so the write updates it instead of inserting another copy.
+        
+        Close vectors are not enough: "dentist on Monday" and "dentist on Tuesday" are
+        close but distinct facts, so the texts must also have the same words.
+        """
+        try:
+            neighbours = self.nearest_memories(user_id, [embeddings[i] for i in indexes], 1)
         except Exception as e:
-            print(f"Error adding memory: {e}")
-            return None
+            # Deduplication is best effort, never block the write
+            print(f"Error checking near-duplicate memories: {e}")
+            return
+        
+        for position, i in enumerate(indexes):
+            if not neighbours["ids"][position]:
+                continue
+            distance = neighbours["distances"][position][0]
+            if distance > settings.MEMORY_DEDUP_DISTANCE:
+                continue
+            if not same_words(neighbours["documents"][position][0], documents[i]):
+                continue
+            existing_metadata = neighbours["metadatas"][position][0] or {}
+            if "parent_id" in existing_metadata:
+                continue
+            print(f"Memory '{ids[i]}' nearly duplicates '{neighbours['ids'][position][0]}' (distance {distance:.3f}), updating it")
+            ids[i] = neighbours["ids"][position][0]
+            # New values win, fields the new memory doesn't set are kept
+            merged = dict(existing_metadata)
+            merged.update(metadatas[i])
+            if not metadatas[i].get("category") and existing_metadata.get("category"):
+                merged["category"] = existing_metadata["category"]
+                merged["category_key"] = normalize_category(existing_metadata["category"])
+            # Keep the original creation time of the updated memory
+            for key in ("created_at", "created_ts"):
+                if key in existing_metadata:
+                    merged[key] = existing_metadata[key]
+            metadatas[i] = merged
     
-    def search_memory(self, query, user_id=None, limit=3, where_condition=None):
+    def nearest_memories(self, user_id, embeddings, n_results):
+        """
+        Finds each embedding's nearest memories of a user.
+        
+        Returns:
+            Dict shaped like a Chroma query result: ids, distances, documents and
+            metadatas, one list per embedding
+        """
+        if self.vector_index is None:
+            return query_collection(
+                self.collection_for(user_id),
+                query_embeddings=embeddings,
+                n_results=n_results,
+                where=self._chroma_where({"user_id": str(user_id)}),
+                include=["distances", "documents", "metadatas"]
+            )
+        
+        response = {"ids": [], "distances": [], "documents": [], "metadatas": []}
+        for embedding in embeddings:
+            hits = self.vector_index.search(
+                user_id, embedding, n_results, candidates=n_results * settings.MEMORY_RESCORE_CANDIDATES
+            )
+            found = self._fetch_memories([memory_id for memory_id, _ in hits], {"user_id": str(user_id)}, user_id)
+            hits = [(memory_id, similarity) for memory_id, similarity in hits if memory_id in found]
+            response["ids"].append([memory_id for memory_id, _ in hits])
+            response["distances"].append([1.0 - similarity for _, similarity in hits])
+            response["documents"].append([found[memory_id][0] for memory_id, _ in hits])
+            response["metadatas"].append([found[memory_id][1] for memory_id, _ in hits])
+        return response
+    
+    def search_memory(self, query, user_id=None, limit=3, where_condition=None, mode=None,
+                      created_after=None, created_before=None, category=None):
         """
         Searches for memories similar to the query.
         
@@ -107,16 +452,17 @@ class MemoryDB:
             user_id: User ID (optional)
             limit: Maximum number of results
             where_condition: Additional filtering conditions (optional)
+            mode: "vector", "keyword" or "hybrid" (defaults to settings.MEMORY_SEARCH_MODE).
+                  Keyword and hybrid modes need a user_id, otherwise vector search is used.
+            created_after: Only memories created at or after this datetime (optional)
+            created_before: Only memories created at or before this datetime (optional)
+            category: Only memories of this category, normalized before matching (optional)
             
         Returns:
-            Dict with IDs, documents and distances
+            Dict with IDs, documents, distances and metadata
         """
+        empty = {"ids": [], "documents": [], "distances": [], "metadatas": []}
         try:
-            # Create the embedding for the query
-            query_embedding = self.create_embedding(query)
-            if not query_embedding:
-                return {"ids": [], "documents": [], "distances": []}
-            
             # Prepare filter conditions
             if where_condition is None:
                 where_condition = {}
@@ -124,44 +470,247 @@ class MemoryDB:
             if user_id and "user_id" not in where_condition:
                 where_condition["user_id"] = str(user_id)
             
-            # Search in the collection
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=limit,
-                where=where_condition if where_condition else None
-            )
+            where_condition.update(filter_conditions(created_after, created_before, category))
             
-            return {
-                "ids": results["ids"][0] if results["ids"] else [],
-                "documents": results["documents"][0] if results["documents"] else [],
-                "distances": results["distances"][0] if results["distances"] else [],
-                "metadatas": results["metadatas"][0] if "metadatas" in results and results["metadatas"] else []
-            }
+            mode = mode or settings.MEMORY_SEARCH_MODE
+            if not user_id:
+                mode = "vector"
+            
+            if mode == "keyword":
+                return self._keyword_search(query, user_id, limit, where_condition)
+            
+            if mode == "hybrid":
+                return self._hybrid_search(query, user_id, limit, where_condition)
+            
+            return self._vector_search(query, limit, where_condition, user_id) or empty
         except Exception as e:
             print(f"Error searching memory: {e}")
-            return {"ids": [], "documents": [], "distances": [], "metadatas": []}
+            return empty
     
-    def get_memory(self, memory_id):
-        """Gets a specific memory by ID."""
+    def _vector_search(self, query, limit, where_condition, user_id=None, query_embedding=None):
+        """Runs an embedding similarity search. Returns None if the embedding could not be created."""
+        # Create the embedding for the query
+        query_embedding = query_embedding or self.create_embedding(query)
+        if not query_embedding:
+            return None
+        
+        if self.vector_index is not None:
+            return self._quantized_search(query_embedding, limit, where_condition, user_id)
+        
+        # Search in the collection
+        results = query_collection(
+            self.collection_for(user_id),
+            query_embeddings=[query_embedding],
+            n_results=limit,
+            where=self._chroma_where(where_condition)
+        )
+        
+        return {
+            "ids": results["ids"][0] if results["ids"] else [],
+            "documents": results["documents"][0] if results["documents"] else [],
+            "distances": results["distances"][0] if results["distances"] else [],
+            "metadatas": results["metadatas"][0] if "metadatas" in results and results["metadatas"] else []
+        }
+    
+    def _quantized_search(self, query_embedding, limit, where_condition, user_id):
+        """
+        Exact search over the user's compressed vectors, with the best candidates
+        rescored from the full-precision vectors on disk.
+        
+        When filters drop too many candidates, every memory matching them in Chroma
+        is scored instead, so selective filters still return up to `limit` results.
+        """
+        filtered = set(where_condition) > {"user_id"}
+        # Filters are applied on the candidates, leave room for the ones they drop
+        wanted = limit * settings.MEMORY_HYBRID_CANDIDATES if filtered else limit
+        hits = self.vector_index.search(
+            user_id, query_embedding, wanted, candidates=wanted * settings.MEMORY_RESCORE_CANDIDATES
+        )
+        found = self._fetch_memories([memory_id for memory_id, _ in hits], where_condition, user_id)
+        hits = [(memory_id, similarity) for memory_id, similarity in hits if memory_id in found]
+        
+        if filtered and len(hits) < limit:
+            matching = self.collection_for(user_id).get(where=self._chroma_where(where_condition), include=[])
+            hits = self.vector_index.score(user_id, query_embedding, matching["ids"])[:limit]
+            found = self._fetch_memories([memory_id for memory_id, _ in hits], where_condition, user_id)
+        
+        response = {"ids": [], "documents": [], "distances": [], "metadatas": []}
+        for memory_id, similarity in hits[:limit]:
+            document, metadata = found[memory_id]
+            response["ids"].append(memory_id)
+            response["documents"].append(document)
+            response["distances"].append(1.0 - similarity)
+            response["metadatas"].append(metadata)
+        return response
+    
+    def _vector_distances(self, query_embedding, memory_ids, user_id=None):
+        """Cosine distances from the query to the given memories, as {memory_id: distance}."""
+        if not memory_ids:
+            return {}
+        if self.vector_index is not None:
+            return {
+                memory_id: 1.0 - similarity
+                for memory_id, similarity in self.vector_index.score(user_id, query_embedding, memory_ids)
+            }
+        import numpy as np
+        
+        results = self.collection_for(user_id).get(ids=list(memory_ids), include=["embeddings"])
+        query = np.asarray(query_embedding, dtype=np.float32)
+        distances = {}
+        for memory_id, embedding in zip(results["ids"], results["embeddings"]):
+            vector = np.asarray(embedding, dtype=np.float32)
+            norms = float(np.linalg.norm(query) * np.linalg.norm(vector)) or 1.0
+            distances[memory_id] = 1.0 - float(query @ vector) / norms
+        return distances
+    
+    def _fetch_memories(self, memory_ids, where_condition, user_id=None):
+        """Gets documents and metadata for a list of IDs, keeping only those matching the filter."""
+        if not memory_ids:
+            return {}
+        
+        results = self.collection_for(user_id).get(
+            ids=list(memory_ids),
+            where=self._chroma_where(where_condition)
+        )
+        return {
+            memory_id: (document, metadata)
+            for memory_id, document, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+        }
+    
+    def _keyword_search(self, query, user_id, limit, where_condition):
+        """BM25 search over the user's keyword index, without any embedding call."""
+        # Filters other than the owner are applied after ranking, so over-fetch candidates
+        candidates = limit if set(where_condition) <= {"user_id"} else limit * settings.MEMORY_HYBRID_CANDIDATES
+        hits = self.keyword_index.search(user_id, query, limit=candidates)
+        found = self._fetch_memories([memory_id for memory_id, _ in hits], where_condition, user_id)
+        
+        response = {"ids": [], "documents": [], "distances": [], "metadatas": []}
+        for memory_id, score in hits:
+            if memory_id not in found:
+                continue
+            document, metadata = found[memory_id]
+            response["ids"].append(memory_id)
+            response["documents"].append(document)
+            # Map the unbounded BM25 score to a distance-like value (lower is better)
+            response["distances"].append(1.0 / (1.0 + score))
+            response["metadatas"].append(metadata)
+            if len(response["ids"]) == limit:
+                break
+        return response
+    
+    def _hybrid_search(self, query, user_id, limit, where_condition):
+        """
+        Fuses vector and BM25 rankings with reciprocal rank fusion.
+        
+        Results are in fused order, but their distances are the vector distances to
+        the query, so callers comparing distances still compare semantic closeness.
+        """
+        candidates = max(limit * settings.MEMORY_HYBRID_CANDIDATES, 10)
+        
+        query_embedding = self.create_embedding(query)
+        if not query_embedding:
+            # Embedding service unavailable: keyword results are still useful
+            return self._keyword_search(query, user_id, limit, where_condition)
+        vector_results = self._vector_search(query, candidates, where_condition, user_id, query_embedding)
+        
+        keyword_hits = self.keyword_index.search(user_id, query, limit=candidates)
+        rankings = [vector_results["ids"], [memory_id for memory_id, _ in keyword_hits]]
+        fused = reciprocal_rank_fusion(rankings, k=RRF_K)[:limit]
+        
+        # Documents of the vector results are already known, fetch only the keyword-only hits
+        known = {
+            memory_id: (document, metadata)
+            for memory_id, document, metadata in zip(
+                vector_results["ids"], vector_results["documents"], vector_results["metadatas"]
+            )
+        }
+        missing = [memory_id for memory_id, _ in fused if memory_id not in known]
+        known.update(self._fetch_memories(missing, where_condition, user_id))
+        
+        # Keyword-only hits were not among the vector candidates, measure them too
+        distances = dict(zip(vector_results["ids"], vector_results["distances"]))
+        distances.update(self._vector_distances(query_embedding, [memory_id for memory_id in missing if memory_id in known], user_id))
+        
+        response = {"ids": [], "documents": [], "distances": [], "metadatas": []}
+        for memory_id, _ in fused:
+            if memory_id not in known:
+                continue
+            document, metadata = known[memory_id]
+            response["ids"].append(memory_id)
+            response["documents"].append(document)
+            response["distances"].append(distances.get(memory_id, 1.0))
+            response["metadatas"].append(metadata)
+        return response
+    
+    def get_memory(self, memory_id, user_id=None, include_embedding=False):
+        """
+        Gets a specific memory by ID (the owner, if known, selects the partition to read).
+        
+        The embedding is only read from the index when include_embedding is True.
+        """
         try:
-            result = self.collection.get(ids=[memory_id])
-            print("Result get_memory:", result)
+            owner = user_id or self.user_from_memory_id(memory_id)
+            from_chroma = include_embedding and self.vector_index is None
+            include = ["documents", "metadatas"] + (["embeddings"] if from_chroma else [])
+            result = self.collection_for(owner).get(ids=[memory_id], include=include)
             if result["ids"]:
-                # Gestisci correttamente il caso in cui embeddings è None
-                embeddings_value = result.get("embeddings", None)
-                embedding = embeddings_value[0] if embeddings_value is not None else []
-                
-                return {
+                memory = {
                     "id": result["ids"][0],
                     "content": result["documents"][0],
-                    "metadata": result["metadatas"][0],
-                    "embedding": embedding
+                    "metadata": result["metadatas"][0]
                 }
+                if from_chroma:
+                    memory["embedding"] = [float(value) for value in result["embeddings"][0]]
+                elif include_embedding:
+                    vectors = self.vector_index.get((memory["metadata"] or {}).get("user_id"), [memory_id])
+                    memory["embedding"] = vectors.get(memory_id)
+                return memory
             return None
         except Exception as e:
             print(f"Error getting memory: {e}")
             return None
     
+    def get_document(self, parent_id, user_id=None, max_chars=None):
+        """
+        Reassembles a chunked document (see memory_ingest) from its chunks.
+        
+        Args:
+            parent_id: The parent_id shared by the chunks
+            user_id: Owner of the document (optional, read from the ID otherwise)
+            max_chars: Stop after this many characters (optional)
+        
+        Returns:
+            Dict with id, title, content, chunks and truncated, or None if no chunk exists
+        """
+        owner = user_id or self.user_from_memory_id(parent_id)
+        where_condition = {"parent_id": parent_id}
+        if owner:
+            where_condition["user_id"] = str(owner)
+        results = self.collection_for(owner).get(
+            where=self._chroma_where(where_condition),
+            include=["documents", "metadatas"]
+        )
+        if not results["ids"]:
+            return None
+        
+        chunks = sorted(zip(results["metadatas"], results["documents"]), key=lambda chunk: chunk[0].get("chunk_index", 0))
+        content, truncated = "", False
+        for metadata, document in chunks:
+            # Drop the prefix repeated from the previous chunk, and put back the whitespace before the new text
+            part = metadata.get("separator", " ") + document[metadata.get("overlap_chars", 0):] if content else document
+            if max_chars and len(content) + len(part) > max_chars:
+                truncated = True
+                break
+            content += part
+        return {
+            "id": parent_id,
+            "title": chunks[0][0].get("parent_title", ""),
+            "content": content,
+            "chunks": len(chunks),
+            "truncated": truncated
+        }
+    
+    @_memory_write
     def update_memory(self, memory_id, new_content, metadata=None, user_id=None):
         """
         Updates an existing memory.
@@ -177,7 +726,7 @@ class MemoryDB:
         """
         try:
             # Check if the memory exists
-            existing = self.get_memory(memory_id)
+            existing = self.get_memory(memory_id, user_id)
             if not existing:
                 return None
             
@@ -203,20 +752,34 @@ class MemoryDB:
                 
             if user_id:
                 metadata["user_id"] = str(user_id)
+            metadata = with_filter_fields(metadata)
             
             # Update the collection
-            self.collection.update(
+            self.collection_for(existing["metadata"].get("user_id")).update(
                 ids=[memory_id],
-                embeddings=[new_embedding],
+                embeddings=self._chroma_embeddings([new_embedding]),
                 documents=[new_content],
                 metadatas=[metadata]
             )
+            if self.vector_index is not None:
+                self.vector_index.add(metadata.get("user_id"), [memory_id], [new_embedding])
+            
+            if metadata.get("user_id"):
+                version = bump_user_version(metadata["user_id"])
+                self.keyword_index.add(metadata["user_id"], memory_id, new_content, version)
+                old_key = existing["metadata"].get("category_key") or normalize_category(existing["metadata"].get("category"))
+                if old_key != metadata["category_key"]:
+                    adjust_category_counts({
+                        (metadata["user_id"], old_key): -1,
+                        (metadata["user_id"], metadata["category_key"]): 1
+                    })
             
             return memory_id
         except Exception as e:
             print(f"Error updating memory: {e}")
             return None
     
+    @_memory_write
     def delete_memory(self, memory_id, user_id=None):
         """
         Deletes a memory from the database.
@@ -230,7 +793,7 @@ class MemoryDB:
         """
         try:
             # Check if the memory exists
-            existing = self.get_memory(memory_id)
+            existing = self.get_memory(memory_id, user_id)
             if not existing:
                 return False
             
@@ -239,26 +802,78 @@ class MemoryDB:
                 return False
             
             # Delete from the collection
-            self.collection.delete(ids=[memory_id])
+            self.collection_for(existing["metadata"].get("user_id")).delete(ids=[memory_id])
+            if self.vector_index is not None:
+                self.vector_index.remove(existing["metadata"].get("user_id"), memory_id)
+            
+            if existing["metadata"].get("user_id"):
+                version = bump_user_version(existing["metadata"]["user_id"])
+                self.keyword_index.remove(existing["metadata"]["user_id"], memory_id, version)
+                category_key = existing["metadata"].get("category_key") or normalize_category(existing["metadata"].get("category"))
+                adjust_category_counts({(existing["metadata"]["user_id"], category_key): -1})
             return True
         except Exception as e:
             print(f"Error deleting memory: {e}")
             return False
     
-    def get_user_memories(self, user_id, limit=100):
+    @_memory_write
+    def delete_document(self, parent_id, user_id=None):
+        """
+        Deletes every chunk of a chunked document (see memory_ingest).
+        
+        Args:
+            parent_id: The parent_id shared by the chunks
+            user_id: User ID for ownership verification (optional)
+            
+        Returns:
+            Number of chunks deleted
+        """
+        try:
+            owner = user_id or self.user_from_memory_id(parent_id)
+            where_condition = {"parent_id": parent_id}
+            if user_id:
+                where_condition["user_id"] = str(user_id)
+            collection = self.collection_for(owner)
+            chunks = collection.get(where=self._chroma_where(where_condition), include=["metadatas"])
+            if not chunks["ids"]:
+                return 0
+            
+            collection.delete(ids=chunks["ids"])
+            deltas = {}
+            for memory_id, metadata in zip(chunks["ids"], chunks["metadatas"]):
+                chunk_owner = (metadata or {}).get("user_id")
+                if self.vector_index is not None:
+                    self.vector_index.remove(chunk_owner, memory_id)
+                if chunk_owner:
+                    version = bump_user_version(chunk_owner)
+                    self.keyword_index.remove(chunk_owner, memory_id, version)
+                    key = (chunk_owner, metadata.get("category_key") or normalize_category(metadata.get("category")))
+                    deltas[key] = deltas.get(key, 0) - 1
+            adjust_category_counts(deltas)
+            return len(chunks["ids"])
+        except Exception as e:
+            print(f"Error deleting document: {e}")
+            return 0
+    
+    def get_user_memories(self, user_id, limit=100, created_after=None, created_before=None, category=None):
         """
         Get all memories for a specific user.
         
         Args:
             user_id: User ID
             limit: Maximum number of results
+            created_after: Only memories created at or after this datetime (optional)
+            created_before: Only memories created at or before this datetime (optional)
+            category: Only memories of this category (optional)
             
         Returns:
             Dict with IDs, documents and metadata
         """
         try:
-            results = self.collection.get(
-                where={"user_id": str(user_id)},
+            where_condition = {"user_id": str(user_id)}
+            where_condition.update(filter_conditions(created_after, created_before, category))
+            results = self.collection_for(user_id).get(
+                where=self._chroma_where(where_condition),
                 limit=limit
             )
             
@@ -270,6 +885,287 @@ class MemoryDB:
         except Exception as e:
             print(f"Error getting user memories: {e}")
             return {"ids": [], "documents": [], "metadatas": []}
+    
+    def get_user_memories_page(self, user_id, page_size=50, cursor=None,
+                               created_after=None, created_before=None, category=None):
+        """
+        Get one page of a user's memories.
+        
+        Args:
+            user_id: User ID
+            page_size: Maximum number of memories in the page, clamped to 1..MAX_PAGE_SIZE
+            cursor: Opaque cursor returned with the previous page (None for the first page)
+            created_after, created_before, category: Same filters as get_user_memories
+            
+        Returns:
+            Dict with IDs, documents, metadata and next_cursor (None on the last page)
+        
+        Pages are ordered by (created_ts, id) and the cursor is the key of the last
+        memory returned, so writes and deletes between two requests never shift a
+        page. Chroma cannot sort, so the metadata of the memories created at or
+        after the cursor is scanned in pages, keeping only the page_size + 1
+        smallest keys (one extra tells whether another page exists).
+        """
+        page_size = clamp_page_size(page_size)
+        after = decode_cursor(cursor)
+        where_condition = {"user_id": str(user_id)}
+        where_condition.update(filter_conditions(created_after, created_before, category))
+        if after and after[0] > 0:
+            time_range = dict(where_condition.get("created_ts") or {})
+            time_range["$gte"] = max(time_range.get("$gte", after[0]), after[0])
+            where_condition["created_ts"] = time_range
+        
+        collection = self.collection_for(user_id)
+        keys = []
+        offset = 0
+        while True:
+            page = collection.get(
+                where=self._chroma_where(where_condition),
+                limit=MAX_PAGE_SIZE,
+                offset=offset,
+                include=["metadatas"]
+            )
+            if not page["ids"]:
+                break
+            page_keys = [
+                ((metadata or {}).get("created_ts", 0), memory_id)
+                for memory_id, metadata in zip(page["ids"], page["metadatas"])
+            ]
+            keys = heapq.nsmallest(page_size + 1, keys + [key for key in page_keys if not after or key > after])
+            offset += len(page["ids"])
+        
+        next_cursor = encode_cursor(keys[page_size - 1]) if len(keys) > page_size else None
+        keys = keys[:page_size]
+        found = self._fetch_memories([memory_id for _, memory_id in keys], where_condition, user_id)
+        # A memory deleted since the scan is left out of the page
+        keys = [key for key in keys if key[1] in found]
+        return {
+            "ids": [memory_id for _, memory_id in keys],
+            "documents": [found[memory_id][0] for _, memory_id in keys],
+            "metadatas": [found[memory_id][1] for _, memory_id in keys],
+            "next_cursor": next_cursor
+        }
+    
+    def iter_user_memories(self, user_id, page_size=200, include_embeddings=False,
+                           created_after=None, created_before=None, category=None):
+        """
+        Yields a user's memories one at a time, reading them page by page.
+        
+        Memory use is bounded by page_size (clamped to 1..MAX_PAGE_SIZE) regardless of
+        how many memories the user has.
+        
+        Yields:
+            Dicts with id, content, metadata (and embedding when include_embeddings is True)
+        """
+        where_condition = {"user_id": str(user_id)}
+        where_condition.update(filter_conditions(created_after, created_before, category))
+        from_chroma = include_embeddings and self.vector_index is None
+        include = ["documents", "metadatas"] + (["embeddings"] if from_chroma else [])
+        page_size = clamp_page_size(page_size)
+        
+        offset = 0
+        while True:
+            page = self.collection_for(user_id).get(
+                where=self._chroma_where(where_condition),
+                limit=page_size,
+                offset=offset,
+                include=include
+            )
+            if not page["ids"]:
+                return
+            if include_embeddings and not from_chroma:
+                vectors = self.vector_index.get(user_id, page["ids"])
+            for i, memory_id in enumerate(page["ids"]):
+                memory = {
+                    "id": memory_id,
+                    "content": page["documents"][i],
+                    "metadata": page["metadatas"][i]
+                }
+                if from_chroma:
+                    memory["embedding"] = [float(value) for value in page["embeddings"][i]]
+                elif include_embeddings:
+                    memory["embedding"] = vectors.get(memory_id)
+                yield memory
+            offset += len(page["ids"])
+
+def query_collection(collection, **kwargs):
+    """collection.query, retried when it fails on a concurrent write of another process."""
+    for attempt in range(QUERY_RETRIES):
+        try:
+            return collection.query(**kwargs)
+        except Exception as e:
+            if "Error finding id" not in str(e) or attempt == QUERY_RETRIES - 1:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+def clamp_page_size(page_size):
+    """Bounds a requested page size to 1..MAX_PAGE_SIZE."""
+    return min(max(int(page_size), 1), MAX_PAGE_SIZE)
+
+def encode_cursor(key):
+    """Encodes the (created_ts, id) key of the last memory of a page as an opaque cursor string."""
+    created_ts, memory_id = key
+    return base64.urlsafe_b64encode(json.dumps({"ts": created_ts, "id": memory_id}).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    """Decodes a cursor produced by encode_cursor into its (created_ts, id) key (None means the first page)."""
+    if not cursor:
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        key = (int(position["ts"]), str(position["id"]))
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    return key
+
+def _to_timestamp(value):
+    """Converts a datetime or ISO string to epoch seconds."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp())
+
+def with_filter_fields(metadata):
+    """Adds the numeric timestamps and normalized category used by server-side filters."""
+    created_at = metadata.get("created_at") or metadata.get("updated_at") or datetime.now().isoformat()
+    metadata["created_ts"] = _to_timestamp(created_at)
+    metadata["updated_ts"] = _to_timestamp(metadata.get("updated_at") or created_at)
+    metadata["category_key"] = normalize_category(metadata.get("category"))
+    return metadata
+
+def filter_conditions(created_after=None, created_before=None, category=None):
+    """Builds where conditions for time-range and category filters."""
+    conditions = {}
+    time_range = {}
+    if created_after is not None:
+        time_range["$gte"] = _to_timestamp(created_after)
+    if created_before is not None:
+        time_range["$lte"] = _to_timestamp(created_before)
+    if time_range:
+        conditions["created_ts"] = time_range
+    if category:
+        conditions["category_key"] = normalize_category(category)
+    return conditions
+
+def apply_search_ef(collection):
+    """
+    Applies MEMORY_HNSW_SEARCH_EF to an existing collection.
+
+    Unlike M and construction_ef, search_ef can change after the collection was
+    built; it is only written when it differs from the stored value.
+    """
+    configuration = getattr(collection, "configuration_json", None) or {}
+    if (configuration.get("hnsw") or {}).get("ef_search") == settings.MEMORY_HNSW_SEARCH_EF:
+        return
+    try:
+        collection.modify(configuration={"hnsw": {"ef_search": settings.MEMORY_HNSW_SEARCH_EF}})
+    except Exception as e:
+        print(f"Could not set search_ef of collection '{collection.name}': {e}")
+
+def collection_metadata(embedder, **extra):
+    """Metadata of a new memory collection: HNSW parameters from settings and the embedding model."""
+    metadata = {
+        "hnsw:space": "cosine",
+        "hnsw:M": settings.MEMORY_HNSW_M,
+        "hnsw:construction_ef": settings.MEMORY_HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": settings.MEMORY_HNSW_SEARCH_EF,
+        "embedding_model": embedder.name,
+        "embedding_dimension": embedder.dimension
+    }
+    if settings.MEMORY_QUANTIZATION:
+        metadata["vector_storage"] = settings.MEMORY_QUANTIZATION
+    metadata.update(extra)
+    return metadata
+
+def vector_storage(collection):
+    """Quantization of the store holding a collection's vectors, or "" when Chroma holds them."""
+    return (collection.metadata or {}).get("vector_storage", "")
+
+def open_vector_store(collection_name, dimension, dtype):
+    """
+    The quantized store holding the vectors of a collection and of its partitions.
+
+    Vectors are kept per user, so moving memories between partitions doesn't move them.
+    """
+    from .quantized_index import QuantizedVectorIndex  # numpy is only needed with quantization
+    return QuantizedVectorIndex(os.path.join(settings.CUSTOM_RAG_PATH, "vectors", collection_name), dimension, dtype)
+
+def active_collection_pointer_path():
+    """File naming the collection that serves reads and writes."""
+    return os.path.join(settings.CUSTOM_RAG_PATH, "active_collection.json")
+
+def get_active_collection_name():
+    """Returns the name of the active memory collection."""
+    try:
+        with open(active_collection_pointer_path(), encoding="utf-8") as f:
+            return json.load(f)["collection"]
+    except FileNotFoundError:
+        return DEFAULT_COLLECTION
+
+def set_active_collection_name(name):
+    """Atomically switches every MemoryDB (in any process) to another collection."""
+    path = active_collection_pointer_path()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"collection": name, "switched_at": datetime.now().isoformat()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def write_barrier_path():
+    """File whose presence makes every process hold its memory writes (see set_write_barrier)."""
+    return os.path.join(settings.CUSTOM_RAG_PATH, "write_barrier.json")
+
+def set_write_barrier(active):
+    """
+    Holds (or releases) memory writes in every process.
+
+    A migration holds writes across its last catch-up and the collection switch,
+    so no write lands in the old collection after it was last copied. Setting it
+    again while held refreshes it, so a long catch-up does not look stale.
+    """
+    path = write_barrier_path()
+    if not active:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"since": time.time()}, f)
+    os.replace(tmp_path, path)
+
+def write_lock_path():
+    return os.path.join(settings.CUSTOM_RAG_PATH, "write_barrier.lock")
+
+@contextmanager
+def write_lock(exclusive=False):
+    """
+    Lock shared by the memory writes in progress in every process.
+
+    A cutover takes it exclusively, which waits for the writes that started before
+    the barrier was raised to land. It is released if its holder crashes.
+    """
+    os.makedirs(settings.CUSTOM_RAG_PATH, exist_ok=True)
+    with open(write_lock_path(), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def wait_for_write_barrier():
+    """Blocks while a write barrier is held, ignoring barriers older than WRITE_BARRIER_TIMEOUT."""
+    path = write_barrier_path()
+    while True:
+        try:
+            since = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return
+        if time.time() - since > WRITE_BARRIER_TIMEOUT:
+            print(f"Ignoring stale memory write barrier {path}")
+            return
+        time.sleep(0.1)
 
 def init_memory_db():
     """Initializes and returns the singleton instance of MemoryDB."""
@@ -287,5 +1183,19 @@ def get_memory_db():
         _memory_db = init_memory_db()
     return _memory_db
 
-# Initialize the singleton instance immediately
-memory_db = get_memory_db()
+def warmup_memory_db():
+    """Builds the store ahead of the first request (used by the API process at startup)."""
+    return get_memory_db()
+
+class LazyMemoryDB:
+    """Proxy that builds the MemoryDB singleton on first attribute access."""
+    
+    def __getattr__(self, name):
+        return getattr(get_memory_db(), name)
+    
+    def __repr__(self):
+        state = "initialized" if _memory_db is not None else "not initialized"
+        return f"<LazyMemoryDB ({state})>"
+
+# Module-level handle, safe to import: nothing is opened until it is used
+memory_db = LazyMemoryDB()
@@ -0,0 +1,75 @@
+import re
+from sqlalchemy import and_, delete, func
+from sqlalchemy.dialects.sqlite import insert
+from .database import SessionLocal
+from . import models
+
+# Category used for memories stored without one
+DEFAULT_CATEGORY = "general"
+
+
+def normalize_category(category):
+    """Normalizes a free-text category ("Passwords ", "password") into a filterable key."""
+    if not category:
+        return DEFAULT_CATEGORY
+    key = re.sub(r"[^\w]+", "_", category.strip().lower()).strip("_")
+    # Naive singular form, so "passwords" and "password" match
+    if len(key) > 3 and key.endswith("s") and not key.endswith("ss"):
+        key = key[:-1]
+    return key or DEFAULT_CATEGORY
+
+
+def adjust_category_counts(deltas):
+    """
+    Applies count changes to the category facets.
+
+    Each change is a single `count = count + delta` upsert, so concurrent writers
+    in several processes never lose an update.
+
+    Args:
+        deltas: Dict mapping (user_id, category_key) to the change in count
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    table = models.MemoryCategoryCount
+    db = SessionLocal()
+    try:
+        for (user_id, category), delta in deltas.items():
+            statement = insert(table).values(user_id=str(user_id), category=category, count=max(delta, 0))
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[table.user_id, table.category],
+                set_={"count": func.max(table.count + delta, 0)}
+            ))
+            if delta < 0:
+                db.execute(delete(table).where(
+                    and_(table.user_id == str(user_id), table.category == category, table.count <= 0)
+                ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def get_category_counts(user_id):
+    """Returns {category_key: count} for a user."""
+    db = SessionLocal()
+    try:
+        rows = db.query(models.MemoryCategoryCount)\
+            .filter(models.MemoryCategoryCount.user_id == str(user_id))\
+            .order_by(models.MemoryCategoryCount.count.desc())\
+            .all()
+        return {row.category: row.count for row in rows}
+    finally:
+        db.close()
+
+
+def reset_category_counts(counts):
+    """Replaces every facet with freshly computed {(user_id, category_key): count} values."""
+    db = SessionLocal()
+    try:
+        db.query(models.MemoryCategoryCount).delete()
+        for (user_id, category), count in counts.items():
+            db.add(models.MemoryCategoryCount(user_id=str(user_id), category=category, count=count))
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,180 @@
+import math
+import re
+import threading
+from collections import Counter
+
+# Tokens are runs of letters/digits, so "AB-123-CD" becomes ["ab", "123", "cd"]
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Standard Okapi BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant (Cormack et al.)
+RRF_K = 60
+
+
+def tokenize(text):
+    """Splits a text into lowercase keyword tokens."""
+    if not text:
+        return []
+    return _TOKEN_RE.findall(text.lower())
+
+
+def same_words(text, other):
+    """Whether two texts use the same words, ignoring case, punctuation and order."""
+    return set(tokenize(text)) == set(tokenize(other))
+
+
+class _UserIndex:
+    """Inverted index and BM25 statistics for the memories of a single user."""
+
+    def __init__(self):
+        self.postings = {}      # term -> {memory_id: term frequency}
+        self.doc_lengths = {}   # memory_id -> number of tokens
+        self.doc_terms = {}     # memory_id -> distinct terms, so removal only touches those postings
+        self.total_length = 0
+
+    def add(self, memory_id, content):
+        if memory_id in self.doc_lengths:
+            self.remove(memory_id)
+
+        counts = Counter(tokenize(content))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[memory_id] = tf
+
+        length = sum(counts.values())
+        self.doc_lengths[memory_id] = length
+        self.doc_terms[memory_id] = tuple(counts)
+        self.total_length += length
+
+    def remove(self, memory_id):
+        length = self.doc_lengths.pop(memory_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+
+        for term in self.doc_terms.pop(memory_id, ()):
+            docs = self.postings.get(term)
+            if docs is None:
+                continue
+            docs.pop(memory_id, None)
+            if not docs:
+                del self.postings[term]
+
+    def search(self, query, limit):
+        n_docs = len(self.doc_lengths)
+        if n_docs == 0:
+            return []
+
+        avg_length = self.total_length / n_docs if self.total_length else 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for memory_id, tf in docs.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[memory_id] / avg_length)
+                scores[memory_id] = scores.get(memory_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+
+class KeywordIndex:
+    """
+    Per-user BM25 index over memory documents.
+
+    Each user's index is built lazily on first access through `loader`, a callable
+    that receives a user ID and returns an iterable of (memory_id, document) pairs,
+    and is then kept up to date incrementally by add/update/delete.
+
+    `version` (user ID -> current version, see memory_versions) lets several
+    processes share a collection: an index is rebuilt when another process wrote
+    to the user's memories since it was loaded.
+    """
+
+    def __init__(self, loader=None, version=None):
+        self.loader = loader
+        self.version = version
+        self._users = {}  # user ID -> (_UserIndex, version it reflects)
+        self._lock = threading.Lock()
+
+    def _get_user_index(self, user_id):
+        key = str(user_id)
+        # Read the version before loading, so a write landing during the load triggers another reload
+        current = self.version(key) if self.version is not None else None
+        cached = self._users.get(key)
+        if cached is not None and cached[1] == current:
+            return cached[0]
+
+        index = _UserIndex()
+        if self.loader is not None:
+            for memory_id, document in self.loader(key):
+                index.add(memory_id, document)
+        self._users[key] = (index, current)
+        return index
+
+    def _apply(self, user_id, version, change):
+        """
+        Applies a local write to a loaded index.
+
+        Args:
+            version: Version produced by the write (None without version tracking)
+        """
+        key = str(user_id)
+        cached = self._users.get(key)
+        if cached is None:
+            if version is None:
+                change(self._get_user_index(key))
+            # Otherwise the index is loaded, write included, on next use
+            return
+        index, loaded = cached
+        if version is not None and loaded not in (version - 1, version):
+            # Another process wrote in between: rebuild on next use
+            del self._users[key]
+            return
+        change(index)
+        self._users[key] = (index, loaded if version is None else version)
+
+    def add(self, user_id, memory_id, content, version=None):
+        """Indexes (or re-indexes) a memory document."""
+        with self._lock:
+            self._apply(user_id, version, lambda index: index.add(memory_id, content))
+
+    def remove(self, user_id, memory_id, version=None):
+        """Removes a memory document from the index."""
+        with self._lock:
+            self._apply(user_id, version, lambda index: index.remove(memory_id))
+
+    def invalidate(self, user_id=None):
+        """Drops the cached index of a user (or of all users) so it is reloaded on next use."""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(str(user_id), None)
+
+    def search(self, user_id, query, limit=3):
+        """Returns a list of (memory_id, bm25_score) sorted by descending score."""
+        with self._lock:
+            return self._get_user_index(user_id).search(query, limit)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuses several ranked lists of IDs with reciprocal rank fusion.
+
+    Args:
+        rankings: List of ranked ID lists (best first)
+        k: RRF smoothing constant
+
+    Returns:
+        List of (id, fused_score) sorted by descending score
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
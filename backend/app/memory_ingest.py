@@ -0,0 +1,231 @@
+"""
+Ingestion of long texts (documents, recipes, long notes) as chunked memories.
+
+The text is streamed through paragraph and sentence splitting into chunks of at
+most MEMORY_CHUNK_CHARS characters that overlap by MEMORY_CHUNK_OVERLAP
+characters. Chunks are embedded and written in batches, so memory use does not
+grow with the size of the input. Every chunk carries the metadata of its parent
+document, which retrieval uses to return the whole document.
+
+Usage (from the backend directory):
+    python -m app.memory_ingest --user-id 1 --title "Grandma's recipes" recipes.txt
+"""
+import argparse
+import re
+import sys
+import time
+import zlib
+from datetime import datetime
+from .config import settings
+
+# Whitespace after the end of a sentence, or a line break
+_SENTENCE_BREAK = re.compile(r"((?<=[.!?])[ \t]+|\n)")
+
+
+def iter_paragraphs(lines):
+    """Groups an iterable of lines into paragraphs separated by blank lines, keeping their line breaks."""
+    paragraph = []
+    for line in lines:
+        if line.strip():
+            paragraph.append(line.rstrip())
+        elif paragraph:
+            yield "\n".join(paragraph)
+            paragraph = []
+    if paragraph:
+        yield "\n".join(paragraph)
+
+
+def iter_sentences(paragraph, max_chars):
+    """
+    Splits a paragraph into (separator, sentence) pairs, hard-splitting sentences longer than max_chars.
+
+    The separator is what preceded the sentence in the paragraph: "" for the
+    first one, then a space or a line break.
+    """
+    parts = _SENTENCE_BREAK.split(paragraph)
+    separators = [""] + ["\n" if separator == "\n" else " " for separator in parts[1::2]]
+    for separator, sentence in zip(separators, parts[::2]):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            yield separator, sentence[:cut]
+            sentence = sentence[cut:].lstrip()
+            separator = " "
+        if sentence:
+            yield separator, sentence
+
+
+def _join(pieces):
+    """Text of (separator, sentence) pairs; the separator of the first one is dropped."""
+    return "".join(separator + sentence for separator, sentence in pieces)[len(pieces[0][0]):] if pieces else ""
+
+
+def iter_chunks(text, max_chars=None, overlap=None):
+    """
+    Yields (chunk, overlap_chars, separator) triples for a text.
+
+    Args:
+        text: A string or any iterable of lines (e.g. an open file), read lazily
+        max_chars: Maximum chunk length (defaults to settings.MEMORY_CHUNK_CHARS)
+        overlap: Characters of trailing sentences repeated at the start of the next chunk
+                 (defaults to settings.MEMORY_CHUNK_OVERLAP)
+
+    overlap_chars is the length of the prefix repeated from the previous chunk and
+    separator the whitespace between the previous chunk and the new text ("" for the
+    first chunk), so the original text, line breaks included, can be reassembled
+    without duplicates.
+    """
+    max_chars = max_chars or settings.MEMORY_CHUNK_CHARS
+    overlap = settings.MEMORY_CHUNK_OVERLAP if overlap is None else overlap
+    lines = text.splitlines() if isinstance(text, str) else text
+
+    pieces, carried = [], 0  # carried: number of pieces repeated from the previous chunk
+
+    def emit():
+        chunk = _join(pieces)
+        if not carried:
+            return chunk, 0, pieces[0][0]
+        overlap_chars = len(_join(pieces[:carried])) + len(pieces[carried][0])
+        return chunk, overlap_chars, pieces[carried][0]
+
+    first_paragraph = True
+    for paragraph in iter_paragraphs(lines):
+        for separator, sentence in iter_sentences(paragraph, max_chars):
+            if not separator and not first_paragraph:
+                separator = "\n\n"
+            first_paragraph = False
+            if len(_join(pieces + [(separator, sentence)])) > max_chars:
+                if len(pieces) > carried:
+                    yield emit()
+                    # Carry the last sentences over, as long as they fit in the overlap
+                    tail = []
+                    for piece in reversed(pieces):
+                        if len(_join([piece] + tail)) > overlap:
+                            break
+                        tail.insert(0, piece)
+                    pieces, carried = tail, len(tail)
+                if len(_join(pieces + [(separator, sentence)])) > max_chars:
+                    # No room for the overlap next to this sentence
+                    pieces, carried = [], 0
+            pieces.append((separator, sentence))
+    if len(pieces) > carried:
+        yield emit()
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def make_parent_id(user_id, title, started_at):
+    """Builds the ID of a chunked document, in the memory_{user}_... format used by all memory IDs."""
+    return f"memory_{user_id}_doc{zlib.crc32(f'{title}|{started_at}'.encode('utf-8')):08x}"
+
+
+def ingest_text(memory_db, user_id, text, title=None, category=None, batch_size=None, write_behind=False):
+    """
+    Chunks a long text and stores the chunks as memories of a user.
+
+    Args:
+        memory_db: The MemoryDB to write to
+        user_id: Owner of the document
+        text: A string or an iterable of lines
+        title: Title of the document (defaults to the start of its first chunk)
+        category: Category of every chunk (optional)
+        batch_size: Chunks embedded and written per call (defaults to settings.MEMORY_QUEUE_BATCH_SIZE)
+        write_behind: Hand the chunks to the write-behind queue instead of embedding them now
+
+    Returns:
+        Dict with parent_id, title, chunks, seconds and chunks_per_second
+
+    Raises:
+        EmbeddingError or Chroma errors, after deleting the chunks already written,
+        so a failed document is never left half stored
+    """
+    from .memory_queue import enqueue_memories, delete_pending_document
+
+    batch_size = batch_size or settings.MEMORY_QUEUE_BATCH_SIZE
+    started_at = datetime.now().isoformat()
+    started = time.perf_counter()
+    parent_id = None
+    count = 0
+
+    def memories():
+        nonlocal parent_id, title
+        for index, (chunk, overlap_chars, separator) in enumerate(iter_chunks(text)):
+            if parent_id is None:
+                title = title or chunk.split("\n", 1)[0][:80]
+                parent_id = make_parent_id(user_id, title, started_at)
+            metadata = {
+                "created_at": started_at,
+                "updated_at": started_at,
+                "parent_id": parent_id,
+                "parent_title": title,
+                "chunk_index": index,
+                "overlap_chars": overlap_chars,
+                "separator": separator
+            }
+            if category:
+                metadata["category"] = category
+            yield {
+                "id": f"{parent_id}_c{index:05d}",
+                "content": chunk,
+                "metadata": metadata,
+                "user_id": user_id
+            }
+
+    try:
+        for batch in _batched(memories(), batch_size):
+            if write_behind:
+                enqueue_memories(batch)
+            else:
+                memory_db.add_memories(batch)
+            count += len(batch)
+    except Exception:
+        if parent_id is not None:
+            print(f"Ingesting '{title}' for user {user_id} failed after {count} chunks, deleting them")
+            delete_pending_document(parent_id, user_id)
+            memory_db.delete_document(parent_id, user_id)
+        raise
+
+    seconds = time.perf_counter() - started
+    rate = count / seconds if seconds > 0 else 0.0
+    print(f"Ingested {count} chunks of '{title}' for user {user_id} in {seconds:.2f}s ({rate:.1f} chunks/sec)")
+    return {
+        "parent_id": parent_id,
+        "title": title,
+        "chunks": count,
+        "seconds": seconds,
+        "chunks_per_second": rate
+    }
+
+
+def main():
+    from .memory_db import get_memory_db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Text file to ingest, or - for standard input")
+    parser.add_argument("--user-id", required=True, help="Owner of the document")
+    parser.add_argument("--title", default=None)
+    parser.add_argument("--category", default=None)
+    parser.add_argument("--batch-size", type=int, default=None, help="Chunks embedded per call")
+    args = parser.parse_args()
+    # The memory store's bookkeeping tables are created by the schema upgrade
+    from .migrations import upgrade_schema
+    upgrade_schema()
+
+    if args.path == "-":
+        ingest_text(get_memory_db(), args.user_id, sys.stdin, args.title, args.category, args.batch_size)
+        return
+    with open(args.path, encoding="utf-8") as f:
+        ingest_text(get_memory_db(), args.user_id, f, args.title, args.category, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
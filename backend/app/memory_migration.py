@@ -0,0 +1,419 @@
+"""
+Resumable re-embedding of the memory collection into a new versioned collection.
+
+Reads keep being served by the active collection while the job runs. Progress is
+checkpointed after every batch, so an interrupted job resumes where it stopped.
+Once every memory is copied, a catch-up pass applies writes made during the
+migration and the active collection pointer is switched atomically, while
+memory writes are held in every process. Only the shared collection
+(MEMORY_PARTITIONING=shared) can be re-embedded. The new collection keeps its
+vectors as MEMORY_QUANTIZATION says, so the job also converts a store to or
+from quantized vectors.
+
+It also moves memories from the shared collection into per-user or bucketed
+partition collections, reusing the stored vectors.
+
+Usage (from the backend directory):
+    python -m app.memory_migration --provider local [--model NAME] [--cutover]
+    python -m app.memory_migration --partition user|bucket
+    python -m app.memory_migration --backfill-metadata
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from .config import settings
+from .embeddings import get_embedding_provider
+from .memory_db import (
+    get_memory_db, get_active_collection_name, set_active_collection_name, collection_metadata,
+    with_filter_fields, set_write_barrier, write_lock, vector_storage, open_vector_store, PLACEHOLDER_EMBEDDING
+)
+from .memory_facets import reset_category_counts
+
+
+def checkpoint_path():
+    return os.path.join(settings.CUSTOM_RAG_PATH, "migration_checkpoint.json")
+
+
+def next_collection_name(client, base="user_memories"):
+    """Returns the first unused versioned collection name (user_memories_v2, _v3, ...)."""
+    existing = {getattr(collection, "name", collection) for collection in client.list_collections()}
+    version = 2
+    while f"{base}_v{version}" in existing:
+        version += 1
+    return f"{base}_v{version}"
+
+
+class RateLimiter:
+    """Spaces out calls so that at most `per_minute` happen in any minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self.next_call = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if now < self.next_call:
+            time.sleep(self.next_call - now)
+        self.next_call = max(now, self.next_call) + self.interval
+
+
+class ReembeddingMigration:
+    """
+    Copies the active memory collection into a new collection embedded with `provider`.
+
+    Args:
+        client: Chroma client holding both collections
+        provider: EmbeddingProvider used for the new collection
+        page_size: Memories read from the source collection per page
+        batch_size: Texts sent to the provider per embedding call
+        requests_per_minute: Maximum embedding calls per minute
+    """
+
+    def __init__(self, client, provider, page_size=500, batch_size=64, requests_per_minute=60):
+        if settings.MEMORY_PARTITIONING != "shared":
+            # Partition collections are not copied: switching would leave them behind
+            raise RuntimeError(
+                f"Re-embedding only migrates the shared collection, not MEMORY_PARTITIONING={settings.MEMORY_PARTITIONING}"
+            )
+        self.client = client
+        self.provider = provider
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.state = self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        try:
+            with open(checkpoint_path(), encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = None
+
+        if state and state["status"] != "done" and state["model"] == self.provider.name:
+            print(f"Resuming migration into '{state['target']}' at offset {state['offset']}")
+            return state
+
+        return {
+            "source": get_active_collection_name(),
+            "target": next_collection_name(self.client),
+            "model": self.provider.name,
+            "dimension": self.provider.dimension,
+            "offset": 0,
+            "copied": 0,
+            "status": "copying",
+            "started_at": datetime.now().isoformat(),
+        }
+
+    def _save_checkpoint(self):
+        path = checkpoint_path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, path)
+
+    def _target_collection(self):
+        return self.client.get_or_create_collection(
+            name=self.state["target"],
+            metadata=collection_metadata(self.provider, migrated_from=self.state["source"]),
+        )
+
+    def _target_vectors(self, target):
+        """Quantized store of the target collection, None when Chroma holds its vectors."""
+        storage = vector_storage(target)
+        return open_vector_store(target.name, self.provider.dimension, storage) if storage else None
+
+    def _copy(self, target, ids, documents, metadatas, hold_barrier=False):
+        """Re-embeds and upserts memories in rate-limited batches (upsert keeps resuming idempotent)."""
+        vectors = self._target_vectors(target)
+        for i in range(0, len(ids), self.batch_size):
+            if hold_barrier:
+                set_write_barrier(True)
+            self.rate_limiter.wait()
+            batch_ids = ids[i:i + self.batch_size]
+            batch_documents = documents[i:i + self.batch_size]
+            batch_metadatas = metadatas[i:i + self.batch_size]
+            embeddings = self.provider.embed(batch_documents)
+            if vectors is not None:
+                by_user = {}
+                for memory_id, embedding, metadata in zip(batch_ids, embeddings, batch_metadatas):
+                    by_user.setdefault((metadata or {}).get("user_id"), []).append((memory_id, embedding))
+                for user_id, items in by_user.items():
+                    vectors.add(user_id, [memory_id for memory_id, _ in items], [embedding for _, embedding in items])
+                embeddings = [PLACEHOLDER_EMBEDDING] * len(batch_ids)
+            target.upsert(
+                ids=batch_ids,
+                embeddings=embeddings,
+                documents=batch_documents,
+                metadatas=batch_metadatas,
+            )
+
+    def _report(self, total, copied_this_run, started):
+        # Throughput only counts work done by this run, not by the runs it resumed
+        elapsed = time.monotonic() - started
+        throughput = copied_this_run / elapsed if elapsed else 0.0
+        remaining = max(total - self.state["offset"], 0)
+        eta = remaining / throughput if throughput else float("inf")
+        print(f"Migrated {self.state['offset']}/{total} memories  {throughput:.1f} memories/s  ETA {eta:.0f}s")
+
+    def copy_all(self):
+        """Streams the source collection page by page into the target collection."""
+        source = self.client.get_collection(self.state["source"])
+        target = self._target_collection()
+        self._save_checkpoint()
+
+        total = source.count()
+        started = time.monotonic()
+        copied_this_run = 0
+        while self.state["status"] == "copying":
+            page = source.get(
+                limit=self.page_size,
+                offset=self.state["offset"],
+                include=["documents", "metadatas"],
+            )
+            if not page["ids"]:
+                self.state["status"] = "copied"
+                self._save_checkpoint()
+                break
+
+            self._copy(target, page["ids"], page["documents"], page["metadatas"])
+            self.state["offset"] += len(page["ids"])
+            self.state["copied"] += len(page["ids"])
+            self._save_checkpoint()
+
+            copied_this_run += len(page["ids"])
+            self._report(total, copied_this_run, started)
+
+    def catch_up(self, hold_barrier=False):
+        """
+        Applies writes made to the source collection while the copy was running.
+
+        Both collections are compared page by page, so memory use is bounded by
+        page_size whatever their size. With hold_barrier, the write barrier is
+        refreshed before every page and batch, so it never turns stale while held.
+        """
+        source = self.client.get_collection(self.state["source"])
+        target = self._target_collection()
+
+        copied = 0
+        offset = 0
+        while True:
+            if hold_barrier:
+                set_write_barrier(True)
+            page = source.get(limit=self.page_size, offset=offset, include=["documents", "metadatas"])
+            if not page["ids"]:
+                break
+            existing = target.get(ids=page["ids"], include=["metadatas"])
+            target_updated = {
+                memory_id: (metadata or {}).get("updated_at")
+                for memory_id, metadata in zip(existing["ids"], existing["metadatas"])
+            }
+            stale = [
+                i for i, memory_id in enumerate(page["ids"])
+                if memory_id not in target_updated
+                or target_updated[memory_id] != (page["metadatas"][i] or {}).get("updated_at")
+            ]
+            if stale:
+                self._copy(
+                    target,
+                    [page["ids"][i] for i in stale],
+                    [page["documents"][i] for i in stale],
+                    [page["metadatas"][i] for i in stale],
+                    hold_barrier=hold_barrier,
+                )
+            copied += len(stale)
+            offset += len(page["ids"])
+
+        vectors = self._target_vectors(target)
+        removed = 0
+        offset = 0
+        while True:
+            if hold_barrier:
+                set_write_barrier(True)
+            page = target.get(limit=self.page_size, offset=offset, include=["metadatas"])
+            if not page["ids"]:
+                break
+            present = set(source.get(ids=page["ids"], include=[])["ids"])
+            deleted = [i for i, memory_id in enumerate(page["ids"]) if memory_id not in present]
+            if deleted:
+                target.delete(ids=[page["ids"][i] for i in deleted])
+                if vectors is not None:
+                    for i in deleted:
+                        vectors.remove((page["metadatas"][i] or {}).get("user_id"), page["ids"][i])
+            removed += len(deleted)
+            # Deleted rows no longer take up offsets
+            offset += len(page["ids"]) - len(deleted)
+        print(f"Catch-up: {copied} memories re-copied, {removed} removed")
+
+    def cutover(self):
+        """
+        Catches up and atomically switches reads and writes to the new collection.
+
+        Writes are held in every process (see set_write_barrier) from just before the
+        last catch-up until the switch, so none is lost in the old collection. Writes
+        already in progress when the barrier is raised are waited for (see write_lock).
+        """
+        if self.state["status"] != "copied":
+            raise RuntimeError("The copy must finish before cutover")
+        # Most of the drift is copied while writes are still accepted, keeping the barrier short
+        self.catch_up()
+        set_write_barrier(True)
+        try:
+            with write_lock(exclusive=True):
+                self.catch_up(hold_barrier=True)
+                set_active_collection_name(self.state["target"])
+        finally:
+            set_write_barrier(False)
+        self.state["status"] = "done"
+        self.state["finished_at"] = datetime.now().isoformat()
+        self._save_checkpoint()
+        print(f"Cutover complete: '{self.state['target']}' is now the active collection")
+
+    def run(self, cutover=True):
+        self.copy_all()
+        if cutover:
+            self.cutover()
+
+    def run_in_background(self, cutover=True):
+        """Runs the migration in a daemon thread and returns the thread."""
+        thread = threading.Thread(target=self.run, kwargs={"cutover": cutover}, daemon=True)
+        thread.start()
+        return thread
+
+
+def partition_memories(memory_db, strategy, page_size=500):
+    """
+    Copies the shared collection into partition collections without re-embedding.
+
+    Progress is checkpointed per page; once done, set MEMORY_PARTITIONING to
+    `strategy` so reads and writes go to the partitions.
+    """
+    path = os.path.join(settings.CUSTOM_RAG_PATH, "partition_checkpoint.json")
+    source = memory_db.collection
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        state = None
+    if not state or state["source"] != source.name or state["strategy"] != strategy:
+        state = {"source": source.name, "strategy": strategy, "offset": 0}
+
+    total = source.count()
+    started = time.monotonic()
+    moved = 0
+    while True:
+        page = source.get(
+            limit=page_size,
+            offset=state["offset"],
+            include=["documents", "metadatas", "embeddings"],
+        )
+        if not page["ids"]:
+            break
+
+        groups = {}
+        for i, metadata in enumerate(page["metadatas"]):
+            groups.setdefault((metadata or {}).get("user_id"), []).append(i)
+        for user_id, indexes in groups.items():
+            memory_db.collection_for(user_id, strategy).upsert(
+                ids=[page["ids"][i] for i in indexes],
+                embeddings=[page["embeddings"][i] for i in indexes],
+                documents=[page["documents"][i] for i in indexes],
+                metadatas=[page["metadatas"][i] for i in indexes],
+            )
+
+        state["offset"] += len(page["ids"])
+        moved += len(page["ids"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+        elapsed = time.monotonic() - started
+        print(f"Partitioned {state['offset']}/{total} memories  {moved / elapsed if elapsed else 0:.0f} memories/s")
+
+    print(f"Done: set MEMORY_PARTITIONING={strategy} to serve memories from the partitions")
+
+
+def memory_collections(memory_db):
+    """The active collection and every partition collection derived from it."""
+    base = memory_db.collection
+    collections = [base]
+    for entry in memory_db.client.list_collections():
+        # Older Chroma versions return Collection objects, newer ones only names
+        collection = entry if hasattr(entry, "metadata") else memory_db.client.get_collection(entry)
+        if (collection.metadata or {}).get("partition_of") == base.name:
+            collections.append(collection)
+    return collections
+
+
+def backfill_metadata(memory_db, page_size=500):
+    """
+    Adds numeric timestamps and normalized categories to memories stored before
+    they existed, and rebuilds the per-user category counts from scratch.
+
+    Memories left in the shared collection after partitioning are backfilled too,
+    but only the collection serving each user under MEMORY_PARTITIONING is counted.
+    """
+    counts = {}
+    base_name = memory_db.collection.name
+    for collection in memory_collections(memory_db):
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, include=["metadatas"])
+            if not page["ids"]:
+                break
+            metadatas = [with_filter_fields(dict(metadata or {})) for metadata in page["metadatas"]]
+            collection.update(ids=page["ids"], metadatas=metadatas)
+            for metadata in metadatas:
+                user_id = metadata.get("user_id")
+                if user_id and (memory_db.partition_name(user_id) or base_name) == collection.name:
+                    key = (metadata["user_id"], metadata["category_key"])
+                    counts[key] = counts.get(key, 0) + 1
+            offset += len(page["ids"])
+        print(f"Backfilled {offset} memories in '{collection.name}'")
+
+    reset_category_counts(counts)
+    print(f"Rebuilt {len(counts)} category counts")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--provider", default=settings.EMBEDDING_PROVIDER, help="Embedding provider of the new collection")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL, help="Embedding model of the new collection")
+    parser.add_argument("--page-size", type=int, default=500, help="Memories read per page")
+    parser.add_argument("--batch-size", type=int, default=64, help="Texts per embedding call")
+    parser.add_argument("--rpm", type=int, default=60, help="Maximum embedding calls per minute")
+    parser.add_argument("--cutover", action="store_true", help="Switch to the new collection when the copy completes")
+    parser.add_argument("--partition", choices=["user", "bucket"], help="Move the shared collection into partitions instead")
+    parser.add_argument("--backfill-metadata", action="store_true", help="Add filter fields to old memories and rebuild category counts")
+    args = parser.parse_args()
+    # The memory store's bookkeeping tables are created by the schema upgrade
+    from .migrations import upgrade_schema
+    upgrade_schema()
+
+    if args.backfill_metadata:
+        backfill_metadata(get_memory_db(), page_size=args.page_size)
+        return
+
+    if args.partition:
+        partition_memories(get_memory_db(), args.partition, page_size=args.page_size)
+        return
+
+    if settings.MEMORY_PARTITIONING != "shared":
+        print(f"Re-embedding only supports the shared collection (MEMORY_PARTITIONING={settings.MEMORY_PARTITIONING})")
+        return
+    provider = get_embedding_provider(provider=args.provider, model=args.model)
+    migration = ReembeddingMigration(
+        get_memory_db().client,
+        provider,
+        page_size=args.page_size,
+        batch_size=args.batch_size,
+        requests_per_minute=args.rpm,
+    )
+    migration.run(cutover=args.cutover)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+import json
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, delete, or_, select, update
+from .config import settings
+from .database import SessionLocal
+from .memory_index import tokenize
+from . import models
+
+# Lease owner of this process's worker
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Rows waiting to be indexed, including those modified while a worker held them
+WAITING = (None, "changed")
+
+# Worker thread of this process, started on first use
+_worker = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def enqueue_memory(memory_id, content, metadata, user_id):
+    """
+    Durably appends a memory to the write-behind queue and returns immediately.
+
+    The memory is embedded and written to Chroma by the background worker.
+    """
+    enqueue_memories([{"id": memory_id, "content": content, "metadata": metadata, "user_id": user_id}])
+
+
+def enqueue_memories(memories):
+    """Appends several memories (dicts like MemoryDB.add_memories takes) in one transaction."""
+    db = SessionLocal()
+    try:
+        now = datetime.now()
+        db.add_all([
+            models.PendingMemory(
+                memory_id=memory["id"],
+                user_id=str(memory["user_id"]),
+                content=memory["content"],
+                metadata_json=json.dumps(memory.get("metadata") or {}),
+                next_attempt_at=now
+            )
+            for memory in memories
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    start_worker()
+    _wakeup.set()
+
+
+def get_pending_memories(user_id):
+    """Returns the memories of a user that are still waiting to be indexed."""
+    db = SessionLocal()
+    try:
+        rows = db.query(models.PendingMemory)\
+            .filter(models.PendingMemory.user_id == str(user_id), _waiting())\
+            .order_by(models.PendingMemory.id)\
+            .all()
+        return [
+            {"id": row.memory_id, "content": row.content, "metadata": json.loads(row.metadata_json or "{}")}
+            for row in rows
+        ]
+    finally:
+        db.close()
+
+
+def _waiting():
+    return or_(models.PendingMemory.status.is_(None), models.PendingMemory.status == "changed")
+
+
+def update_pending_memory(memory_id, user_id, content, metadata):
+    """
+    Replaces the content of a memory that is still waiting to be indexed.
+
+    A memory being indexed right now is marked "changed", so the worker indexes
+    it again with the new content instead of removing it from the queue.
+
+    Returns:
+        True if the memory was in the queue
+    """
+    db = SessionLocal()
+    try:
+        row = db.query(models.PendingMemory)\
+            .filter(
+                models.PendingMemory.memory_id == memory_id,
+                models.PendingMemory.user_id == str(user_id),
+                _waiting()
+            )\
+            .first()
+        if not row:
+            return False
+        row.content = content
+        row.metadata_json = json.dumps(metadata or {})
+        if row.lease_owner:
+            row.status = "changed"
+        else:
+            row.next_attempt_at = datetime.now()
+        db.commit()
+    finally:
+        db.close()
+    _wakeup.set()
+    return True
+
+
+def delete_pending_memory(memory_id, user_id):
+    """
+    Removes a memory that is still waiting to be indexed.
+
+    A memory being indexed right now is left as a "deleted" tombstone instead, and
+    the worker removes it from Chroma once the write in flight is done, so it
+    doesn't come back.
+
+    Returns:
+        True if the memory was in the queue
+    """
+    db = SessionLocal()
+    try:
+        row = db.query(models.PendingMemory)\
+            .filter(
+                models.PendingMemory.memory_id == memory_id,
+                models.PendingMemory.user_id == str(user_id),
+                _waiting()
+            )\
+            .first()
+        if not row:
+            return False
+        if row.lease_owner:
+            row.status = "deleted"
+        else:
+            db.delete(row)
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def delete_pending_document(parent_id, user_id):
+    """
+    Removes the chunks of a document that are still waiting to be indexed, like
+    delete_pending_memory does for one memory.
+
+    Returns:
+        Number of chunks that were in the queue
+    """
+    db = SessionLocal()
+    try:
+        def chunks():
+            return db.query(models.PendingMemory).filter(
+                models.PendingMemory.memory_id.startswith(f"{parent_id}_c", autoescape=True),
+                models.PendingMemory.user_id == str(user_id),
+                _waiting()
+            )
+        # Unleased rows go first: a row the worker claims in between is then left as a tombstone
+        deleted = chunks().filter(models.PendingMemory.lease_owner.is_(None)).delete(synchronize_session=False)
+        deleted += chunks().filter(models.PendingMemory.lease_owner.isnot(None))\
+            .update({models.PendingMemory.status: "deleted"}, synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+def search_pending_memories(user_id, query):
+    """
+    Keyword match of a query against the pending memories of a user.
+
+    Returns a list of (memory, distance) where distance is the fraction of query
+    tokens missing from the memory, best matches first.
+    """
+    query_tokens = set(tokenize(query))
+    if not query_tokens:
+        return []
+
+    matches = []
+    for memory in get_pending_memories(user_id):
+        overlap = len(query_tokens & set(tokenize(memory["content"])))
+        if overlap:
+            matches.append((memory, 1.0 - overlap / len(query_tokens)))
+    matches.sort(key=lambda match: match[1])
+    return matches
+
+
+def _backoff(attempts):
+    return timedelta(seconds=min(2 ** attempts, settings.MEMORY_QUEUE_MAX_BACKOFF_SECONDS))
+
+
+def claim_pending(db, owner, now, limit):
+    """
+    Atomically leases up to `limit` due rows of the queue to a worker.
+
+    The conditional UPDATE ... RETURNING only takes rows whose retry time or lease
+    has passed, so the workers of several processes never embed the same batch.
+    Rows of a worker that crashed become claimable again when the lease expires.
+
+    Returns:
+        The claimed rows, oldest first
+    """
+    claimable = and_(
+        models.PendingMemory.next_attempt_at <= now,
+        or_(_waiting(), models.PendingMemory.status == "deleted")
+    )
+    candidates = select(models.PendingMemory.id)\
+        .where(claimable)\
+        .order_by(models.PendingMemory.id)\
+        .limit(limit)\
+        .scalar_subquery()
+    rows = db.execute(
+        update(models.PendingMemory)
+        .where(models.PendingMemory.id.in_(candidates), claimable)
+        .values(
+            lease_owner=owner,
+            next_attempt_at=now + timedelta(seconds=settings.MEMORY_QUEUE_LEASE_SECONDS),
+            # The claim takes the latest content, later changes are flagged again
+            status=case((models.PendingMemory.status == "changed", None), else_=models.PendingMemory.status)
+        )
+        .returning(
+            models.PendingMemory.id,
+            models.PendingMemory.memory_id,
+            models.PendingMemory.user_id,
+            models.PendingMemory.content,
+            models.PendingMemory.metadata_json,
+            models.PendingMemory.attempts,
+            models.PendingMemory.status
+        )
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return sorted(rows, key=lambda row: row.id)
+
+
+def _index(memory_db, rows):
+    """
+    Writes claimed rows to Chroma.
+
+    A failing batch is retried one memory at a time, so a single bad memory
+    doesn't hold back the others.
+
+    Returns:
+        (IDs of the rows written, list of (row, error) that failed)
+    """
+    memories = [
+        {
+            "id": row.memory_id,
+            "content": row.content,
+            "metadata": json.loads(row.metadata_json or "{}"),
+            "user_id": row.user_id
+        }
+        for row in rows
+    ]
+    try:
+        memory_db.add_memories(memories)
+        return [row.id for row in rows], []
+    except Exception as e:
+        print(f"Error indexing {len(rows)} pending memories: {e}")
+        if len(rows) == 1:
+            return [], [(rows[0], e)]
+
+    done, failed = [], []
+    for row, memory in zip(rows, memories):
+        try:
+            memory_db.add_memories([memory])
+            done.append(row.id)
+        except Exception as e:
+            print(f"Error indexing pending memory {row.memory_id}: {e}")
+            failed.append((row, e))
+    return done, failed
+
+
+def drain_once(batch_size=None, owner=None):
+    """
+    Embeds and indexes one batch of due pending memories.
+
+    The batch is leased to this worker (see claim_pending), and memories deleted
+    while waiting are removed from Chroma in case a write was in flight. Failed
+    memories are rescheduled with exponential backoff and dead-lettered after
+    MEMORY_QUEUE_MAX_ATTEMPTS attempts.
+
+    Returns:
+        The number of rows processed
+    """
+    from .memory_db import get_memory_db
+
+    batch_size = batch_size or settings.MEMORY_QUEUE_BATCH_SIZE
+    owner = owner or WORKER_ID
+    db = SessionLocal()
+    try:
+        rows = claim_pending(db, owner, datetime.now(), batch_size)
+        if not rows:
+            return 0
+
+        memory_db = get_memory_db()
+        done, failed = _index(memory_db, [row for row in rows if row.status is None])
+        removed = []
+        for row in rows:
+            if row.status != "deleted":
+                continue
+            if memory_db.get_memory(row.memory_id, row.user_id) and not memory_db.delete_memory(row.memory_id, row.user_id):
+                failed.append((row, RuntimeError("Failed to delete the memory")))
+            else:
+                removed.append(row.id)
+
+        table = models.PendingMemory
+        # Rows changed or deleted since the claim stay queued and are released for another pass
+        db.execute(
+            delete(table)
+            .where(table.id.in_(done), table.lease_owner == owner, table.status.is_(None))
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(
+            delete(table)
+            .where(table.id.in_(removed), table.lease_owner == owner)
+            .execution_options(synchronize_session=False)
+        )
+        now = datetime.now()
+        db.execute(
+            update(table)
+            .where(table.id.in_(done), table.lease_owner == owner)
+            .values(lease_owner=None, next_attempt_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        for row, error in failed:
+            attempts = row.attempts + 1
+            dead = attempts >= settings.MEMORY_QUEUE_MAX_ATTEMPTS
+            if dead:
+                print(f"Dead-lettering pending memory {row.memory_id} after {attempts} attempts: {error}")
+            db.execute(
+                update(table)
+                .where(table.id == row.id, table.lease_owner == owner)
+                .values(
+                    attempts=attempts,
+                    next_attempt_at=now + _backoff(attempts),
+                    last_error=str(error)[:500],
+                    lease_owner=None,
+                    status=case((table.status.is_(None), "dead"), else_=table.status) if dead else table.status
+                )
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+        return len(done) + len(removed)
+    finally:
+        db.close()
+
+
+def _run_worker():
+    while True:
+        try:
+            # Keep draining while full batches come back
+            while drain_once() >= settings.MEMORY_QUEUE_BATCH_SIZE:
+                pass
+        except Exception as e:
+            print(f"Memory queue worker error: {e}")
+        _wakeup.wait(timeout=settings.MEMORY_QUEUE_POLL_SECONDS)
+        _wakeup.clear()
+
+
+def start_worker():
+    """Starts the background worker of this process if it is not running yet."""
+    global _worker
+    if _worker is not None:
+        return _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run_worker, name="memory-queue-worker", daemon=True)
+            _worker.start()
+    return _worker
@@ -1,5 +1,12 @@
 from google.genai import types
 from .memory_db import memory_db
+from .memory_queue import (
+    enqueue_memory, search_pending_memories, get_pending_memories, update_pending_memory, delete_pending_memory,
+    delete_pending_document
+)
+from .memory_facets import normalize_category, get_category_counts
+from .memory_ingest import ingest_text
+from .config import settings
 from .database import SessionLocal
 from .dependencies import get_from_user_id
 from datetime import datetime
@@ -39,6 +46,18 @@ retrieve_memory_declaration = types.FunctionDeclaration(
                 type=types.Type.INTEGER,
                 description="Maximum number of results to return."
             ),
+            "category": types.Schema(
+                type=types.Type.STRING,
+                description="Only search memories of this category (e.g., 'password')."
+            ),
+            "created_after": types.Schema(
+                type=types.Type.STRING,
+                description="Only search memories saved at or after this date and time (ISO 8601 format, e.g. 2024-12-25T00:00:00)."
+            ),
+            "created_before": types.Schema(
+                type=types.Type.STRING,
+                description="Only search memories saved at or before this date and time (ISO 8601 format)."
+            ),
         },
         required=["query"],
     ),
@@ -84,13 +103,29 @@ delete_memory_declaration = types.FunctionDeclaration(
 
 get_user_memories_declaration = types.FunctionDeclaration(
     name="get_user_memories",
-    description="Retrieve all memories for a user. Use this tool when the user wants a complete listing of their stored information.",
+    description="Retrieve a user's memories one page at a time, optionally only those of a category or saved in a time range (e.g. 'show my passwords', 'what did I save last week'). Use this tool when the user wants a listing of their stored information. If the result contains a next_cursor, more memories are available: call again with that cursor only if the user wants to see more.",
     parameters=types.Schema(
         type=types.Type.OBJECT,
         properties={
             "limit": types.Schema(
                 type=types.Type.INTEGER,
-                description="Maximum number of memories to return."
+                description="Maximum number of memories in the page (default 50)."
+            ),
+            "cursor": types.Schema(
+                type=types.Type.STRING,
+                description="The next_cursor returned by the previous call, to get the following page."
+            ),
+            "category": types.Schema(
+                type=types.Type.STRING,
+                description="Only return memories of this category (e.g., 'password')."
+            ),
+            "created_after": types.Schema(
+                type=types.Type.STRING,
+                description="Only return memories saved at or after this date and time (ISO 8601 format, e.g. 2024-12-25T00:00:00)."
+            ),
+            "created_before": types.Schema(
+                type=types.Type.STRING,
+                description="Only return memories saved at or before this date and time (ISO 8601 format)."
             ),
         },
         required=[],
@@ -106,13 +141,135 @@ delete_memories_batch_declaration = types.FunctionDeclaration(
             "memory_ids": types.Schema(
                 type=types.Type.ARRAY,
                 items=types.Schema(type=types.Type.STRING),
-                description="List of memory IDs to delete."
+                description="List of memory IDs (or document IDs of stored documents) to delete."
             ),
         },
         required=["memory_ids"],
     ),
 )
 
+# --- Helper functions ---
+
+def _parse_filters(created_after, created_before):
+    """Parses ISO 8601 filter bounds, returning (created_after, created_before) or raising ValueError."""
+    return (
+        datetime.fromisoformat(created_after) if created_after else None,
+        datetime.fromisoformat(created_before) if created_before else None
+    )
+
+def _local_naive(value):
+    """Converts an aware datetime to naive local time, so it compares with the naive timestamps of metadata."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+def _matches_filters(metadata, created_after=None, created_before=None, category=None):
+    """Applies the memory filters to metadata of a memory that is not indexed yet."""
+    if category and normalize_category(metadata.get("category")) != normalize_category(category):
+        return False
+    created_at = _local_naive(datetime.fromisoformat(metadata.get("created_at", datetime.now().isoformat())))
+    created_after, created_before = _local_naive(created_after), _local_naive(created_before)
+    if created_after and created_at < created_after:
+        return False
+    if created_before and created_at > created_before:
+        return False
+    return True
+
+def _pending_distances(query, memories):
+    """
+    Cosine distances of pending memories to the query, on the scale of search_memory's
+    distances. The memories are embedded with the query in one call; None if that fails.
+    """
+    embeddings = memory_db.create_embeddings([query] + [memory["content"] for memory in memories])
+    if not embeddings:
+        return None
+    query_vector = embeddings[0]
+    query_norm = sum(value * value for value in query_vector) ** 0.5
+    distances = []
+    for vector in embeddings[1:]:
+        norms = (query_norm * sum(value * value for value in vector) ** 0.5) or 1.0
+        distances.append(1.0 - sum(a * b for a, b in zip(query_vector, vector)) / norms)
+    return distances
+
+def _search_with_pending(user_id, query, limit=3, where_condition=None,
+                         created_after=None, created_before=None, category=None):
+    """
+    search_memory results merged with the matching memories still in the write-behind queue.
+
+    Pending memories are ranked by their vector distance to the query, like the
+    indexed ones. If they cannot be embedded, only those containing every query
+    token go first, the others come after the indexed results.
+
+    Returns a dictionary with documents, ids, distances and metadatas.
+    """
+    results = memory_db.search_memory(
+        query=query,
+        user_id=user_id,
+        limit=limit,
+        where_condition=where_condition,
+        created_after=created_after,
+        created_before=created_before,
+        category=category
+    )
+    hits = [
+        {"document": document, "id": memory_id, "distance": distance, "metadata": metadata}
+        for document, memory_id, distance, metadata in zip(
+            results["documents"], results["ids"], results["distances"], results["metadatas"]
+        )
+    ]
+    pending = [
+        (memory, missing) for memory, missing in search_pending_memories(user_id, query)
+        if memory["id"] not in results["ids"] and _matches_filters(memory["metadata"], created_after, created_before, category)
+    ]
+    if pending:
+        distances = _pending_distances(query, [memory for memory, _ in pending])
+        first, last = [], []
+        for i, (memory, missing) in enumerate(pending):
+            hit = {"document": memory["content"], "id": memory["id"], "metadata": memory["metadata"]}
+            if distances is not None:
+                hit["distance"] = distances[i]
+                # Before the first indexed hit that is further from the query, keeping their order
+                position = next((j for j, other in enumerate(hits) if other["distance"] > hit["distance"]), len(hits))
+                hits.insert(position, hit)
+            elif missing == 0:
+                hit["distance"] = 0.0
+                first.append(hit)
+            else:
+                hit["distance"] = missing
+                last.append(hit)
+        hits = first + hits + last
+    hits = hits[:limit]
+    return {
+        "documents": [hit["document"] for hit in hits],
+        "ids": [hit["id"] for hit in hits],
+        "distances": [hit["distance"] for hit in hits],
+        "metadatas": [hit["metadata"] for hit in hits]
+    }
+
+def _collapse_documents(results):
+    """Keeps only the best hit of each chunked document, so its chunks don't look like separate matches."""
+    collapsed = {"documents": [], "ids": [], "distances": [], "metadatas": []}
+    seen_parents = set()
+    for document, memory_id, distance, metadata in zip(
+        results["documents"], results["ids"], results["distances"], results["metadatas"]
+    ):
+        parent_id = (metadata or {}).get("parent_id")
+        if parent_id:
+            if parent_id in seen_parents:
+                continue
+            seen_parents.add(parent_id)
+        collapsed["documents"].append(document)
+        collapsed["ids"].append(memory_id)
+        collapsed["distances"].append(distance)
+        collapsed["metadatas"].append(metadata)
+    return collapsed
+
+def _delete_document(parent_id, user_id):
+    """Deletes every chunk of a document, indexed or still queued. Returns True if any existed."""
+    # The queue goes first, so the worker doesn't index a chunk again
+    deleted_pending = delete_pending_document(parent_id, user_id)
+    return bool(memory_db.delete_document(parent_id, user_id) or deleted_pending)
+
 # --- Tool implementations ---
 def delete_memories_batch_tool(user_id: int | str, memory_ids: list) -> dict:
     """Delete multiple memories by their IDs."""
@@ -140,6 +297,24 @@ def delete_memories_batch_tool(user_id: int | str, memory_ids: list) -> dict:
             # Check if the memory exists
             memory = memory_db.get_memory(memory_id)
             
+            # Documents are deleted as a whole, by their document ID or the ID of any chunk
+            parent_id = memory["metadata"].get("parent_id") if memory else memory_id
+            if parent_id and (not memory or memory["metadata"].get("user_id") == str(user.id)):
+                document = memory_db.get_document(parent_id, user.id, max_chars=settings.MEMORY_PARENT_MAX_CHARS)
+                if _delete_document(parent_id, user.id):
+                    results["successful"].append({
+                        "id": parent_id,
+                        "content": (document["content"] or document["title"]) if document else "",
+                        "metadata": {
+                            "created_at": memory["metadata"].get("created_at", "unknown") if memory else "unknown",
+                            "category": memory["metadata"].get("category", "") if memory else ""
+                        }
+                    })
+                    continue
+                if memory:
+                    results["failed"].append(memory_id)
+                    continue
+            
             if not memory:
                 results["not_found"].append(memory_id)
                 continue
@@ -211,6 +386,40 @@ def store_memory_tool(user_id: int | str, content: str, category: str = None) ->
         if category:
             metadata["category"] = category
         
+        if len(content) > settings.MEMORY_CHUNK_CHARS:
+            # Long texts are split into overlapping chunks that all point to one parent document
+            try:
+                document = ingest_text(
+                    memory_db,
+                    user.id,
+                    content,
+                    category=category,
+                    write_behind=settings.MEMORY_WRITE_BEHIND
+                )
+            except Exception as e:
+                # The chunks already written were deleted by ingest_text
+                print(f"Error storing document: {e}")
+                return {
+                    "status": "error",
+                    "message": "Failed to store the information"
+                }
+            return {
+                "status": "success",
+                "message": f"I've stored the document '{document['title']}' ({document['chunks']} parts)",
+                # Not a memory ID: delete_memories_batch_tool and retrieval results refer to the whole document by it
+                "document_id": document["parent_id"]
+            }
+        
+        if settings.MEMORY_WRITE_BEHIND:
+            # Acknowledge right away, the queue worker embeds and indexes the memory
+            memory_id = memory_db.make_memory_id(content, user.id)
+            enqueue_memory(memory_id, content, metadata, user.id)
+            return {
+                "status": "success",
+                "message": f"I've stored: {content}",
+                "memory_id": memory_id
+            }
+        
         # Use memory_db with the correct user ID
         memory_id = memory_db.add_memory(
             content=content, 
@@ -232,10 +441,16 @@ def store_memory_tool(user_id: int | str, content: str, category: str = None) ->
     finally:
         db.close()
 
-def retrieve_memory_tool(user_id: int | str, query: str, limit: int = 3) -> dict:
+def retrieve_memory_tool(user_id: int | str, query: str, limit: int = 3, category: str = None,
+                         created_after: str = None, created_before: str = None) -> dict:
     """Search for previously stored information."""
     print(f"Searching for user {user_id}: {query}")
     
+    try:
+        after, before = _parse_filters(created_after, created_before)
+    except ValueError:
+        return {"status": "error", "message": "Invalid date format. Use ISO 8601 (YYYY-MM-DDTHH:MM:SS)."}
+    
     # Get a DB session
     db = SessionLocal()
     try:
@@ -249,37 +464,46 @@ def retrieve_memory_tool(user_id: int | str, query: str, limit: int = 3) -> dict
         
         where_condition = {"user_id": str(user.id)}
         
-        # Search in the database with the correct user ID
-        results = memory_db.search_memory(
-            query=query, 
-            user_id=user.id, 
-            limit=limit,
-            where_condition=where_condition
-        )
+        # Search with the correct user ID, including memories stored moments ago that are not indexed yet
+        results = _collapse_documents(_search_with_pending(
+            user.id, query, limit, where_condition, created_after=after, created_before=before, category=category
+        ))
+        documents, memory_ids, metadatas = results["documents"], results["ids"], results["metadatas"]
         
-        if not results["documents"]:
+        if not documents:
             return {
                 "status": "not_found",
                 "message": "I couldn't find any information related to your request."
             }
         
+        # Chunks of a document are returned as the whole parent document when it is short enough
+        for i, metadata in enumerate(metadatas):
+            parent_id = (metadata or {}).get("parent_id")
+            if parent_id:
+                parent = memory_db.get_document(parent_id, user.id, max_chars=settings.MEMORY_PARENT_MAX_CHARS)
+                if parent and not parent["truncated"]:
+                    documents[i] = parent["content"]
+        
         # Extract metadata
         memory_metadatas = []
-        for idx, memory_id in enumerate(results["ids"]):
-            memory = memory_db.get_memory(memory_id)
-            if memory:
-                memory_metadatas.append({
-                    "created_at": memory["metadata"].get("created_at", "unknown"),
-                    "updated_at": memory["metadata"].get("updated_at", "unknown"),
-                    "category": memory["metadata"].get("category", "")
-                })
-            else:
+        for metadata in metadatas[:limit]:
+            if not metadata:
                 memory_metadatas.append({})
+                continue
+            memory_metadata = {
+                "created_at": metadata.get("created_at", "unknown"),
+                "updated_at": metadata.get("updated_at", "unknown"),
+                "category": metadata.get("category", "")
+            }
+            if metadata.get("parent_id"):
+                memory_metadata["document_id"] = metadata["parent_id"]
+                memory_metadata["document_title"] = metadata.get("parent_title", "")
+            memory_metadatas.append(memory_metadata)
         
         return {
             "status": "success",
-            "results": results["documents"],
-            "memory_ids": results["ids"],
+            "results": documents[:limit],
+            "memory_ids": memory_ids[:limit],
             "metadata": memory_metadatas
         }
     finally:
@@ -300,12 +524,8 @@ def update_memory_tool(user_id: int | str, query: str, new_content: str) -> dict
                 "message": "User not found or invalid"
             }
         
-        # Search for results to check ambiguity
-        results = memory_db.search_memory(
-            query=query, 
-            user_id=user.id, 
-            limit=3
-        )
+        # Search for results to check ambiguity, including memories not indexed yet
+        results = _collapse_documents(_search_with_pending(user.id, query, limit=3))
         
         if not results["documents"]:
             return {
@@ -326,23 +546,62 @@ def update_memory_tool(user_id: int | str, query: str, new_content: str) -> dict
         memory_id = results["ids"][0]
         old_content = results["documents"][0]
         
+        parent_id = (results["metadatas"][0] or {}).get("parent_id")
+        if parent_id:
+            # A chunk stands for its document: the new content replaces all of it
+            old_document = memory_db.get_document(parent_id, user.id, max_chars=settings.MEMORY_PARENT_MAX_CHARS)
+            if old_document and not old_document["truncated"]:
+                old_content = old_document["content"]
+            try:
+                document = ingest_text(
+                    memory_db,
+                    user.id,
+                    new_content,
+                    title=results["metadatas"][0].get("parent_title"),
+                    category=results["metadatas"][0].get("category"),
+                    write_behind=settings.MEMORY_WRITE_BEHIND
+                )
+            except Exception as e:
+                # The old document is kept, the new chunks already written were deleted by ingest_text
+                print(f"Error updating document: {e}")
+                document = {"chunks": 0}
+            if not document["chunks"]:
+                return {
+                    "status": "error",
+                    "message": "Failed to update the information."
+                }
+            _delete_document(parent_id, user.id)
+            return {
+                "status": "success",
+                "message": f"I've updated the document '{document['title']}'.",
+                "old_content": old_content,
+                "new_content": new_content,
+                "document_id": document["parent_id"],
+                "updated_at": datetime.now().isoformat()
+            }
+        
         # Get existing metadata
         existing_memory = memory_db.get_memory(memory_id)
-        existing_metadata = existing_memory["metadata"] if existing_memory else {}
+        existing_metadata = existing_memory["metadata"] if existing_memory else (results["metadatas"][0] or {})
         
         # Update metadata
         updated_metadata = existing_metadata.copy()
         updated_metadata["updated_at"] = datetime.now().isoformat()
         
+        # A memory still in the write-behind queue is updated there, so the worker indexes the new content
+        updated_pending = update_pending_memory(memory_id, user.id, new_content, updated_metadata)
+        
         # Update the database with the correct user ID
-        result = memory_db.update_memory(
-            memory_id=memory_id, 
-            new_content=new_content,
-            metadata=updated_metadata,
-            user_id=user.id
-        )
+        result = None
+        if existing_memory:
+            result = memory_db.update_memory(
+                memory_id=memory_id, 
+                new_content=new_content,
+                metadata=updated_metadata,
+                user_id=user.id
+            )
         
-        if not result:
+        if not (result or updated_pending):
             return {
                 "status": "error",
                 "message": "Failed to update the information."
@@ -376,13 +635,8 @@ def delete_memory_tool(user_id: int | str, query: str, forceDelete: bool = False
         # Prepare additional filters
         where_condition = {"user_id": str(user.id)}
         
-        # Search for results to check for ambiguity
-        results = memory_db.search_memory(
-            query=query, 
-            user_id=user.id, 
-            limit=3,
-            where_condition=where_condition
-        )
+        # Search for results to check for ambiguity, including memories not indexed yet
+        results = _collapse_documents(_search_with_pending(user.id, query, limit=3, where_condition=where_condition))
         
         print("Results:", results)
         
@@ -407,20 +661,42 @@ def delete_memory_tool(user_id: int | str, query: str, forceDelete: bool = False
         memory_id = results["ids"][0]
         content = results["documents"][0]
         
+        parent_id = (results["metadatas"][0] or {}).get("parent_id")
+        if parent_id:
+            # A chunk stands for its document, which is deleted with all its chunks
+            metadata = results["metadatas"][0]
+            if not _delete_document(parent_id, user.id):
+                return {
+                    "status": "error",
+                    "message": "Failed to delete the information."
+                }
+            return {
+                "status": "success",
+                "message": f"I've deleted the document '{metadata.get('parent_title', '')}'",
+                "metadata": {
+                    "created_at": metadata.get("created_at", "unknown"),
+                    "category": metadata.get("category", "")
+                }
+            }
+        
         # Get metadata before deletion
         memory = memory_db.get_memory(memory_id)
         print("Memory:", memory)
-        metadata = memory["metadata"] if memory else {}
+        metadata = memory["metadata"] if memory else (results["metadatas"][0] or {})
         print("Metadata:", metadata)
+        # Drop it from the write-behind queue first, so the worker doesn't index it again
+        deleted_pending = delete_pending_memory(memory_id, user.id)
         # Delete from database with the correct user ID
-        result = memory_db.delete_memory(
-            memory_id=memory_id, 
-            user_id=user.id
-        )
+        result = False
+        if memory:
+            result = memory_db.delete_memory(
+                memory_id=memory_id, 
+                user_id=user.id
+            )
         
         print("final Result:", result)
         
-        if not result:
+        if not (result or deleted_pending):
             return {
                 "status": "error",
                 "message": "Failed to delete the information."
@@ -437,10 +713,16 @@ def delete_memory_tool(user_id: int | str, query: str, forceDelete: bool = False
     finally:
         db.close()
 
-def get_user_memories_tool(user_id: int | str, limit: int = 100) -> dict:
-    """Get all memories for a user."""
+def get_user_memories_tool(user_id: int | str, limit: int = 50, cursor: str = None, category: str = None,
+                           created_after: str = None, created_before: str = None) -> dict:
+    """Get one page of memories for a user."""
     print(f"Getting all memories for user {user_id}")
     
+    try:
+        after, before = _parse_filters(created_after, created_before)
+    except ValueError:
+        return {"status": "error", "message": "Invalid date format. Use ISO 8601 (YYYY-MM-DDTHH:MM:SS)."}
+    
     # Get a DB session
     db = SessionLocal()
     try:
@@ -452,11 +734,27 @@ def get_user_memories_tool(user_id: int | str, limit: int = 100) -> dict:
                 "message": "User not found or invalid"
             }
         
-        # Get all memories
-        results = memory_db.get_user_memories(
-            user_id=user.id,
-            limit=limit
-        )
+        # Get one page of memories
+        # Filters are pushed down to Chroma, so only matching memories are read
+        try:
+            results = memory_db.get_user_memories_page(
+                user_id=user.id,
+                page_size=limit,
+                cursor=cursor,
+                created_after=after,
+                created_before=before,
+                category=category
+            )
+        except ValueError:
+            return {"status": "error", "message": "Invalid cursor."}
+        
+        # Include memories still waiting in the write-behind queue (with the first page)
+        pending = get_pending_memories(user.id) if not cursor else []
+        for memory in pending:
+            if memory["id"] not in results["ids"] and _matches_filters(memory["metadata"], after, before, category):
+                results["ids"].append(memory["id"])
+                results["documents"].append(memory["content"])
+                results["metadatas"].append(memory["metadata"])
         
         if not results["documents"]:
             return {
@@ -483,7 +781,10 @@ def get_user_memories_tool(user_id: int | str, limit: int = 100) -> dict:
         return {
             "status": "success",
             "count": len(results["documents"]),
-            "categories": memories_by_category
+            "categories": memories_by_category,
+            "next_cursor": results["next_cursor"],
+            # Totals per category across all of the user's memories, without reading them
+            "category_counts": get_category_counts(user.id)
         }
     finally:
         db.close()
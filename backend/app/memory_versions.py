@@ -0,0 +1,50 @@
+"""
+Per-user version of the memory store, shared by every process.
+
+The keyword and quantized indexes are in-process caches of a user's memories.
+Each write to the collection bumps the user's version, and a cached index is
+reloaded when the version it was built at is no longer current, so writes from
+the API, the Telegram bot and the queue worker are seen by all of them.
+"""
+from sqlalchemy.exc import IntegrityError
+from .database import SessionLocal
+from . import models
+
+def get_user_version(user_id):
+    """Current version of a user's memories (0 before the first write)."""
+    db = SessionLocal()
+    try:
+        version = db.query(models.MemoryIndexVersion.version)\
+            .filter(models.MemoryIndexVersion.user_id == str(user_id))\
+            .scalar()
+        return version or 0
+    finally:
+        db.close()
+
+
+def bump_user_version(user_id):
+    """Records a write to a user's memories and returns the new version."""
+    db = SessionLocal()
+    try:
+        for _ in range(2):
+            # Atomic increment; the row is created by the first write of the user
+            updated = db.query(models.MemoryIndexVersion)\
+                .filter(models.MemoryIndexVersion.user_id == str(user_id))\
+                .update({models.MemoryIndexVersion.version: models.MemoryIndexVersion.version + 1},
+                        synchronize_session=False)
+            if updated:
+                version = db.query(models.MemoryIndexVersion.version)\
+                    .filter(models.MemoryIndexVersion.user_id == str(user_id))\
+                    .scalar()
+                db.commit()
+                return version
+            db.add(models.MemoryIndexVersion(user_id=str(user_id), version=1))
+            try:
+                db.commit()
+                return 1
+            except IntegrityError:
+                # Another process created the row first: increment it
+                db.rollback()
+        raise RuntimeError(f"Could not bump the memory version of user {user_id}")
+    finally:
+        db.close()
@@ -0,0 +1,108 @@
+"""
+In-place schema upgrades of existing databases.
+
+`create_all` only creates missing tables, so columns and indexes added to a
+table after it was first released are applied here. start_all.py runs the
+upgrade once before starting its processes, and the API and scheduler run it
+again at startup. Processes upgrading at the same time take turns on a file
+lock, and every step checks the current schema first, so later ones do nothing.
+"""
+import fcntl
+import os
+import tempfile
+from contextlib import contextmanager
+from sqlalchemy import inspect, text
+from .database import engine, Base
+from . import models  # noqa: F401 - registers the tables on Base
+
+# (table, column, column DDL) added after the table was released
+COLUMNS = [
+    ("reminders", "lease_owner", "VARCHAR"),
+    ("reminders", "lease_expires_at", "DATETIME"),
+    ("reminders", "delivery_status", "VARCHAR"),
+    ("reminders", "delivery_attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ("reminders", "next_attempt_at", "DATETIME"),
+    ("reminders", "last_error", "VARCHAR"),
+    ("reminders", "recurrence", "VARCHAR"),
+    ("reminders", "sent_at", "DATETIME"),
+    ("reminder_archive", "sent_at", "DATETIME"),
+    ("users", "reminder_digest", "BOOLEAN NOT NULL DEFAULT 1"),
+    ("pending_memories", "lease_owner", "VARCHAR"),
+    ("pending_memories", "status", "VARCHAR"),
+]
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_reminders_lease_expires_at ON reminders (lease_expires_at)",
+    "CREATE INDEX IF NOT EXISTS ix_reminders_user_due ON reminders (user_id, due_date)",
+    # Same condition as rendered for `is_active == True`, so SQLite's planner matches it
+    "CREATE INDEX IF NOT EXISTS ix_reminders_active_due ON reminders (is_active, due_date) WHERE is_active = 1",
+]
+
+
+def _rebuild_reminder_archive(bind):
+    """
+    Gives reminder_archive its own primary key.
+
+    Archived rows used to keep their `reminders` ID as primary key. SQLite reuses
+    the IDs of deleted rows, so archiving a later reminder with the same ID failed.
+    The old ID is kept in original_id.
+    """
+    with bind.begin() as connection:
+        if bind.url.get_backend_name() == "sqlite":
+            # pysqlite opens no transaction before DDL: take one, and the write lock, so the rebuild is all or nothing
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        # Checked in the transaction that rebuilds, so a process that comes second does nothing
+        columns = [info["name"] for info in inspect(connection).get_columns("reminder_archive")]
+        if "original_id" in columns:
+            return
+        print("Rebuilding table reminder_archive")
+        copied = [column for column in columns if column != "id" and column in models.ReminderArchive.__table__.c]
+        connection.execute(text("ALTER TABLE reminder_archive RENAME TO reminder_archive_old"))
+        # Indexes move with the renamed table, free their names for the new one
+        for index in models.ReminderArchive.__table__.indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        models.ReminderArchive.__table__.create(connection)
+        connection.execute(text(
+            f"INSERT INTO reminder_archive (original_id, {', '.join(copied)}) "
+            f"SELECT id, {', '.join(copied)} FROM reminder_archive_old ORDER BY id"
+        ))
+        connection.execute(text("DROP TABLE reminder_archive_old"))
+
+
+def _lock_path(bind):
+    """Lock file next to a SQLite database, in the temporary directory otherwise."""
+    database = bind.url.database if bind.url.get_backend_name() == "sqlite" else None
+    if database and database != ":memory:":
+        return f"{os.path.abspath(database)}.migrate.lock"
+    return os.path.join(tempfile.gettempdir(), "memogenius.migrate.lock")
+
+
+@contextmanager
+def _schema_lock(bind):
+    """Serializes schema upgrades of processes sharing a database."""
+    path = _lock_path(bind)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def upgrade_schema(bind=None):
+    """Creates missing tables, rebuilds tables whose key changed, then adds missing columns and indexes."""
+    bind = bind or engine
+    with _schema_lock(bind):
+        Base.metadata.create_all(bind=bind)
+        _rebuild_reminder_archive(bind)
+
+        with bind.begin() as connection:
+            inspector = inspect(connection)
+            existing = {}
+            for table, column, ddl in COLUMNS:
+                if table not in existing:
+                    existing[table] = {info["name"] for info in inspector.get_columns(table)}
+                if column not in existing[table]:
+                    print(f"Adding column {table}.{column}")
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                    existing[table].add(column)
+            for statement in INDEXES:
+                connection.execute(text(statement))
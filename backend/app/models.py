@@ -1,5 +1,5 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -13,6 +13,55 @@ class Reminder(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Scheduler worker currently delivering the reminder, and when its claim runs out
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    # Delivery tracking: None while pending, "sent", or "dead" after a permanent error or too many attempts.
+    # For a recurring reminder it describes the previous occurrence ("skipped" if it ran out of attempts)
+    delivery_status = Column(String, nullable=True)
+    delivery_attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, nullable=True)  # Failed deliveries are not retried before this
+    last_error = Column(String, nullable=True)
+    sent_at = Column(DateTime, nullable=True)  # Last delivery, sent_at - due_date is the delivery lag
+    # RRULE subset (see recurrence.py): due_date moves to the next occurrence after each delivery
+    recurrence = Column(String, nullable=True)
+
+    __table_args__ = (
+        # A user's reminders filtered and sorted by due date (get_reminders)
+        Index("ix_reminders_user_due", "user_id", "due_date"),
+        # The scheduler's due query only ever looks at active reminders: a partial index keeps
+        # its cost independent of how many delivered reminders pile up
+        Index(
+            "ix_reminders_active_due",
+            "is_active", "due_date",
+            sqlite_where=is_active == True,
+            postgresql_where=is_active == True
+        ),
+    )
+
+class ReminderArchive(Base):
+    """Delivered and inactive reminders moved out of `reminders` after the retention window"""
+    __tablename__ = "reminder_archive"
+
+    # SQLite reuses the IDs of deleted reminders, so archived rows need their own
+    id = Column(Integer, primary_key=True)
+    original_id = Column(Integer, nullable=False, index=True)  # ID the reminder had in `reminders`
+    user_id = Column(Integer, nullable=False)
+    text = Column(String)
+    due_date = Column(DateTime)
+    recurrence = Column(String, nullable=True)
+    delivery_status = Column(String, nullable=True)
+    delivery_attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(String, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # History is read per user, most recent first
+        Index("ix_reminder_archive_user_due", "user_id", "due_date"),
+    )
 
 class User(Base):
     __tablename__ = "users"
@@ -22,6 +71,8 @@ class User(Base):
     telegram_id = Column(Integer, unique=True, nullable=True)
     web_token = Column(String, unique=True, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Reminders due close together are delivered as one digest message
+    reminder_digest = Column(Boolean, default=True, nullable=False)
     
 
 class List(Base):
@@ -43,3 +94,37 @@ class ListItem(Base):
     completed = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class PendingMemory(Base):
+    """Write-behind queue of memories acknowledged to the user but not yet embedded and indexed"""
+    __tablename__ = "pending_memories"
+
+    id = Column(Integer, primary_key=True, index=True)
+    memory_id = Column(String, nullable=False)
+    user_id = Column(String, index=True, nullable=False)
+    content = Column(String, nullable=False)
+    metadata_json = Column(String, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, index=True)
+    last_error = Column(String, nullable=True)
+    # Worker holding the row until next_attempt_at, so one process embeds it at a time
+    lease_owner = Column(String, nullable=True)
+    # None while waiting, "deleted" when the memory was deleted meanwhile (removed from Chroma by the worker),
+    # or "dead" after MEMORY_QUEUE_MAX_ATTEMPTS failed attempts
+    status = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class MemoryCategoryCount(Base):
+    """Precomputed number of memories per user and normalized category"""
+    __tablename__ = "memory_category_counts"
+
+    user_id = Column(String, primary_key=True)
+    category = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+class MemoryIndexVersion(Base):
+    """Counter bumped on every write to a user's memories, so in-process indexes of other processes reload"""
+    __tablename__ = "memory_index_versions"
+
+    user_id = Column(String, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
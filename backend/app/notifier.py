@@ -0,0 +1,125 @@
+"""
+Outbound Telegram notifications for the scheduler process.
+
+A bare `telegram.Bot` over one pooled HTTP client, initialized once and reused
+for every delivery, without the handlers of the conversational bot or its
+ChatHandler. Sends are rate limited to stay within Telegram's global and
+per-chat limits.
+"""
+import asyncio
+import time
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, ChatMigrated, Forbidden, InvalidToken, RetryAfter
+from telegram.request import HTTPXRequest
+from .config import settings
+
+
+class TokenBucket:
+    """Token bucket of `rate` tokens per second holding at most `capacity` tokens."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """Takes a token and returns how many seconds to wait before using it."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Tokens may go negative: later callers queue up behind the earlier ones
+        self.tokens -= 1
+        return max(-self.tokens / self.rate, 0.0)
+
+
+class RateLimiter:
+    """Global and per-chat token buckets, e.g. Telegram's 30 messages/s overall and 1/s per chat."""
+
+    def __init__(self, global_rate, per_chat_rate, max_chats=10000):
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.max_chats = max_chats
+        self.chats = {}
+
+    async def acquire(self, chat_id):
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if len(self.chats) >= self.max_chats:
+                # Chats idle long enough to have a full bucket carry no state
+                now = time.monotonic()
+                self.chats = {
+                    chat: chat_bucket for chat, chat_bucket in self.chats.items()
+                    if (now - chat_bucket.updated) * chat_bucket.rate < chat_bucket.capacity
+                }
+            bucket = self.chats[chat_id] = TokenBucket(self.per_chat_rate, 1)
+        await asyncio.sleep(bucket.reserve())
+        await asyncio.sleep(self.global_bucket.reserve())
+
+
+class ReminderNotifier:
+    """Sends reminder messages through one long-lived Bot and HTTP connection pool."""
+
+    def __init__(self, token=None, pool_size=None):
+        pool_size = pool_size or settings.NOTIFIER_POOL_SIZE
+        self.bot = Bot(
+            token=token or settings.TELEGRAM_BOT_TOKEN,
+            request=HTTPXRequest(connection_pool_size=pool_size)
+        )
+        self.limiter = RateLimiter(settings.NOTIFIER_GLOBAL_RATE, settings.NOTIFIER_PER_CHAT_RATE)
+        # More concurrent requests than pooled connections would only time out waiting for one
+        self._slots = asyncio.Semaphore(pool_size)
+        self._initialized = False
+
+    async def initialize(self):
+        if not self._initialized:
+            await self.bot.initialize()
+            self._initialized = True
+
+    async def send(self, chat_id, text):
+        """Sends an HTML message, one HTTP request once the bot is initialized."""
+        await self.initialize()
+        await self.limiter.acquire(chat_id)
+        async with self._slots:
+            return await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.HTML)
+
+    async def shutdown(self):
+        if self._initialized:
+            await self.bot.shutdown()
+            self._initialized = False
+
+
+def classify_error(error):
+    """
+    Tells whether a failed send is worth retrying.
+
+    Returns:
+        (permanent, retry_after) where retry_after is the delay Telegram asked for, if any
+    """
+    if isinstance(error, RetryAfter):
+        retry_after = error.retry_after
+        return False, retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+    # Blocked bot, unknown or migrated chat, malformed message: retrying gives the same answer
+    if isinstance(error, (Forbidden, BadRequest, ChatMigrated, InvalidToken)):
+        return True, None
+    # Timeouts, network and server errors
+    return False, None
+
+
+# Notifier of this process. Its HTTP client is bound to the event loop it was first used in.
+_notifier = None
+
+
+def get_notifier():
+    """Returns the notifier of this process, created on first use."""
+    global _notifier
+    if _notifier is None:
+        _notifier = ReminderNotifier()
+    return _notifier
+
+
+async def shutdown_notifier():
+    """Closes the HTTP client of this process' notifier, if one was created."""
+    if _notifier is not None:
+        await _notifier.shutdown()
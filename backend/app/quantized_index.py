@@ -0,0 +1,328 @@
+import fcntl
+import os
+import threading
+
+import numpy as np
+
+SUPPORTED_DTYPES = ("int8", "float16")
+
+
+def quantize(vectors, dtype):
+    """
+    Compresses L2-normalized float vectors.
+
+    int8 uses symmetric scalar quantization with one scale per vector (4x smaller
+    than float32); float16 halves the size and needs no scale.
+
+    Returns:
+        (codes, scales) where scales is None for float16
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1.0, norms)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+class _UserVectors:
+    """
+    Quantized codes of one user's memories, plus where their full vectors are on disk.
+
+    `full_rows[i]` is the row of memory `ids[i]` in the user's append-only float32
+    file `full-<generation>.f32`.
+    """
+
+    def __init__(self, dimension, dtype):
+        self.dtype = dtype
+        self.ids = []
+        self.rows = {}
+        self.codes = np.empty((0, dimension), dtype=np.int8 if dtype == "int8" else np.float16)
+        self.scales = np.empty((0,), dtype=np.float32)
+        self.full_rows = np.empty((0,), dtype=np.int64)
+        self.generation = 0
+        self.stamp = None  # (inode, mtime, size) of the index file this reflects
+
+    def add(self, memory_ids, vectors, full_rows):
+        # Memory IDs must be unique, see QuantizedVectorIndex.add
+        for memory_id in memory_ids:
+            self.remove(memory_id)
+        codes, scales = quantize(vectors, self.dtype)
+        for memory_id in memory_ids:
+            self.rows[memory_id] = len(self.ids)
+            self.ids.append(memory_id)
+        self.codes = np.vstack([self.codes, codes])
+        if scales is not None:
+            self.scales = np.concatenate([self.scales, scales])
+        self.full_rows = np.concatenate([self.full_rows, np.asarray(full_rows, dtype=np.int64)])
+
+    def remove(self, memory_id):
+        row = self.rows.pop(memory_id, None)
+        if row is None:
+            return
+        # Move the last row into the hole to keep the arrays dense
+        last = len(self.ids) - 1
+        if row != last:
+            moved_id = self.ids[last]
+            self.ids[row] = moved_id
+            self.rows[moved_id] = row
+            self.codes[row] = self.codes[last]
+            self.full_rows[row] = self.full_rows[last]
+            if self.dtype == "int8":
+                self.scales[row] = self.scales[last]
+        self.ids.pop()
+        self.codes = self.codes[:last]
+        self.full_rows = self.full_rows[:last]
+        if self.dtype == "int8":
+            self.scales = self.scales[:last]
+
+    def approximate(self, query, limit):
+        """Positions of the `limit` best codes for a normalized query."""
+        if not self.ids:
+            return np.empty((0,), dtype=np.int64)
+        # Asymmetric scoring: compressed memories against the full-precision query
+        scores = self.codes.astype(np.float32) @ query
+        if self.dtype == "int8":
+            scores *= self.scales
+        limit = min(limit, len(self.ids))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        return top[np.argsort(-scores[top])]
+
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes + self.full_rows.nbytes
+
+
+class QuantizedVectorIndex:
+    """
+    Per-user vector store that keeps only quantized codes in memory.
+
+    It replaces Chroma's float32 vectors (MemoryDB then gives Chroma a one-value
+    placeholder per memory). Each user's vectors live under `path/<user>/`:
+
+        index.npz          IDs, codes and scales, loaded for search
+        full-<gen>.f32     full-precision vectors, append-only, read row by row to
+                           rescore candidates and never loaded as a whole
+
+    Writes take a per-user file lock, start from the files on disk and replace
+    index.npz atomically, so processes sharing `path` never lose each other's
+    writes, and a search reloads a user when index.npz changed since it was read.
+    """
+
+    def __init__(self, path, dimension, dtype="int8"):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported quantization: {dtype}")
+        self.path = path
+        self.dimension = dimension
+        self.dtype = dtype
+        self._users = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id):
+        return "" if user_id is None else str(user_id)
+
+    def _user_dir(self, key):
+        # Hex keeps any user ID a valid, unique directory name
+        return os.path.join(self.path, key.encode("utf-8").hex() or "_")
+
+    def _full_path(self, key, generation):
+        return os.path.join(self._user_dir(key), f"full-{generation}.f32")
+
+    def _stamp(self, key):
+        try:
+            info = os.stat(os.path.join(self._user_dir(key), "index.npz"))
+        except FileNotFoundError:
+            return None
+        return (info.st_ino, info.st_mtime_ns, info.st_size)
+
+    def _load(self, key):
+        vectors = _UserVectors(self.dimension, self.dtype)
+        stamp = self._stamp(key)
+        if stamp is not None:
+            with np.load(os.path.join(self._user_dir(key), "index.npz")) as data:
+                vectors.ids = [str(memory_id) for memory_id in data["ids"]]
+                vectors.codes = data["codes"]
+                vectors.full_rows = data["full_rows"]
+                vectors.generation = int(data["generation"])
+                if self.dtype == "int8":
+                    vectors.scales = data["scales"]
+            vectors.rows = {memory_id: row for row, memory_id in enumerate(vectors.ids)}
+        vectors.stamp = stamp
+        return vectors
+
+    def _get_user_vectors(self, user_id):
+        """The user's codes, reloaded when another process (or a restart) changed them on disk."""
+        key = self._key(user_id)
+        vectors = self._users.get(key)
+        if vectors is None or vectors.stamp != self._stamp(key):
+            vectors = self._load(key)
+            self._users[key] = vectors
+        return vectors
+
+    def _save(self, key, vectors):
+        directory = self._user_dir(key)
+        tmp_path = os.path.join(directory, "index.tmp.npz")
+        np.savez(
+            tmp_path,
+            ids=np.array(vectors.ids, dtype=str),
+            codes=vectors.codes,
+            scales=vectors.scales,
+            full_rows=vectors.full_rows,
+            generation=np.int64(vectors.generation)
+        )
+        os.replace(tmp_path, os.path.join(directory, "index.npz"))
+        vectors.stamp = self._stamp(key)
+
+    def _write(self, user_id, change):
+        """Applies `change(vectors, key)` to the user's files under the per-user lock."""
+        key = self._key(user_id)
+        directory = self._user_dir(key)
+        os.makedirs(directory, exist_ok=True)
+        with self._lock, open(os.path.join(directory, "lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            vectors = self._load(key)
+            change(vectors, key)
+            self._compact(key, vectors)
+            self._save(key, vectors)
+            self._users[key] = vectors
+
+    def _compact(self, key, vectors):
+        """Rewrites the full-vector file once most of its rows belong to removed memories."""
+        full_path = self._full_path(key, vectors.generation)
+        try:
+            total_rows = os.path.getsize(full_path) // (4 * self.dimension)
+        except FileNotFoundError:
+            return
+        if total_rows <= 2 * len(vectors.ids) + 64:
+            return
+        kept = self._read_rows(key, vectors.generation, vectors.full_rows)
+        vectors.generation += 1
+        with open(self._full_path(key, vectors.generation), "wb") as f:
+            f.write(kept.astype(np.float32).tobytes())
+        vectors.full_rows = np.arange(len(vectors.ids), dtype=np.int64)
+        # Readers that still use the old file reload when they see the new index
+        os.remove(full_path)
+
+    def _read_rows(self, key, generation, rows):
+        """Reads full-precision vectors from disk, one row at a time."""
+        result = np.empty((len(rows), self.dimension), dtype=np.float32)
+        row_bytes = 4 * self.dimension
+        with open(self._full_path(key, generation), "rb") as f:
+            for i, row in enumerate(rows):
+                result[i] = np.frombuffer(os.pread(f.fileno(), row_bytes, int(row) * row_bytes), dtype=np.float32)
+        return result
+
+    def add(self, user_id, memory_ids, embeddings):
+        """Adds or replaces vectors; when an ID appears twice in the batch, the last one wins."""
+        latest = {}
+        for memory_id, embedding in zip(memory_ids, embeddings):
+            latest[memory_id] = embedding
+        if not latest:
+            return
+        memory_ids = list(latest)
+        full = np.asarray([latest[memory_id] for memory_id in memory_ids], dtype=np.float32)
+
+        def change(vectors, key):
+            row_bytes = 4 * self.dimension
+            with open(self._full_path(key, vectors.generation), "ab") as f:
+                size = f.tell()
+                start = -(-size // row_bytes)
+                # Realign after a partial row left by a crash
+                f.write(b"\0" * (start * row_bytes - size))
+                f.write(full.tobytes())
+            vectors.add(memory_ids, full, range(start, start + len(memory_ids)))
+
+        self._write(user_id, change)
+
+    def remove(self, user_id, memory_id):
+        self._write(user_id, lambda vectors, key: vectors.remove(memory_id))
+
+    def invalidate(self, user_id=None):
+        """Drops cached codes; they are read from disk again on the next search."""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(self._key(user_id), None)
+
+    def _exact(self, key, vectors, positions, query):
+        """Exact cosine similarities of the memories at `positions`, best first."""
+        if not len(positions):
+            return []
+        try:
+            full = self._read_rows(key, vectors.generation, vectors.full_rows[positions])
+        except FileNotFoundError:
+            # Compacted by another process since the codes were loaded
+            return None
+        norms = np.linalg.norm(full, axis=1)
+        similarities = (full @ query) / np.where(norms == 0, 1.0, norms)
+        order = np.argsort(-similarities)
+        return [(vectors.ids[positions[i]], float(similarities[i])) for i in order]
+
+    def search(self, user_id, query_vector, limit, candidates=None):
+        """
+        Finds the `candidates` best memories by their codes, then rescores them
+        with the full-precision vectors read from disk.
+
+        Returns:
+            Up to `limit` (memory_id, cosine similarity) pairs, best first
+        """
+        query = _normalize(query_vector)
+        key = self._key(user_id)
+        for _ in range(2):
+            with self._lock:
+                vectors = self._get_user_vectors(user_id)
+                positions = vectors.approximate(query, max(candidates or limit, limit))
+                scored = self._exact(key, vectors, positions, query)
+                if scored is not None:
+                    return scored[:limit]
+                self._users.pop(key, None)
+        return []
+
+    def score(self, user_id, query_vector, memory_ids):
+        """Exact cosine similarity of the given memories (unknown IDs are skipped), best first."""
+        query = _normalize(query_vector)
+        key = self._key(user_id)
+        for _ in range(2):
+            with self._lock:
+                vectors = self._get_user_vectors(user_id)
+                positions = np.array(
+                    [vectors.rows[memory_id] for memory_id in memory_ids if memory_id in vectors.rows],
+                    dtype=np.int64
+                )
+                scored = self._exact(key, vectors, positions, query)
+                if scored is not None:
+                    return scored
+                self._users.pop(key, None)
+        return []
+
+    def get(self, user_id, memory_ids):
+        """Full-precision vectors of the given memories, as {memory_id: list of floats}."""
+        key = self._key(user_id)
+        for _ in range(2):
+            with self._lock:
+                vectors = self._get_user_vectors(user_id)
+                found = [memory_id for memory_id in memory_ids if memory_id in vectors.rows]
+                if not found:
+                    return {}
+                rows = vectors.full_rows[[vectors.rows[memory_id] for memory_id in found]]
+                try:
+                    full = self._read_rows(key, vectors.generation, rows)
+                except FileNotFoundError:
+                    self._users.pop(key, None)
+                    continue
+                return {memory_id: [float(value) for value in vector] for memory_id, vector in zip(found, full)}
+        return {}
+
+    def nbytes(self):
+        """Memory used by the codes of all loaded users (full vectors stay on disk)."""
+        with self._lock:
+            return sum(vectors.nbytes() for vectors in self._users.values())
@@ -0,0 +1,161 @@
+"""
+Recurrence rules for reminders, a subset of RFC 5545 RRULE.
+
+Supported parts:
+    FREQ=DAILY|WEEKLY|MONTHLY|YEARLY (required)
+    INTERVAL=n          every n days/weeks/months/years (default 1)
+    BYDAY=MO,WE,FR      weekdays of a WEEKLY rule
+    COUNT=n             occurrences left, including the current one
+    UNTIL=YYYYMMDDTHHMMSS  last possible occurrence
+
+A recurring reminder is a single row whose due_date is its next occurrence.
+Occurrences are never materialized: after each delivery the scheduler moves the
+row to the following one with next_occurrence(), and decrements COUNT.
+"""
+import calendar
+from datetime import datetime, timedelta
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+
+def parse_rule(rule: str):
+    """
+    Parses a recurrence rule.
+
+    Args:
+        rule: Rule such as "FREQ=WEEKLY;BYDAY=MO;INTERVAL=1", with or without the "RRULE:" prefix
+
+    Returns:
+        Dictionary with freq, interval, byday (weekday numbers, Monday is 0), count and until
+
+    Raises:
+        ValueError: If the rule is malformed or uses unsupported parts
+    """
+    rule = rule.strip()
+    if rule.upper().startswith("RRULE:"):
+        rule = rule[len("RRULE:"):]
+    parts = {}
+    for part in filter(None, rule.split(";")):
+        key, sep, value = part.partition("=")
+        if not sep or not value:
+            raise ValueError(f"Invalid recurrence rule part: {part}")
+        parts[key.strip().upper()] = value.strip().upper()
+
+    unsupported = set(parts) - {"FREQ", "INTERVAL", "BYDAY", "COUNT", "UNTIL"}
+    if unsupported:
+        raise ValueError(f"Unsupported recurrence rule parts: {', '.join(sorted(unsupported))}")
+    freq = parts.get("FREQ")
+    if freq not in FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}")
+
+    try:
+        interval = int(parts.get("INTERVAL", 1))
+        count = int(parts["COUNT"]) if "COUNT" in parts else None
+    except ValueError:
+        raise ValueError("INTERVAL and COUNT must be integers")
+    if interval < 1 or (count is not None and count < 1):
+        raise ValueError("INTERVAL and COUNT must be positive")
+
+    byday = None
+    if "BYDAY" in parts:
+        if freq != "WEEKLY":
+            raise ValueError("BYDAY is only supported with FREQ=WEEKLY")
+        days = parts["BYDAY"].split(",")
+        if any(day not in WEEKDAYS for day in days):
+            raise ValueError(f"BYDAY must list days among {', '.join(WEEKDAYS)}")
+        byday = sorted({WEEKDAYS.index(day) for day in days})
+
+    until = None
+    if "UNTIL" in parts:
+        value = parts["UNTIL"].rstrip("Z")
+        for fmt in ("%Y%m%dT%H%M%S", "%Y%m%d"):
+            try:
+                until = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError("UNTIL must be formatted as YYYYMMDD or YYYYMMDDTHHMMSS")
+        if len(value) == 8:
+            # A date-only UNTIL includes that whole day
+            until = until.replace(hour=23, minute=59, second=59)
+    if count is not None and until is not None:
+        raise ValueError("COUNT and UNTIL cannot be combined")
+
+    return {"freq": freq, "interval": interval, "byday": byday, "count": count, "until": until}
+
+
+def format_rule(parsed) -> str:
+    """Serializes a parsed rule back to its canonical string."""
+    parts = [f"FREQ={parsed['freq']}"]
+    if parsed["interval"] != 1:
+        parts.append(f"INTERVAL={parsed['interval']}")
+    if parsed["byday"]:
+        parts.append("BYDAY=" + ",".join(WEEKDAYS[day] for day in parsed["byday"]))
+    if parsed["count"] is not None:
+        parts.append(f"COUNT={parsed['count']}")
+    if parsed["until"] is not None:
+        parts.append(f"UNTIL={parsed['until'].strftime('%Y%m%dT%H%M%S')}")
+    return ";".join(parts)
+
+
+def _add_months(value: datetime, months: int):
+    """Same day and time `months` later, or None if that month has no such day."""
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    if value.day > calendar.monthrange(year, month)[1]:
+        return None
+    return value.replace(year=year, month=month)
+
+
+def _following(parsed, current: datetime):
+    """The occurrence immediately after `current`, ignoring COUNT and UNTIL."""
+    freq, interval = parsed["freq"], parsed["interval"]
+    if freq == "DAILY":
+        return current + timedelta(days=interval)
+    if freq == "WEEKLY":
+        days = parsed["byday"] or [current.weekday()]
+        later = [day for day in days if day > current.weekday()]
+        if later:
+            return current + timedelta(days=later[0] - current.weekday())
+        # First selected day of the week `interval` weeks after the current one
+        week_start = current - timedelta(days=current.weekday())
+        return week_start + timedelta(weeks=interval, days=days[0])
+    # MONTHLY and YEARLY skip periods without the day, like the 31st or February 29th
+    step = interval if freq == "MONTHLY" else interval * 12
+    for periods in range(1, 49):
+        candidate = _add_months(current, step * periods)
+        if candidate is not None:
+            return candidate
+    return None
+
+
+def next_occurrence(rule: str, current: datetime, after: datetime | None = None):
+    """
+    Computes the occurrence that follows a delivered one.
+
+    Occurrences missed while the scheduler was down are skipped (and counted
+    against COUNT), so the series resumes at the first occurrence after `after`.
+
+    Args:
+        rule: Recurrence rule of the reminder
+        current: Due date of the occurrence that was just delivered
+        after: Skip occurrences up to this time (defaults to `current`)
+
+    Returns:
+        (next due date, rule to store with it) or None when the series has ended
+    """
+    parsed = parse_rule(rule)
+    after = max(after or current, current)
+    occurrence = current
+    while True:
+        if parsed["count"] is not None:
+            parsed["count"] -= 1
+            if parsed["count"] < 1:
+                return None
+        occurrence = _following(parsed, occurrence)
+        if occurrence is None or (parsed["until"] is not None and occurrence > parsed["until"]):
+            return None
+        if occurrence > after:
+            return occurrence, format_rule(parsed)
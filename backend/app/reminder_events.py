@@ -0,0 +1,57 @@
+"""
+Change notifications from the processes that write reminders to the scheduler.
+
+Writers (API, Telegram bot, tools) send a small UDP datagram to the scheduler
+process on localhost, which wakes it up to reschedule. Delivery is best effort:
+a lost notification only delays a reminder until the scheduler reloads its
+look-ahead window.
+"""
+import json
+import socket
+from .config import settings
+
+
+def notify_reminder_changed(reminder_id=None, due_date=None, is_active=True):
+    """
+    Tells the scheduler that a reminder was created, updated or deleted.
+
+    Args:
+        reminder_id: ID of the changed reminder (None when several changed, e.g. after an import)
+        due_date: New due date of the reminder, or None if it is gone or must be reloaded
+        is_active: Whether the reminder can still fire
+    """
+    payload = json.dumps({
+        "id": reminder_id,
+        "due": due_date.isoformat() if due_date and is_active else None,
+        "reload": reminder_id is None
+    }).encode("utf-8")
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(payload, (settings.SCHEDULER_NOTIFY_HOST, settings.SCHEDULER_NOTIFY_PORT))
+    except OSError as e:
+        print(f"Error notifying the reminder scheduler: {e}")
+
+
+def open_listener():
+    """Binds the non-blocking socket on which the scheduler receives notifications."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if hasattr(socket, "SO_REUSEPORT"):
+        # Several scheduler workers on one host share the port, each notification reaches one of them
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((settings.SCHEDULER_NOTIFY_HOST, settings.SCHEDULER_NOTIFY_PORT))
+    sock.setblocking(False)
+    return sock
+
+
+def read_notifications(sock):
+    """Returns all notifications waiting on the listener socket."""
+    notifications = []
+    while True:
+        try:
+            payload = sock.recv(4096)
+        except BlockingIOError:
+            return notifications
+        try:
+            notifications.append(json.loads(payload))
+        except ValueError:
+            continue
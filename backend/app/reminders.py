@@ -1,21 +1,79 @@
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, delete, func, insert, or_, select, update
 from sqlalchemy.orm import Session
 from . import models, schemas
 from .dependencies import get_from_user_id
+from .recurrence import next_occurrence
+from .reminder_events import notify_reminder_changed
 
 def create_reminder(db: Session, reminder: schemas.ReminderCreate):
     db_reminder = models.Reminder(**reminder.model_dump())
     db.add(db_reminder)
     db.commit()
     db.refresh(db_reminder)
+    notify_reminder_changed(db_reminder.id, db_reminder.due_date, db_reminder.is_active)
     return db_reminder
 
-def get_reminders(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+# Sort orders of get_reminders: (column, descending)
+REMINDER_SORTS = {
+    "due_asc": ("due_date", False),
+    "due_desc": ("due_date", True),
+    "created_desc": ("id", True),
+}
+
+def get_reminders(db: Session, user_id: int, skip: int = 0, limit: int = 100, active_only: bool = False,
+                  due_after=None, due_before=None, text: str | None = None, sort: str = "due_asc",
+                  after_id: int | None = None):
+    """
+    A user's reminders, filtered and sorted in SQL.
+
+    The user and due-date filters and the due-date sort are served by the
+    (user_id, due_date) index. Pages are read with a keyset cursor: pass the ID
+    of the last reminder of a page as `after_id` to get the next one.
+
+    Args:
+        user_id: User ID, Telegram ID or web token
+        skip: Rows to skip (offset pagination, prefer after_id)
+        limit: Maximum number of reminders to return
+        active_only: Only reminders that still have to fire
+        due_after: Only reminders due at or after this time
+        due_before: Only reminders due before this time
+        text: Only reminders whose text contains this (case-insensitive)
+        sort: "due_asc", "due_desc" or "created_desc"
+
+    Raises:
+        ValueError: If sort is unknown
+    """
+    if sort not in REMINDER_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(REMINDER_SORTS)}")
     user = get_from_user_id(db, user_id)
-    return db.query(models.Reminder)\
-        .filter(models.Reminder.user_id == user.id)\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    query = db.query(models.Reminder).filter(models.Reminder.user_id == user.id)
+    if active_only:
+        query = query.filter(models.Reminder.is_active == True)
+    if due_after is not None:
+        query = query.filter(models.Reminder.due_date >= due_after)
+    if due_before is not None:
+        query = query.filter(models.Reminder.due_date < due_before)
+    if text:
+        query = query.filter(func.lower(models.Reminder.text).contains(text.lower(), autoescape=True))
+
+    column_name, descending = REMINDER_SORTS[sort]
+    column = getattr(models.Reminder, column_name)
+    if after_id is not None:
+        if column_name == "id":
+            query = query.filter(models.Reminder.id < after_id if descending else models.Reminder.id > after_id)
+        else:
+            # Rows after the cursor row in (due_date, id) order
+            cursor = select(column).where(models.Reminder.id == after_id).scalar_subquery()
+            if descending:
+                query = query.filter(or_(column < cursor, and_(column == cursor, models.Reminder.id < after_id)))
+            else:
+                query = query.filter(or_(column > cursor, and_(column == cursor, models.Reminder.id > after_id)))
+    if descending:
+        query = query.order_by(column.desc(), models.Reminder.id.desc())
+    else:
+        query = query.order_by(column, models.Reminder.id)
+    return query.offset(skip).limit(limit).all()
 
 def get_reminder(db: Session, reminder_id: int, user_id: int):
     user = get_from_user_id(db, user_id)
@@ -31,10 +89,20 @@ def update_reminder(db: Session, reminder_id: int, reminder: schemas.ReminderUpd
         .filter(models.Reminder.user_id == user.id)\
         .first()
     if db_reminder:
-        for key, value in reminder.model_dump().items():
+        data = reminder.model_dump()
+        if "recurrence" not in reminder.model_fields_set:
+            # An update that doesn't mention the recurrence keeps the series going
+            data.pop("recurrence")
+        for key, value in data.items():
             setattr(db_reminder, key, value)
+        # A rescheduled or reactivated reminder starts its deliveries over
+        db_reminder.delivery_status = None
+        db_reminder.delivery_attempts = 0
+        db_reminder.next_attempt_at = None
+        db_reminder.last_error = None
         db.commit()
         db.refresh(db_reminder)
+        notify_reminder_changed(db_reminder.id, db_reminder.due_date, db_reminder.is_active)
     return db_reminder
 
 def delete_reminder(db: Session, reminder_id: int, user_id: int):
@@ -46,4 +114,292 @@ def delete_reminder(db: Session, reminder_id: int, user_id: int):
     if db_reminder:
         db.delete(db_reminder)
         db.commit()
+        notify_reminder_changed(db_reminder.id)
     return db_reminder
+
+def claimable_condition(now, due_before=None):
+    """
+    Reminders a scheduler worker may claim at `now`.
+
+    `is_active` and `due_date` come first so the partial index ix_reminders_active_due
+    (active reminders only) serves the query however many delivered reminders exist.
+
+    Args:
+        now: Current time
+        due_before: Also take reminders due up to this time (defaults to `now`)
+    """
+    return and_(
+        models.Reminder.is_active == True,
+        models.Reminder.due_date <= (due_before or now),
+        or_(models.Reminder.next_attempt_at.is_(None), models.Reminder.next_attempt_at <= now),
+        or_(models.Reminder.lease_expires_at.is_(None), models.Reminder.lease_expires_at <= now)
+    )
+
+def claim_due_reminders(db: Session, owner: str, now, lease_seconds: int, limit: int,
+                        user_ids=None, due_before=None):
+    """
+    Atomically leases up to `limit` due reminders to a scheduler worker.
+
+    The conditional UPDATE ... RETURNING only takes reminders that are active, due,
+    past their retry time and not leased (or whose lease has expired), so concurrent
+    workers never claim the same row. Reminders of a worker that crashed become
+    claimable again when its lease expires.
+
+    Args:
+        user_ids: Only claim reminders of these users (internal IDs)
+        due_before: Also claim reminders due up to this time, for digests
+
+    Returns:
+        IDs of the claimed reminders
+    """
+    claimable = claimable_condition(now, due_before)
+    if user_ids is not None:
+        claimable = and_(claimable, models.Reminder.user_id.in_(list(user_ids)))
+    candidates = select(models.Reminder.id)\
+        .where(claimable)\
+        .order_by(models.Reminder.due_date)\
+        .limit(limit)\
+        .scalar_subquery()
+    claimed = db.execute(
+        update(models.Reminder)
+        .where(models.Reminder.id.in_(candidates), claimable)
+        .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .returning(models.Reminder.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    return claimed
+
+def extend_leases(db: Session, owner: str, reminder_ids, now, lease_seconds: int):
+    """
+    Pushes back the leases a worker still holds, so no other worker claims
+    reminders it is still sending.
+
+    Returns:
+        Number of leases extended
+    """
+    if not reminder_ids:
+        return 0
+    result = db.execute(
+        update(models.Reminder)
+        .where(models.Reminder.id.in_(list(reminder_ids)), models.Reminder.lease_owner == owner)
+        .values(lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+def get_claimed_reminders(db: Session, owner: str, reminder_ids):
+    """
+    Claimed reminders with their recipient, in one joined query selecting only what delivery needs.
+
+    Reminders whose user no longer exists are returned without a telegram_id, so
+    delivery dead-letters them instead of leaving them leased.
+    """
+    if not reminder_ids:
+        return []
+    return db.query(
+        models.Reminder.id,
+        models.Reminder.user_id,
+        models.Reminder.text,
+        models.Reminder.due_date,
+        models.User.telegram_id,
+        models.User.reminder_digest
+    )\
+        .outerjoin(models.User, models.User.id == models.Reminder.user_id)\
+        .filter(
+            models.Reminder.id.in_(reminder_ids),
+            models.Reminder.lease_owner == owner
+        )\
+        .order_by(models.Reminder.due_date)\
+        .all()
+
+def _advance_series(reminder, now):
+    """
+    Moves a recurring reminder to its next occurrence.
+
+    Returns:
+        The new due date, or None when the series has ended (the reminder is then left untouched)
+    """
+    following = next_occurrence(reminder.recurrence, reminder.due_date, now)
+    if following is None:
+        return None
+    reminder.due_date, reminder.recurrence = following
+    reminder.is_active = True
+    reminder.delivery_attempts = 0
+    reminder.next_attempt_at = None
+    reminder.lease_owner = None
+    reminder.lease_expires_at = None
+    return reminder.due_date
+
+def complete_reminders(db: Session, reminder_ids, now=None, sent_at=None):
+    """
+    Marks delivered reminders inactive and drops their lease.
+
+    Recurring reminders stay active instead, moved to their next occurrence.
+    `sent_at` records the delivery time.
+
+    Args:
+        sent_at: Dict of reminder ID to the time its message was sent (defaults to now),
+                 so a reminder committed later than it was sent keeps its real delivery time
+
+    Returns:
+        List of (reminder ID, next due date) of the recurring reminders that were rescheduled
+    """
+    if not reminder_ids:
+        return []
+    now = now or datetime.now()
+    sent_at = sent_at or {}
+    rescheduled = []
+    recurring = db.query(models.Reminder)\
+        .filter(models.Reminder.id.in_(reminder_ids), models.Reminder.recurrence.isnot(None))\
+        .all()
+    for reminder in recurring:
+        due_date = _advance_series(reminder, now)
+        if due_date:
+            reminder.delivery_status = "sent"
+            reminder.sent_at = sent_at.get(reminder.id, now)
+            rescheduled.append((reminder.id, due_date))
+    series_ids = {reminder_id for reminder_id, _ in rescheduled}
+    completed_ids = [reminder_id for reminder_id in reminder_ids if reminder_id not in series_ids]
+    # One statement whatever the number of distinct send times
+    sent_times = {reminder_id: sent_at[reminder_id] for reminder_id in completed_ids if reminder_id in sent_at}
+    db.query(models.Reminder)\
+        .filter(models.Reminder.id.in_(completed_ids))\
+        .update({
+            models.Reminder.is_active: False,
+            models.Reminder.delivery_status: "sent",
+            models.Reminder.sent_at: case(sent_times, value=models.Reminder.id, else_=now) if sent_times else now,
+            models.Reminder.lease_owner: None,
+            models.Reminder.lease_expires_at: None
+        }, synchronize_session=False)
+    db.commit()
+    return rescheduled
+
+def retry_delay(attempts: int, base_seconds: int, max_seconds: int):
+    """Exponential backoff: base, 2x base, 4x base... capped at max_seconds."""
+    return timedelta(seconds=min(base_seconds * 2 ** max(attempts - 1, 0), max_seconds))
+
+def record_delivery_failures(db: Session, owner: str, failures, now, base_seconds: int, max_seconds: int,
+                             max_attempts: int):
+    """
+    Records failed deliveries of a worker and schedules their retry.
+
+    Args:
+        failures: List of (reminder ID, error message, permanent, retry_after seconds or None)
+
+    Returns:
+        List of (reminder ID, next attempt time) of the reminders that will be retried.
+        The others are dead-lettered: inactive with delivery_status "dead". A recurring
+        reminder that runs out of attempts skips to its next occurrence instead, unless
+        the error is permanent.
+    """
+    if not failures:
+        return []
+    by_id = {failure[0]: failure for failure in failures}
+    retries = []
+    rows = db.query(models.Reminder)\
+        .filter(models.Reminder.id.in_(list(by_id)), models.Reminder.lease_owner == owner)\
+        .all()
+    for reminder in rows:
+        _, error, permanent, retry_after = by_id[reminder.id]
+        reminder.delivery_attempts = (reminder.delivery_attempts or 0) + 1
+        reminder.last_error = error[:500]
+        reminder.lease_owner = None
+        reminder.lease_expires_at = None
+        if not permanent and reminder.delivery_attempts >= max_attempts and reminder.recurrence:
+            due_date = _advance_series(reminder, now)
+            if due_date:
+                reminder.delivery_status = "skipped"
+                retries.append((reminder.id, due_date))
+                continue
+        if permanent or reminder.delivery_attempts >= max_attempts:
+            reminder.is_active = False
+            reminder.delivery_status = "dead"
+            reminder.next_attempt_at = None
+            continue
+        delay = retry_delay(reminder.delivery_attempts, base_seconds, max_seconds)
+        if retry_after:
+            delay = max(delay, timedelta(seconds=retry_after))
+        reminder.next_attempt_at = now + delay
+        retries.append((reminder.id, reminder.next_attempt_at))
+    db.commit()
+    return retries
+
+def get_dead_reminders(db: Session, user_id: int | None = None, limit: int = 100):
+    """Reminders that could not be delivered, most recently failed first."""
+    query = db.query(models.Reminder).filter(models.Reminder.delivery_status == "dead")
+    if user_id is not None:
+        query = query.filter(models.Reminder.user_id == user_id)
+    return query.order_by(models.Reminder.id.desc()).limit(limit).all()
+
+def next_lease_expiry(db: Session, now):
+    """When the earliest lease on an active reminder runs out, or None if nothing is leased."""
+    return db.query(models.Reminder.lease_expires_at)\
+        .filter(
+            models.Reminder.is_active == True,
+            models.Reminder.lease_expires_at > now
+        )\
+        .order_by(models.Reminder.lease_expires_at)\
+        .limit(1)\
+        .scalar()
+
+# Column of `reminders` -> column of `reminder_archive`
+ARCHIVED_COLUMNS = {
+    "id": "original_id", "user_id": "user_id", "text": "text", "due_date": "due_date",
+    "recurrence": "recurrence", "delivery_status": "delivery_status", "delivery_attempts": "delivery_attempts",
+    "last_error": "last_error", "sent_at": "sent_at", "created_at": "created_at", "updated_at": "updated_at"
+}
+
+def archive_reminders(db: Session, older_than, batch_size: int = 1000):
+    """
+    Moves inactive reminders due before `older_than` to the archive table.
+
+    Each batch is deleted with DELETE ... RETURNING and inserted into the archive in
+    the same transaction, so several scheduler workers can run the job at once
+    without archiving a reminder twice.
+
+    Returns:
+        Number of archived reminders
+    """
+    archived = 0
+    while True:
+        candidates = select(models.Reminder.id)\
+            .where(models.Reminder.is_active == False, models.Reminder.due_date < older_than)\
+            .order_by(models.Reminder.id)\
+            .limit(batch_size)\
+            .scalar_subquery()
+        rows = db.execute(
+            delete(models.Reminder)
+            .where(models.Reminder.id.in_(candidates), models.Reminder.is_active == False)
+            .returning(*(getattr(models.Reminder, column).label(label) for column, label in ARCHIVED_COLUMNS.items()))
+            .execution_options(synchronize_session=False)
+        ).all()
+        if rows:
+            db.execute(insert(models.ReminderArchive), [row._asdict() for row in rows])
+        db.commit()
+        archived += len(rows)
+        if len(rows) < batch_size:
+            return archived
+
+def get_reminder_history(db: Session, user_id: int, before_id: int | None = None, limit: int = 50):
+    """
+    Archived reminders of a user, most recently due first.
+
+    Args:
+        user_id: Internal user ID
+        before_id: Keyset cursor, the archive ID of the last reminder of the previous page
+        limit: Maximum number of reminders to return
+    """
+    query = db.query(models.ReminderArchive).filter(models.ReminderArchive.user_id == user_id)
+    if before_id is not None:
+        cursor = db.query(models.ReminderArchive.due_date)\
+            .filter(models.ReminderArchive.id == before_id)\
+            .scalar_subquery()
+        query = query.filter(or_(
+            models.ReminderArchive.due_date < cursor,
+            and_(models.ReminderArchive.due_date == cursor, models.ReminderArchive.id < before_id)
+        ))
+    return query.order_by(models.ReminderArchive.due_date.desc(), models.ReminderArchive.id.desc())\
+        .limit(limit)\
+        .all()
@@ -1,47 +1,372 @@
 import asyncio
-from datetime import datetime
-from apscheduler.schedulers.background import BackgroundScheduler
+import heapq
+import html
+import os
+import select
+import socket
+import time
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from telegram.constants import ParseMode
+from .config import settings
 from .database import SessionLocal
-from . import models
-from .telegram_bot import setup_telegram_bot
-from .dependencies import get_from_user_id
+from . import models, reminders
+from .migrations import upgrade_schema
+from .notifier import ReminderNotifier, classify_error, get_notifier, shutdown_notifier
+from .reminder_events import open_listener, read_notifications
+from .scheduler_metrics import metrics
 
-async def check_and_send_reminders_async():
-    now = datetime.now()
-    # print("Checking reminders at time ", now)
+# Identifies this worker's leases, several scheduler processes can share the database
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# Telegram's limit on the length of a message, and room kept for a digest's header
+MAX_MESSAGE_CHARS = 4096
+DIGEST_HEADER_CHARS = 40
+# Pause after an error in the scheduler loop (e.g. the database is unreachable) before trying again
+ERROR_BACKOFF_SECONDS = 5
+
+def commit_delivered(delivered):
+    """
+    Marks delivered reminders inactive in one statement, moving recurring ones to their next occurrence.
+
+    Args:
+        delivered: Dict of reminder ID to the time its message was sent
+
+    Returns:
+        List of (reminder ID, next due date) of the rescheduled recurring reminders
+    """
+    if not delivered:
+        return []
     db: Session = SessionLocal()
     try:
-        due_reminders = db.query(models.Reminder).filter(
-            models.Reminder.due_date <= now,
-            models.Reminder.is_active == True
-        ).all()
-
-        if due_reminders:
-            telegram_app = setup_telegram_bot()
-            bot = telegram_app.bot  # ExtBot (async)
-
-            for reminder in due_reminders:
-                user = get_from_user_id(db, reminder.user_id)
-                telegram_id = user.telegram_id
-                message_text = f"⏰ <b>Time for:</b>\n\n {reminder.text}"
-                try:
-                    # Using await
-                    print("Sending message to user:", telegram_id)
-                    await bot.send_message(chat_id=telegram_id, text=message_text, parse_mode=ParseMode.HTML)
-                    reminder.is_active = False
-                except Exception as e:
-                    print(f"Error sending message: {e}")
+        return reminders.complete_reminders(db, list(delivered), sent_at=delivered)
+    finally:
+        db.close()
+
+def format_message(texts):
+    """Message text of one reminder, or of a digest of several (sent as HTML, so the texts are escaped)."""
+    texts = [html.escape(text or "") for text in texts]
+    if len(texts) == 1:
+        return f"⏰ <b>Time for:</b>\n\n {texts[0]}"
+    return f"⏰ <b>Time for {len(texts)} reminders:</b>\n\n" + "\n".join(f"• {text}" for text in texts)
+
+def group_reminders(due_reminders, max_chars=MAX_MESSAGE_CHARS):
+    """
+    Groups due reminders into messages.
+
+    Reminders of users with digests enabled are coalesced into one message per
+    chat (split when it would exceed max_chars), the others are sent one by one.
 
-            db.commit()
+    Returns:
+        List of reminder lists, one per message
+    """
+    groups, digests = [], {}
+    for reminder in due_reminders:
+        if not reminder.telegram_id or not reminder.reminder_digest:
+            groups.append([reminder])
+            continue
+        line = len(reminder.text) + 3  # "• " and the newline
+        group, length = digests.get(reminder.telegram_id, (None, 0))
+        if group is None or length + line > max_chars:
+            group, length = [], DIGEST_HEADER_CHARS
+            groups.append(group)
+        group.append(reminder)
+        digests[reminder.telegram_id] = (group, length + line)
+    return groups
+
+async def send_reminders(notifier, group):
+    """
+    Sends reminders of one chat as one message.
+
+    Returns:
+        List of (reminder ID, None) when delivered, otherwise (reminder ID, (error message, permanent, retry_after))
+    """
+    chat_id = group[0].telegram_id
+    if not chat_id:
+        return [(reminder.id, ("User has no Telegram chat", True, None)) for reminder in group]
+    started = time.perf_counter()
+    try:
+        await notifier.send(chat_id, format_message([reminder.text for reminder in group]))
+        metrics.observe_send(time.perf_counter() - started)
+        return [(reminder.id, None) for reminder in group]
+    except Exception as e:
+        permanent, retry_after = classify_error(e)
+        metrics.observe_send(time.perf_counter() - started, e, permanent)
+        print(f"Error sending message to {chat_id} ({'permanent' if permanent else 'will retry'}): {e}")
+        if permanent and len(group) > 1:
+            # One bad reminder must not dead-letter the whole digest: send them one by one
+            results = []
+            for reminder in group:
+                results.extend(await send_reminders(notifier, [reminder]))
+            return results
+        return [(reminder.id, (f"{type(e).__name__}: {e}", permanent, retry_after)) for reminder in group]
+
+async def send_reminder(notifier, reminder):
+    """Sends one reminder, returning (reminder ID, None or failure) as send_reminders does."""
+    (result,) = await send_reminders(notifier, [reminder])
+    return result
+
+async def keep_leases(owner, reminder_ids):
+    """Extends the leases of a batch every third of SCHEDULER_LEASE_SECONDS until cancelled, while it is sent."""
+    while True:
+        await asyncio.sleep(settings.SCHEDULER_LEASE_SECONDS / 3)
+        db: Session = SessionLocal()
+        try:
+            reminders.extend_leases(db, owner, reminder_ids, datetime.now(), settings.SCHEDULER_LEASE_SECONDS)
+        except Exception as e:
+            print(f"Error extending reminder leases: {e}")
+        finally:
+            db.close()
+
+def claim_batch(owner, now):
+    """
+    Claims a batch of due reminders and, for users with digests, their reminders
+    due within SCHEDULER_DIGEST_WINDOW_SECONDS, which are sent in the same message.
+
+    Returns:
+        The claimed reminders with their recipient, by due date
+    """
+    db: Session = SessionLocal()
+    try:
+        claimed = reminders.claim_due_reminders(
+            db, owner, now, settings.SCHEDULER_LEASE_SECONDS, settings.SCHEDULER_CLAIM_BATCH
+        )
+        due_reminders = reminders.get_claimed_reminders(db, owner, claimed)
+        digest_users = {reminder.user_id for reminder in due_reminders if reminder.reminder_digest}
+        if digest_users and settings.SCHEDULER_DIGEST_WINDOW_SECONDS > 0:
+            upcoming = reminders.claim_due_reminders(
+                db, owner, now, settings.SCHEDULER_LEASE_SECONDS, settings.SCHEDULER_CLAIM_BATCH,
+                user_ids=digest_users,
+                due_before=now + timedelta(seconds=settings.SCHEDULER_DIGEST_WINDOW_SECONDS)
+            )
+            if upcoming:
+                due_reminders = reminders.get_claimed_reminders(db, owner, claimed + upcoming)
+        return due_reminders
     finally:
         db.close()
 
+async def check_and_send_reminders_async(notifier=None, owner=None):
+    """
+    Sends every active reminder that is due.
+
+    Due reminders are claimed in batches of SCHEDULER_CLAIM_BATCH with a lease, so
+    several scheduler workers can run at once without sending a reminder twice.
+    Each batch is sent concurrently under the notifier's rate limits, one digest
+    message per chat for users with digests enabled (see claim_batch), with its
+    leases extended for as long as sending takes, and delivered
+    reminders are marked inactive every SCHEDULER_COMMIT_BATCH sends, so a crash
+    only loses the status of the last partial batch. Failed deliveries are retried
+    with exponential backoff, or dead-lettered after a permanent error or
+    SCHEDULER_MAX_ATTEMPTS attempts. Recurring reminders move to their next
+    occurrence after delivery.
+
+    Delivery lag, batch sizes and the duration of the call are recorded in the
+    scheduler metrics, which are then written to SCHEDULER_METRICS_FILE.
+
+    Args:
+        notifier: ReminderNotifier to send with (defaults to the one of this process)
+        owner: Lease owner (defaults to this worker)
+
+    Returns:
+        List of (reminder ID, next due time) to schedule: retries of failed reminders
+        and next occurrences of recurring ones
+    """
+    owner = owner or WORKER_ID
+    retries = []
+    started = time.perf_counter()
+    while True:
+        due_reminders = claim_batch(owner, datetime.now())
+        if not due_reminders:
+            break
+
+        notifier = notifier or get_notifier()
+        metrics.observe_batch(len(due_reminders))
+        due_dates = {reminder.id: reminder.due_date for reminder in due_reminders}
+        groups = group_reminders(due_reminders)
+        print(f"Sending {len(due_reminders)} due reminders in {len(groups)} messages")
+        failures, delivered = [], {}
+        # Rate limits can stretch a batch past the lease (e.g. many reminders for one chat)
+        lease_keeper = asyncio.create_task(keep_leases(owner, list(due_dates)))
+        try:
+            for task in asyncio.as_completed([send_reminders(notifier, group) for group in groups]):
+                results = await task
+                sent_at = datetime.now()
+                for reminder_id, failure in results:
+                    if failure:
+                        failures.append((reminder_id, *failure))
+                        continue
+                    metrics.observe_delivery((sent_at - due_dates[reminder_id]).total_seconds())
+                    delivered[reminder_id] = sent_at
+                if len(delivered) >= settings.SCHEDULER_COMMIT_BATCH:
+                    retries.extend(commit_delivered(delivered))
+                    delivered = {}
+        finally:
+            lease_keeper.cancel()
+        retries.extend(commit_delivered(delivered))
+
+        if failures:
+            db = SessionLocal()
+            try:
+                retries.extend(reminders.record_delivery_failures(
+                    db, owner, failures, datetime.now(),
+                    settings.SCHEDULER_RETRY_SECONDS,
+                    settings.SCHEDULER_RETRY_MAX_SECONDS,
+                    settings.SCHEDULER_MAX_ATTEMPTS
+                ))
+            finally:
+                db.close()
+
+    metrics.observe_tick(time.perf_counter() - started)
+    metrics.write(settings.SCHEDULER_METRICS_FILE)
+    return retries
+
 def check_and_send_reminders():
     # Execute async function in loop (blocking)
-    asyncio.run(check_and_send_reminders_async())
+    async def check_once():
+        # A new loop per call: the process-wide notifier is bound to the scheduler's loop
+        notifier = ReminderNotifier()
+        try:
+            return await check_and_send_reminders_async(notifier)
+        finally:
+            await notifier.shutdown()
+    return asyncio.run(check_once())
+
+class ReminderScheduler:
+    """
+    Event-driven reminder scheduler.
+
+    Keeps a min-heap of the active reminders due within a look-ahead window and
+    sleeps exactly until the earliest one, or until a change notification
+    (see reminder_events) arrives. The database is only queried when something
+    is due, when the window is reloaded and when old reminders are archived.
+    """
+
+    def __init__(self, dispatch=None, lookahead_seconds=None):
+        self.dispatch = dispatch or check_and_send_reminders_async
+        self.lookahead = timedelta(seconds=lookahead_seconds or settings.SCHEDULER_LOOKAHEAD_SECONDS)
+        self.heap = []  # (due_date, reminder_id)
+        self.horizon = None
+        self.archive_at = None if settings.REMINDER_ARCHIVE_AFTER_DAYS > 0 else datetime.max
+
+    def load_window(self, now=None):
+        """Reloads the active reminders due before the end of the next look-ahead window."""
+        now = now or datetime.now()
+        self.horizon = now + self.lookahead
+        db: Session = SessionLocal()
+        try:
+            rows = db.query(models.Reminder.due_date, models.Reminder.next_attempt_at, models.Reminder.id).filter(
+                models.Reminder.is_active == True,
+                models.Reminder.due_date <= self.horizon
+            ).all()
+        finally:
+            db.close()
+        # Reminders waiting for a retry come up at their next attempt
+        self.heap = [
+            (max(due_date, next_attempt_at) if next_attempt_at else due_date, reminder_id)
+            for due_date, next_attempt_at, reminder_id in rows
+        ]
+        heapq.heapify(self.heap)
+
+    def schedule(self, reminder_id, due_date):
+        """Adds a reminder to the heap if it falls inside the current window."""
+        if self.horizon is None or due_date <= self.horizon:
+            heapq.heappush(self.heap, (due_date, reminder_id))
+
+    def handle_notification(self, notification):
+        # Any local process can send datagrams to the listener, malformed ones are ignored
+        if not isinstance(notification, dict):
+            print(f"Ignoring reminder notification: {notification!r}")
+            return
+        if notification.get("reload"):
+            self.load_window()
+        elif notification.get("due"):
+            reminder_id = notification.get("id")
+            try:
+                due_date = datetime.fromisoformat(notification["due"])
+            except (TypeError, ValueError):
+                due_date = None
+            if due_date is None or due_date.tzinfo is not None or type(reminder_id) is not int:
+                print(f"Ignoring reminder notification: {notification!r}")
+                return
+            self.schedule(reminder_id, due_date)
+        # Deleted or deactivated reminders stay in the heap: the due query skips them when they come up
+
+    def pop_due(self, now):
+        """Removes the reminders due at `now` from the heap, returning whether there were any."""
+        due = False
+        while self.heap and self.heap[0][0] <= now:
+            heapq.heappop(self.heap)
+            due = True
+        return due
+
+    def seconds_until_next(self, now):
+        wakeup = min(self.horizon, self.archive_at or now)
+        if self.heap and self.heap[0][0] < wakeup:
+            wakeup = self.heap[0][0]
+        return max((wakeup - now).total_seconds(), 0.0)
+
+    def archive(self, now):
+        """Moves reminders inactive for longer than the retention window to the archive table."""
+        db: Session = SessionLocal()
+        try:
+            archived = reminders.archive_reminders(
+                db, now - timedelta(days=settings.REMINDER_ARCHIVE_AFTER_DAYS), settings.REMINDER_ARCHIVE_BATCH
+            )
+            if archived:
+                print(f"Archived {archived} reminders")
+        except Exception as e:
+            db.rollback()
+            print(f"Error archiving reminders: {e}")
+        finally:
+            db.close()
+        self.archive_at = now + timedelta(seconds=settings.REMINDER_ARCHIVE_INTERVAL_SECONDS)
+
+    def run_once(self, loop, now=None):
+        """Archives old reminders when due, then dispatches the due reminders and schedules retries and next occurrences."""
+        now = now or datetime.now()
+        if self.horizon is None or now >= self.horizon:
+            self.load_window(now)
+        if self.archive_at is None or now >= self.archive_at:
+            self.archive(now)
+        if not self.pop_due(now):
+            return
+        retries = loop.run_until_complete(self.dispatch())
+        for reminder_id, retry_at in retries or []:
+            self.schedule(reminder_id, retry_at)
+        
+        # Wake up when a lease of another (possibly crashed) worker runs out
+        db: Session = SessionLocal()
+        try:
+            expiry = reminders.next_lease_expiry(db, datetime.now())
+        finally:
+            db.close()
+        if expiry:
+            self.schedule(0, expiry)
+
+    def run_forever(self, stop_event=None):
+        listener = open_listener()
+        # One event loop for the life of the process instead of one per check
+        loop = asyncio.new_event_loop()
+        try:
+            while stop_event is None or not stop_event.is_set():
+                try:
+                    self.run_once(loop)
+                    readable, _, _ = select.select([listener], [], [], self.seconds_until_next(datetime.now()))
+                    if readable:
+                        for notification in read_notifications(listener):
+                            self.handle_notification(notification)
+                except Exception as e:
+                    print(f"Error in the reminder scheduler, retrying in {ERROR_BACKOFF_SECONDS}s: {type(e).__name__}: {e}")
+                    # Reload the window after the pause, so reminders popped before the error come up again
+                    self.horizon = datetime.now() + timedelta(seconds=ERROR_BACKOFF_SECONDS)
+                    if stop_event is None:
+                        time.sleep(ERROR_BACKOFF_SECONDS)
+                    else:
+                        stop_event.wait(ERROR_BACKOFF_SECONDS)
+        finally:
+            listener.close()
+            loop.run_until_complete(shutdown_notifier())
+            loop.close()
 
-scheduler = BackgroundScheduler()
-scheduler.add_job(check_and_send_reminders, "interval", seconds=5)
-scheduler.start()
+def run_scheduler():
+    """Runs the reminder scheduler in the current process (blocking)."""
+    upgrade_schema()
+    ReminderScheduler().run_forever()
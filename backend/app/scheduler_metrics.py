@@ -0,0 +1,127 @@
+"""
+Delivery metrics of the reminder scheduler.
+
+The scheduler records delivery lag, tick duration, batch sizes, send latency
+and failures in process-wide histograms and counters, and writes them in the
+Prometheus text format to SCHEDULER_METRICS_FILE after each dispatch. The file
+can be scraped by node_exporter's textfile collector, and the API serves it at
+GET /metrics/scheduler.
+"""
+import os
+import threading
+from bisect import bisect_left
+
+PREFIX = "memogenius_scheduler"
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds, as in Prometheus."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum:.6f}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class SchedulerMetrics:
+    """Histograms and counters of one scheduler process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.delivery_lag = Histogram(
+            f"{PREFIX}_delivery_lag_seconds", "Time from due date to delivery of a reminder",
+            [0.1, 0.5, 1, 2, 5, 10, 30, 60, 300, 900, 3600]
+        )
+        self.tick_duration = Histogram(
+            f"{PREFIX}_tick_duration_seconds", "Duration of a dispatch of the due reminders",
+            [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+        )
+        self.batch_size = Histogram(
+            f"{PREFIX}_batch_size", "Due reminders claimed per batch",
+            [1, 5, 10, 25, 50, 100, 200, 500, 1000]
+        )
+        self.send_latency = Histogram(
+            f"{PREFIX}_send_latency_seconds", "Duration of a send attempt, including rate-limit waits",
+            [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+        )
+        self.delivered = 0
+        self.messages = 0
+        self.failures = {}  # (error class, permanent) -> count
+
+    def observe_delivery(self, lag_seconds):
+        with self.lock:
+            # Reminders sent early in a digest count as on time
+            self.delivery_lag.observe(max(lag_seconds, 0.0))
+            self.delivered += 1
+
+    def observe_send(self, seconds, error=None, permanent=False):
+        with self.lock:
+            self.send_latency.observe(seconds)
+            self.messages += 1
+            if error is not None:
+                key = (type(error).__name__, permanent)
+                self.failures[key] = self.failures.get(key, 0) + 1
+
+    def observe_batch(self, size):
+        with self.lock:
+            self.batch_size.observe(size)
+
+    def observe_tick(self, seconds):
+        with self.lock:
+            self.tick_duration.observe(seconds)
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        with self.lock:
+            lines = []
+            for histogram in (self.delivery_lag, self.tick_duration, self.batch_size, self.send_latency):
+                lines.extend(histogram.render())
+            lines.extend([
+                f"# HELP {PREFIX}_reminders_delivered_total Reminders delivered",
+                f"# TYPE {PREFIX}_reminders_delivered_total counter",
+                f"{PREFIX}_reminders_delivered_total {self.delivered}",
+                f"# HELP {PREFIX}_messages_total Send attempts (a digest is one message)",
+                f"# TYPE {PREFIX}_messages_total counter",
+                f"{PREFIX}_messages_total {self.messages}",
+                f"# HELP {PREFIX}_send_failures_total Failed send attempts by error class",
+                f"# TYPE {PREFIX}_send_failures_total counter",
+            ])
+            for (error_class, permanent), count in sorted(self.failures.items()):
+                lines.append(
+                    f'{PREFIX}_send_failures_total{{error="{error_class}",permanent="{str(permanent).lower()}"}} {count}'
+                )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Atomically replaces `path` with the current metrics."""
+        if not path:
+            return
+        temporary = f"{path}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(temporary, path)
+        except OSError as e:
+            print(f"Error writing scheduler metrics to {path}: {e}")
+
+
+# Metrics of this process
+metrics = SchedulerMetrics()
@@ -1,6 +1,7 @@
 # app/schemas.py
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
+from .recurrence import format_rule, parse_rule
 
 class ChatMessage(BaseModel):
     message: str
@@ -9,6 +10,12 @@ class ChatMessage(BaseModel):
 class ReminderBase(BaseModel):
     text: str = Field(..., description="Reminder text")
     due_date: datetime = Field(..., description="Reminder date and time")
+    recurrence: str | None = Field(None, description="Recurrence rule, e.g. FREQ=WEEKLY;BYDAY=MO (first occurrence is due_date)")
+
+    @field_validator("recurrence")
+    @classmethod
+    def normalize_recurrence(cls, value):
+        return format_rule(parse_rule(value)) if value else None
 
 class ReminderCreate(ReminderBase):
     user_id: int = Field(..., description="Telegram user ID")
@@ -22,10 +29,26 @@ class Reminder(ReminderBase):
     is_active: bool
     created_at: datetime
     updated_at: datetime | None = None
+    sent_at: datetime | None = None
 
     class Config:
         from_attributes = True
         
+class ArchivedReminder(BaseModel):
+    id: int  # ID in the archive, the cursor of /reminders/history
+    original_id: int  # ID the reminder had before it was archived
+    user_id: int
+    text: str
+    due_date: datetime
+    recurrence: str | None = None
+    delivery_status: str | None = None
+    sent_at: datetime | None = None
+    created_at: datetime | None = None
+    archived_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
 class UserBase(BaseModel):
     access_key: str
 
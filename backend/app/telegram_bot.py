@@ -9,7 +9,7 @@ from telegram.error import BadRequest
 from .config import settings
 from .chat_handler import ChatHandler
 from .database import SessionLocal
-from .users import get_or_create_telegram_user
+from .users import get_or_create_telegram_user, set_reminder_digest
 
 # Initialize ChatHandler
 chat_handler = ChatHandler()
@@ -247,6 +247,27 @@ async def show_key(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode=ParseMode.HTML
     )
 
+async def toggle_digest(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
+    """Command to enable or disable reminder digests: /digest on|off"""
+    user_id = get_user_id(update)
+    db = SessionLocal()
+    try:
+        user = get_or_create_telegram_user(db, user_id)
+        if context.args and context.args[0].lower() in ("on", "off"):
+            user = set_reminder_digest(db, user, context.args[0].lower() == "on")
+        if user.reminder_digest:
+            message = "Reminders due close together are sent as one message. Use /digest off to receive them one by one."
+        else:
+            message = "Reminders are sent one by one. Use /digest on to group those due close together."
+    finally:
+        db.close()
+
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=message,
+        parse_mode=ParseMode.HTML
+    )
+
 async def handle_message(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE):
     """Processes user messages using ChatHandler and sends responses"""
     user_id = get_user_id(update)
@@ -301,6 +322,7 @@ def setup_telegram_bot():
     app.add_handler(CommandHandler('start', start))
     app.add_handler(CommandHandler('key', show_key))
     app.add_handler(CommandHandler('restartai', restart_gemini))
+    app.add_handler(CommandHandler('digest', toggle_digest))
     
     # Register message handler for text messages
     app.add_handler(MessageHandler(
@@ -312,5 +334,7 @@ def setup_telegram_bot():
 
 # Bot startup entry point
 if __name__ == '__main__':
+    from .migrations import upgrade_schema
+    upgrade_schema()
     app = setup_telegram_bot()
     app.run_polling()
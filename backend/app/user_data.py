@@ -0,0 +1,373 @@
+"""
+Streaming export and import of a user's data as NDJSON archives.
+
+An archive is one JSON record per line: a header, then the user's reminders,
+lists, list items and memories, each with a "kind" field. Records are read in
+batches and yielded one at a time, so exporting a heavy user never loads all of
+their data in memory. Import inserts in batches and reuses exported embeddings
+when they were produced by the model of the active memory collection.
+
+Import is not atomic: batches are committed as they are written, and an error
+reports what was imported before it. Reminders and list items already in the
+account are skipped and memories keep their IDs, so importing the same archive
+again completes a partial import without duplicating it.
+
+Usage (from the backend directory):
+    python -m app.user_data export --user-id 1 [--embeddings] > backup.ndjson
+    python -m app.user_data import --user-id 1 backup.ndjson
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+from .database import SessionLocal
+from . import models
+
+ARCHIVE_VERSION = 1
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    # Reminders store naive local times
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+def _iter_rows(db, query, column, batch_size):
+    """Reads a query in keyset-paginated batches of batch_size rows."""
+    last_id = None
+    while True:
+        page = query
+        if last_id is not None:
+            page = page.filter(column > last_id)
+        rows = page.order_by(column).limit(batch_size).all()
+        if not rows:
+            return
+        yield from rows
+        last_id = getattr(rows[-1], column.key)
+
+
+def export_user_data(db, user_id, include_embeddings=False, batch_size=500, memory_db=None):
+    """
+    Yields the NDJSON records (dicts) of a user's archive.
+
+    Args:
+        db: Database session
+        user_id: Internal ID of the user
+        include_embeddings: Also export memory vectors, so import can skip re-embedding
+        batch_size: Rows or memories read per query
+        memory_db: MemoryDB to read memories from (defaults to the shared instance)
+    """
+    if memory_db is None:
+        from .memory_db import get_memory_db
+        memory_db = get_memory_db()
+
+    yield {
+        "kind": "header",
+        "version": ARCHIVE_VERSION,
+        "user_id": user_id,
+        "exported_at": datetime.now().isoformat(),
+        "embedding_model": memory_db.embedder.name if include_embeddings else None
+    }
+
+    # Archived reminders are restored as inactive reminders, the archival job moves them back
+    archived = db.query(models.ReminderArchive).filter(models.ReminderArchive.user_id == user_id)
+    reminders = db.query(models.Reminder).filter(models.Reminder.user_id == user_id)
+    for query, column in ((archived, models.ReminderArchive.id), (reminders, models.Reminder.id)):
+        for reminder in _iter_rows(db, query, column, batch_size):
+            yield {
+                "kind": "reminder",
+                "text": reminder.text,
+                "due_date": _isoformat(reminder.due_date),
+                "is_active": getattr(reminder, "is_active", False),
+                "recurrence": reminder.recurrence,
+                "created_at": _isoformat(reminder.created_at)
+            }
+
+    for user_list in db.query(models.List).filter(models.List.user_id == user_id).order_by(models.List.id).all():
+        yield {"kind": "list", "id": user_list.id, "title": user_list.title, "type": user_list.type}
+        items = db.query(models.ListItem).filter(models.ListItem.list_id == user_list.id)
+        for item in _iter_rows(db, items, models.ListItem.id, batch_size):
+            yield {
+                "kind": "list_item",
+                "list_id": user_list.id,
+                "text": item.text,
+                "completed": item.completed
+            }
+
+    for memory in memory_db.iter_user_memories(user_id, page_size=batch_size, include_embeddings=include_embeddings):
+        record = {"kind": "memory"}
+        record.update(memory)
+        yield record
+
+
+class UserDataImporter:
+    """
+    Imports archive records into a user's account in batches.
+
+    Feed records (or raw NDJSON lines) in archive order, then call close() to
+    write the last partial batches. `counts` always holds what was written so far.
+
+    Memory IDs are minted in the target user's namespace, and memories whose ID
+    already belongs to another user are rejected. Active reminders that are past
+    due are imported inactive, or moved to their next occurrence when they recur,
+    so they don't all fire at once.
+    """
+
+    def __init__(self, db, user_id, batch_size=500, memory_db=None):
+        from . import lists
+
+        self.db = db
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.memory_db = memory_db
+        self.reuse_embeddings = False
+        self.list_ids = {}
+        self.reminders = []
+        self.list_items = []
+        self.memories = []
+        self.counts = {
+            "reminders": 0, "lists": 0, "list_items": 0, "memories": 0,
+            "duplicate_reminders": 0, "duplicate_list_items": 0, "rejected_memories": 0
+        }
+        lists.ensure_user_lists_exist(db, user_id)
+
+    def feed_lines(self, lines):
+        for line in lines:
+            line = line.strip()
+            if line:
+                self.feed(json.loads(line))
+
+    def feed(self, record):
+        if not isinstance(record, dict):
+            raise ValueError("Archive lines must be JSON objects")
+        kind = record.get("kind")
+        if kind == "header":
+            self._read_header(record)
+        elif kind == "reminder":
+            self.reminders.append(self._reminder_from_record(record))
+            if len(self.reminders) >= self.batch_size:
+                self._flush_reminders()
+        elif kind == "list":
+            self._import_list(record)
+        elif kind == "list_item":
+            list_id = self.list_ids.get(record["list_id"])
+            if list_id is None:
+                return
+            self.list_items.append({"list_id": list_id, "text": record["text"], "completed": record.get("completed", False)})
+            if len(self.list_items) >= self.batch_size:
+                self._flush_list_items()
+        elif kind == "memory":
+            self.memories.append(self._memory_from_record(record))
+            if len(self.memories) >= self.batch_size:
+                self._flush_memories()
+
+    def close(self):
+        """Writes the remaining batches and returns the number of imported records per kind."""
+        self._flush_reminders()
+        self._flush_list_items()
+        self._flush_memories()
+        return self.counts
+
+    def _get_memory_db(self):
+        if self.memory_db is None:
+            from .memory_db import get_memory_db
+            self.memory_db = get_memory_db()
+        return self.memory_db
+
+    def _read_header(self, record):
+        if record.get("version", ARCHIVE_VERSION) > ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported archive version {record['version']}")
+        # Vectors are only comparable when they come from the model of the collection we write to
+        model = record.get("embedding_model")
+        self.reuse_embeddings = bool(model) and model == self._get_memory_db().embedder.name
+
+    def _import_list(self, record):
+        # Users have one list per type, merge into it instead of creating another
+        user_list = self.db.query(models.List).filter(
+            models.List.user_id == self.user_id,
+            models.List.type == record["type"]
+        ).first()
+        if user_list is None:
+            user_list = models.List(user_id=self.user_id, title=record["title"], type=record["type"])
+            self.db.add(user_list)
+            self.db.commit()
+            self.db.refresh(user_list)
+        self.list_ids[record["id"]] = user_list.id
+        self.counts["lists"] += 1
+
+    def _reminder_from_record(self, record):
+        from .recurrence import next_occurrence
+
+        due_date = _parse_datetime(record.get("due_date"))
+        is_active = bool(record.get("is_active", True))
+        recurrence = record.get("recurrence")
+        if is_active and due_date and due_date <= datetime.now():
+            # A past-due reminder would be delivered as soon as it is imported
+            following = next_occurrence(recurrence, due_date, datetime.now()) if recurrence else None
+            if following:
+                due_date, recurrence = following
+            else:
+                is_active = False
+        return {
+            "user_id": self.user_id,
+            "text": record["text"],
+            "due_date": due_date,
+            "is_active": is_active,
+            "recurrence": recurrence
+        }
+
+    def _rewrite_id(self, memory_id):
+        """Mints an imported ID in the target user's namespace, keeping the rest of the exported ID."""
+        if not memory_id:
+            return None
+        parts = memory_id.split("_", 2)
+        suffix = parts[2] if len(parts) == 3 and parts[0] == "memory" else memory_id
+        return f"memory_{self.user_id}_{suffix}"
+
+    def _memory_from_record(self, record):
+        metadata = dict(record.get("metadata") or {})
+        metadata["user_id"] = str(self.user_id)
+        if metadata.get("parent_id"):
+            metadata["parent_id"] = self._rewrite_id(metadata["parent_id"])
+        memory = {
+            "id": self._rewrite_id(record.get("id")) or self._get_memory_db().make_memory_id(record["content"], self.user_id),
+            "content": record["content"],
+            "metadata": metadata,
+            "user_id": self.user_id
+        }
+        if self.reuse_embeddings and record.get("embedding"):
+            memory["embedding"] = record["embedding"]
+        return memory
+
+    def _existing_reminders(self, texts):
+        """(text, due_date) of the user's reminders, archived or not, with one of the given texts."""
+        existing = set()
+        for model in (models.Reminder, models.ReminderArchive):
+            existing.update(
+                self.db.query(model.text, model.due_date)
+                .filter(model.user_id == self.user_id, model.text.in_(texts))
+                .all()
+            )
+        return existing
+
+    def _flush_reminders(self):
+        if self.reminders:
+            # Earlier batches are committed, so this also catches duplicates within the archive
+            seen = self._existing_reminders({reminder["text"] for reminder in self.reminders})
+            rows = []
+            for reminder in self.reminders:
+                key = (reminder["text"], reminder["due_date"])
+                if key not in seen:
+                    seen.add(key)
+                    rows.append(reminder)
+            self.db.bulk_insert_mappings(models.Reminder, rows)
+            self.db.commit()
+            if rows:
+                from .reminder_events import notify_reminder_changed
+                # Bulk inserts bypass reminders.py, have the scheduler reload its window
+                notify_reminder_changed()
+            self.counts["reminders"] += len(rows)
+            self.counts["duplicate_reminders"] += len(self.reminders) - len(rows)
+            self.reminders = []
+
+    def _flush_list_items(self):
+        if self.list_items:
+            seen = set(
+                self.db.query(models.ListItem.list_id, models.ListItem.text)
+                .filter(
+                    models.ListItem.list_id.in_({item["list_id"] for item in self.list_items}),
+                    models.ListItem.text.in_({item["text"] for item in self.list_items})
+                )
+                .all()
+            )
+            rows = []
+            for item in self.list_items:
+                key = (item["list_id"], item["text"])
+                if key not in seen:
+                    seen.add(key)
+                    rows.append(item)
+            self.db.bulk_insert_mappings(models.ListItem, rows)
+            self.db.commit()
+            self.counts["list_items"] += len(rows)
+            self.counts["duplicate_list_items"] += len(self.list_items) - len(rows)
+            self.list_items = []
+
+    def _flush_memories(self):
+        if self.memories:
+            memory_db = self._get_memory_db()
+            existing = memory_db.collection_for(self.user_id).get(
+                ids=list({memory["id"] for memory in self.memories}),
+                include=["metadatas"]
+            )
+            foreign = {
+                memory_id for memory_id, metadata in zip(existing["ids"], existing["metadatas"])
+                if (metadata or {}).get("user_id") != str(self.user_id)
+            }
+            memories = [memory for memory in self.memories if memory["id"] not in foreign]
+            memory_db.add_memories(memories)
+            self.counts["memories"] += len(memories)
+            self.counts["rejected_memories"] += len(self.memories) - len(memories)
+            self.memories = []
+
+
+def import_user_data(db, user_id, lines, batch_size=500, memory_db=None):
+    """
+    Imports an NDJSON archive (any iterable of lines) into a user's account.
+
+    Returns:
+        Dict with the number of imported reminders, lists, list items and memories
+    """
+    importer = UserDataImporter(db, user_id, batch_size=batch_size, memory_db=memory_db)
+    importer.feed_lines(lines)
+    return importer.close()
+
+
+def main():
+    from .dependencies import get_from_user_id
+    from .embeddings import EmbeddingError
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", nargs="?", default="-", help="Archive to import, - for standard input")
+    parser.add_argument("--user-id", required=True, type=int, help="Internal or Telegram ID of the user")
+    parser.add_argument("--embeddings", action="store_true", help="Export memory vectors too")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    # The memory store's bookkeeping tables are created by the schema upgrade
+    from .migrations import upgrade_schema
+    upgrade_schema()
+
+    db = SessionLocal()
+    try:
+        user = get_from_user_id(db, args.user_id)
+        if not user:
+            sys.exit(f"User {args.user_id} not found")
+
+        if args.command == "export":
+            for record in export_user_data(db, user.id, args.embeddings, args.batch_size):
+                sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+            return
+
+        importer = UserDataImporter(db, user.id, batch_size=args.batch_size)
+        try:
+            if args.path == "-":
+                importer.feed_lines(sys.stdin)
+            else:
+                with open(args.path, encoding="utf-8") as f:
+                    importer.feed_lines(f)
+            counts = importer.close()
+        except (ValueError, KeyError, TypeError, EmbeddingError) as e:
+            sys.exit(f"Import failed ({e}), partially imported {importer.counts}")
+        print(f"Imported {counts}", file=sys.stderr)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,13 @@ def link_web_token(db: Session, access_key: str, web_token: str) -> User:
         db.refresh(user)
     return user
 
+def set_reminder_digest(db: Session, user: User, enabled: bool) -> User:
+    """Enables or disables digest delivery of the user's reminders"""
+    user.reminder_digest = enabled
+    db.commit()
+    db.refresh(user)
+    return user
+
 def get_user_by_token(db: Session, web_token: str) -> User:
     """Retrieves a user from the web token"""
     return db.query(User).filter(User.web_token == web_token).first()
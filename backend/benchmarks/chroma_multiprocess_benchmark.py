@@ -0,0 +1,116 @@
+"""
+Multi-process read-after-write consistency and memory footprint of the Chroma modes.
+
+Several worker processes share one memory store, like the API and Telegram
+processes started by start_all.py. Each worker writes memories and immediately
+reads back memories written by the other workers, both by ID and through search.
+The hashing embedding provider is used so no API key is needed.
+
+Usage (from the backend directory):
+    python -m benchmarks.chroma_multiprocess_benchmark --mode persistent
+    python -m benchmarks.chroma_multiprocess_benchmark --mode http
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import resource
+import subprocess
+import tempfile
+import time
+
+
+def worker(worker_id, writes, written, results):
+    from app.memory_db import MemoryDB
+    from app.migrations import upgrade_schema
+
+    # Every worker upgrades the schema at startup, like the API and scheduler processes
+    upgrade_schema()
+    db = MemoryDB()
+    by_id = by_search = checked = 0
+    for i in range(writes):
+        content = f"worker {worker_id} secret code W{worker_id}X{i}Z"
+        memory_id = db.add_memory(content, user_id="bench")
+        if memory_id:
+            written.put((memory_id, f"W{worker_id}X{i}Z"))
+
+        # Read back something another process has just written
+        try:
+            other_id, token = written.get(timeout=1)
+        except queue.Empty:
+            continue
+        checked += 1
+        by_id += db.get_memory(other_id) is not None
+        by_search += other_id in db.search_memory(token, user_id="bench", limit=3, mode="vector")["ids"]
+
+    results.put({
+        "checked": checked,
+        "by_id": by_id,
+        "by_search": by_search,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def peak_rss_mb(pid):
+    """Peak resident memory of another process (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["persistent", "http"], default="persistent")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--writes", type=int, default=200, help="Memories written per worker")
+    parser.add_argument("--port", type=int, default=8011)
+    args = parser.parse_args()
+
+    # Settings are read from the environment by every worker
+    os.environ["CUSTOM_RAG_PATH"] = tempfile.mkdtemp(prefix="memogenius_chroma_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.environ['CUSTOM_RAG_PATH']}/reminders.db"
+    os.environ["CHROMA_MODE"] = args.mode
+    os.environ["CHROMA_PORT"] = str(args.port)
+    os.environ["EMBEDDING_PROVIDER"] = "hashing"
+
+    server = None
+    if args.mode == "http":
+        server = subprocess.Popen(
+            ["chroma", "run", "--path", os.environ["CUSTOM_RAG_PATH"], "--port", str(args.port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    written, results = multiprocessing.Queue(), multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(i, args.writes, written, results))
+        for i in range(args.workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    server_rss = 0.0
+    if server:
+        server_rss = peak_rss_mb(server.pid)
+        server.terminate()
+        server.wait()
+
+    checked = sum(report["checked"] for report in reports)
+    workers_rss = sum(report["max_rss_mb"] for report in reports)
+    print(f"mode={args.mode} workers={args.workers} writes/worker={args.writes} elapsed={elapsed:.1f}s")
+    print(f"read-after-write by id:     {sum(report['by_id'] for report in reports)}/{checked}")
+    print(f"read-after-write by search: {sum(report['by_search'] for report in reports)}/{checked}")
+    print(f"total peak RSS: {workers_rss + server_rss:.0f}MB (workers {workers_rss:.0f}MB, server {server_rss:.0f}MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Reminder dispatch throughput: sequential sends vs concurrent rate-limited sends,
+without and with per-user digests.
+
+Telegram is simulated by a fake bot with a fixed request latency, behind the
+real RateLimiter, so the numbers show how close dispatch gets to the configured
+global rate when thousands of reminders come due at once, and how many messages
+digests save when users have several reminders due together.
+
+Usage (from the backend directory):
+    python -m benchmarks.dispatch_benchmark --reminders 2000 --chats 1500 --latency 0.15
+"""
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from app.notifier import RateLimiter
+from app.scheduler import group_reminders, send_reminder, send_reminders
+
+
+class FakeNotifier:
+    def __init__(self, latency, global_rate, per_chat_rate, pool_size):
+        self.latency = latency
+        self.limiter = RateLimiter(global_rate, per_chat_rate)
+        self.slots = asyncio.Semaphore(pool_size)
+        self.messages = 0
+
+    async def send(self, chat_id, text):
+        await self.limiter.acquire(chat_id)
+        async with self.slots:
+            await asyncio.sleep(self.latency)
+            self.messages += 1
+
+
+async def run(reminders, notifier, mode):
+    start = time.perf_counter()
+    if mode == "digest":
+        await asyncio.gather(*(send_reminders(notifier, group) for group in group_reminders(reminders)))
+    elif mode == "concurrent":
+        await asyncio.gather(*(send_reminder(notifier, reminder) for reminder in reminders))
+    else:
+        for reminder in reminders:
+            await send_reminder(notifier, reminder)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reminders", type=int, default=2000)
+    parser.add_argument("--chats", type=int, default=1500, help="Fewer chats than reminders means several due per user")
+    parser.add_argument("--latency", type=float, default=0.15, help="Simulated seconds per Telegram request")
+    parser.add_argument("--global-rate", type=float, default=30.0)
+    parser.add_argument("--per-chat-rate", type=float, default=1.0)
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    reminders = [
+        SimpleNamespace(id=i, text=f"reminder {i}", telegram_id=random.randrange(args.chats) + 1, reminder_digest=True)
+        for i in range(args.reminders)
+    ]
+    print(f"{'dispatch':>11} {'seconds':>9} {'messages':>9} {'reminders/s':>12}")
+    for mode in ("sequential", "concurrent", "digest"):
+        notifier = FakeNotifier(args.latency, args.global_rate, args.per_chat_rate, args.pool_size)
+        seconds = asyncio.run(run(reminders, notifier, mode))
+        print(f"{mode:>11} {seconds:>9.1f} {notifier.messages:>9} {len(reminders) / seconds:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
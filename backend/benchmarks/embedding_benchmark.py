@@ -0,0 +1,70 @@
+"""
+Latency/recall trade-off of the embedding providers.
+
+Embeds the synthetic corpus of memory_search_benchmark with each provider and
+reports single-call latency, batch throughput and recall@k of an exact cosine
+search over the resulting vectors.
+
+Usage (from the backend directory):
+    python -m benchmarks.embedding_benchmark --providers hashing local gemini
+"""
+import argparse
+import time
+
+from app.embeddings import get_embedding_provider, EmbeddingError
+from benchmarks.memory_search_benchmark import build_corpus, evaluate, percentile
+
+
+def cosine_top_k(query_vector, vectors, k):
+    # Vectors from all providers are L2-normalized (Gemini's are close to it), so a dot product is enough
+    scores = [(sum(q * v for q, v in zip(query_vector, vector)), i) for i, vector in enumerate(vectors)]
+    scores.sort(reverse=True)
+    return [i for _, i in scores[:k]]
+
+
+def bench_provider(name, documents, queries, k, batch_size):
+    try:
+        provider = get_embedding_provider(provider=name)
+    except EmbeddingError as e:
+        print(f"{name:<8} skipped: {e}")
+        return
+
+    # Single-call latency, as paid by every store/search today
+    latencies = []
+    for query, _ in queries[:50]:
+        start = time.perf_counter()
+        provider.embed_one(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # Batch throughput
+    start = time.perf_counter()
+    vectors = []
+    for i in range(0, len(documents), batch_size):
+        vectors.extend(provider.embed(documents[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+
+    query_vectors = {query: provider.embed_one(query) for query, _ in queries}
+    recall, _, _ = evaluate(lambda query, limit: cosine_top_k(query_vectors[query], vectors, limit), queries, k)
+
+    print(
+        f"{provider.name:<45} dim={provider.dimension:<5} "
+        f"embed p50={percentile(latencies, 50):.2f}ms p95={percentile(latencies, 95):.2f}ms  "
+        f"batch={len(documents) / elapsed:.0f} docs/s  recall@{k}={recall:.3f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", nargs="+", default=["hashing"], help="Providers to compare (hashing, local, gemini)")
+    parser.add_argument("--size", type=int, default=500, help="Number of synthetic memories")
+    parser.add_argument("--k", type=int, default=3, help="Cut-off for recall@k")
+    parser.add_argument("--batch-size", type=int, default=64, help="Texts per embedding call")
+    args = parser.parse_args()
+
+    documents, queries = build_corpus(args.size)
+    for name in args.providers:
+        bench_provider(name, documents, queries, args.k, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
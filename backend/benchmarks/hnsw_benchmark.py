@@ -0,0 +1,105 @@
+"""
+HNSW parameter sweep for the memory collection.
+
+Builds synthetic collections of several sizes for every (M, construction_ef,
+search_ef) combination and reports recall@k against exact search, p95 query
+latency, build time and on-disk index size.
+
+Usage (from the backend directory):
+    python -m benchmarks.hnsw_benchmark --sizes 1000 10000 50000 --dim 768
+"""
+import argparse
+import itertools
+import os
+import shutil
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+
+def directory_size_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+
+def synthetic_vectors(size, dim, seed):
+    # Clustered data is closer to real embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(size // 50, 1), dim))
+    vectors = centers[rng.integers(0, len(centers), size)] + 0.3 * rng.normal(size=(size, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def exact_top_k(vectors, queries, k):
+    scores = queries @ vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def bench(size, dim, m, construction_ef, search_ef, k, n_queries, batch_size=5000):
+    vectors = synthetic_vectors(size, dim, seed=size)
+    queries = synthetic_vectors(n_queries, dim, seed=size + 1)
+    truth = exact_top_k(vectors, queries, k)
+
+    path = tempfile.mkdtemp(prefix="memogenius_hnsw_")
+    try:
+        client = chromadb.PersistentClient(path=path)
+        collection = client.create_collection(
+            name="bench",
+            metadata={
+                "hnsw:space": "cosine",
+                "hnsw:M": m,
+                "hnsw:construction_ef": construction_ef,
+                "hnsw:search_ef": search_ef,
+            },
+        )
+
+        start = time.perf_counter()
+        for i in range(0, size, batch_size):
+            chunk = vectors[i:i + batch_size]
+            collection.add(ids=[str(j) for j in range(i, i + len(chunk))], embeddings=chunk.tolist())
+        build_seconds = time.perf_counter() - start
+
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(set(int(i) for i in result["ids"][0]) & set(expected.tolist()))
+
+        return {
+            "recall": hits / (n_queries * k),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "build_s": build_seconds,
+            "size_mb": directory_size_mb(path),
+        }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=768, help="Vector dimension (768 for text-embedding-004)")
+    parser.add_argument("--m", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'size':>7} {'M':>3} {'c_ef':>5} {'s_ef':>5} {'recall@' + str(args.k):>10} {'p95':>8} {'build':>8} {'index':>8}")
+    for size in args.sizes:
+        for m, construction_ef, search_ef in itertools.product(args.m, args.construction_ef, args.search_ef):
+            result = bench(size, args.dim, m, construction_ef, search_ef, args.k, args.queries)
+            print(
+                f"{size:>7} {m:>3} {construction_ef:>5} {search_ef:>5} {result['recall']:>10.3f} "
+                f"{result['p95_ms']:>6.2f}ms {result['build_s']:>7.1f}s {result['size_mb']:>6.1f}MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Cold-start cost of importing app modules, with and without building the memory store.
+
+Each measurement runs in a fresh interpreter. "lazy" only imports the module, as
+the scheduler and Telegram processes do; "eager" also builds MemoryDB, which is
+what every import used to do before the store became lazy.
+
+Usage (from the backend directory):
+    python -m benchmarks.import_benchmark --modules app.memory_tools app.telegram_bot
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+if {eager}:
+    from app.memory_db import warmup_memory_db
+    warmup_memory_db()
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "chromadb_loaded": "chromadb" in sys.modules,
+}}))
+"""
+
+
+def measure(module, eager, runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, eager=eager)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    samples.sort(key=lambda sample: sample["seconds"])
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=["app.memory_tools", "app.telegram_bot"])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement (median is reported)")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        for mode, eager in (("lazy", False), ("eager", True)):
+            result = measure(module, eager, args.runs)
+            print(
+                f"{module:<20} {mode:<5} import={result['seconds'] * 1000:.0f}ms  "
+                f"max_rss={result['max_rss_mb']:.0f}MB  chromadb_loaded={result['chromadb_loaded']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
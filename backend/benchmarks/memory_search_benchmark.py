@@ -0,0 +1,135 @@
+"""
+Synthetic benchmark for memory search: recall@k and latency per search mode.
+
+Every synthetic memory contains one exact token (WiFi password, license plate,
+code, name) and each query asks for that token, which is the case where pure
+embedding search tends to rank poorly.
+
+Usage (from the backend directory):
+    python -m benchmarks.memory_search_benchmark                 # keyword index only
+    python -m benchmarks.memory_search_benchmark --memory-db     # all modes through MemoryDB
+"""
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+TEMPLATES = [
+    ("The WiFi password of the {place} is {token}", "what is the wifi password {token}"),
+    ("My car license plate is {token}", "license plate {token}"),
+    ("The door code for the {place} is {token}", "door code {token}"),
+    ("{token} is the name of my {place} neighbour", "who is {token}"),
+    ("Insurance policy number {token} for the {place}", "policy {token}"),
+]
+PLACES = ["house", "office", "gym", "garage", "lake house", "studio", "cellar", "attic"]
+FILLER = [
+    "Remember to water the plants on Sunday",
+    "My favourite pizza is margherita with basil",
+    "The dentist appointment is usually in spring",
+    "Grandma's recipe needs two eggs and flour",
+    "The bike needs new tyres before summer",
+]
+
+
+def random_token(rng):
+    kind = rng.randint(0, 2)
+    if kind == 0:
+        return "".join(rng.choices(string.ascii_uppercase + string.digits, k=8))
+    if kind == 1:
+        return f"{''.join(rng.choices(string.ascii_uppercase, k=2))}{rng.randint(100, 999)}{''.join(rng.choices(string.ascii_uppercase, k=2))}"
+    return "".join(rng.choices(string.ascii_lowercase, k=6)).capitalize()
+
+
+def build_corpus(size, seed=42):
+    """Returns (documents, queries) where queries is a list of (query, expected_index)."""
+    rng = random.Random(seed)
+    documents, queries = [], []
+    for i in range(size):
+        if i % 3 == 2:
+            documents.append(f"{rng.choice(FILLER)} ({i})")
+            continue
+        template, query_template = rng.choice(TEMPLATES)
+        token = random_token(rng)
+        documents.append(template.format(place=rng.choice(PLACES), token=token))
+        queries.append((query_template.format(token=token), i))
+    return documents, queries
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def evaluate(search, queries, k):
+    """search(query, k) -> list of document indexes. Returns recall@k, p50 and p95 latency in ms."""
+    hits, latencies = 0, []
+    for query, expected in queries:
+        start = time.perf_counter()
+        found = search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += expected in found
+    return hits / len(queries), percentile(latencies, 50), percentile(latencies, 95)
+
+
+def report(name, k, result):
+    recall, p50, p95 = result
+    print(f"{name:<10} recall@{k}={recall:.3f}  p50={p50:.2f}ms  p95={p95:.2f}ms")
+
+
+def bench_keyword_index(documents, queries, k):
+    from app.memory_index import KeywordIndex
+
+    index = KeywordIndex()
+    start = time.perf_counter()
+    for i, document in enumerate(documents):
+        index.add("bench", str(i), document)
+    print(f"Keyword index built in {(time.perf_counter() - start) * 1000:.1f}ms for {len(documents)} documents")
+
+    def search(query, limit):
+        return [int(memory_id) for memory_id, _ in index.search("bench", query, limit=limit)]
+
+    report("keyword", k, evaluate(search, queries, k))
+
+
+def bench_memory_db(documents, queries, k):
+    # Use a throw-away Chroma directory
+    os.environ["CUSTOM_RAG_PATH"] = tempfile.mkdtemp(prefix="memogenius_bench_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.environ['CUSTOM_RAG_PATH']}/reminders.db"
+    from app.memory_db import MemoryDB
+    from app.migrations import upgrade_schema
+
+    upgrade_schema()
+    db = MemoryDB()
+    ids = {}
+    for i, document in enumerate(documents):
+        memory_id = db.add_memory(document, user_id="bench")
+        if memory_id:
+            ids[memory_id] = i
+
+    for mode in ("vector", "keyword", "hybrid"):
+        def search(query, limit, mode=mode):
+            results = db.search_memory(query, user_id="bench", limit=limit, mode=mode)
+            return [ids.get(memory_id) for memory_id in results["ids"]]
+
+        report(mode, k, evaluate(search, queries, k))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=2000, help="Number of synthetic memories")
+    parser.add_argument("--k", type=int, default=3, help="Cut-off for recall@k")
+    parser.add_argument("--memory-db", action="store_true", help="Also benchmark vector and hybrid search through MemoryDB")
+    args = parser.parse_args()
+
+    documents, queries = build_corpus(args.size)
+    print(f"{len(documents)} documents, {len(queries)} queries")
+
+    bench_keyword_index(documents, queries, args.k)
+    if args.memory_db:
+        bench_memory_db(documents, queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Filtered search latency versus total corpus size, shared collection vs partitions.
+
+One "target" user owns a fixed number of memories while the rest of the corpus
+belongs to other users. The target user's queries run against the shared
+collection with a user_id filter (today's layout) and against a dedicated
+per-user collection.
+
+Usage (from the backend directory):
+    python -m benchmarks.partition_benchmark --corpus 10000 50000 200000
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+
+def random_unit_vectors(rng, size, dim):
+    vectors = rng.normal(size=(size, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def add_in_batches(collection, ids, vectors, metadatas=None, batch_size=5000):
+    for i in range(0, len(ids), batch_size):
+        collection.add(
+            ids=ids[i:i + batch_size],
+            embeddings=vectors[i:i + batch_size].tolist(),
+            metadatas=metadatas[i:i + batch_size] if metadatas else None,
+        )
+
+
+def measure(collection, queries, k, where=None):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[query.tolist()], n_results=k, where=where, include=[])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=int, nargs="+", default=[10000, 50000, 200000], help="Total memories")
+    parser.add_argument("--user-memories", type=int, default=300, help="Memories owned by the target user")
+    parser.add_argument("--users", type=int, default=500, help="Number of other users")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = random_unit_vectors(rng, args.queries, args.dim)
+    target_vectors = random_unit_vectors(rng, args.user_memories, args.dim)
+    target_ids = [f"memory_target_{i}" for i in range(args.user_memories)]
+
+    print(f"{'corpus':>8} {'shared p50':>11} {'shared p95':>11} {'partition p50':>14} {'partition p95':>14}")
+    for corpus in args.corpus:
+        path = tempfile.mkdtemp(prefix="memogenius_partition_")
+        try:
+            client = chromadb.PersistentClient(path=path)
+            shared = client.create_collection("shared", metadata={"hnsw:space": "cosine"})
+            partition = client.create_collection("shared_utarget", metadata={"hnsw:space": "cosine"})
+
+            others = corpus - args.user_memories
+            add_in_batches(
+                shared,
+                [f"memory_{i % args.users}_{i}" for i in range(others)],
+                random_unit_vectors(rng, others, args.dim),
+                [{"user_id": str(i % args.users)} for i in range(others)],
+            )
+            add_in_batches(shared, target_ids, target_vectors, [{"user_id": "target"}] * args.user_memories)
+            add_in_batches(partition, target_ids, target_vectors)
+
+            shared_p50, shared_p95 = measure(shared, queries, args.k, where={"user_id": "target"})
+            partition_p50, partition_p95 = measure(partition, queries, args.k)
+            print(
+                f"{corpus:>8} {shared_p50:>9.2f}ms {shared_p95:>9.2f}ms "
+                f"{partition_p50:>12.2f}ms {partition_p95:>12.2f}ms"
+            )
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Footprint, recall and latency of quantized memory vectors.
+
+Compares exact float32 search with the int8 and float16 stores of
+app.quantized_index, with and without full-precision rescoring of the top
+candidates read from disk (what MemoryDB does when MEMORY_QUANTIZATION is set).
+The reported size is what stays in memory: the codes.
+
+Usage (from the backend directory):
+    python -m benchmarks.quantization_benchmark --sizes 1000 10000 100000 --dim 768
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from app.quantized_index import QuantizedVectorIndex
+
+
+def synthetic_vectors(size, dim, seed):
+    # Clustered data is closer to real embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(size // 50, 1), dim))
+    vectors = centers[rng.integers(0, len(centers), size)] + 0.3 * rng.normal(size=(size, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def bench(vectors, queries, truth, k, dtype, rescore):
+    ids = [str(i) for i in range(len(vectors))]
+    index = QuantizedVectorIndex(tempfile.mkdtemp(prefix="memogenius_vectors_"), vectors.shape[1], dtype=dtype)
+    index.add("bench", ids, vectors)
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        # Without rescoring, the k best codes are returned (only reordered by their exact scores)
+        found = [int(memory_id) for memory_id, _ in index.search("bench", query, k, candidates=k * rescore)]
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(int(i) for i in found) & set(expected.tolist()))
+
+    return {
+        "recall": hits / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "size_mb": index.nbytes() / (1024 * 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=768, help="Vector dimension (768 for text-embedding-004)")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--rescore", type=int, default=4, help="Candidates rescored per result")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'size':>7} {'index':>16} {'recall@' + str(args.k):>9} {'p50':>8} {'p95':>8} {'vectors':>9}")
+    for size in args.sizes:
+        vectors = synthetic_vectors(size, args.dim, seed=size)
+        queries = synthetic_vectors(args.queries, args.dim, seed=size + 1)
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            np.argsort(-(vectors @ query))[:args.k]
+            latencies.append((time.perf_counter() - start) * 1000)
+        truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k]
+        print(
+            f"{size:>7} {'float32':>16} {1.0:>9.3f} {np.percentile(latencies, 50):>6.2f}ms "
+            f"{np.percentile(latencies, 95):>6.2f}ms {vectors.nbytes / (1024 * 1024):>7.1f}MB"
+        )
+
+        for dtype in ("float16", "int8"):
+            for rescore in (1, args.rescore):
+                result = bench(vectors, queries, truth, args.k, dtype, rescore)
+                label = f"{dtype}+rescore x{rescore}" if rescore > 1 else dtype
+                print(
+                    f"{size:>7} {label:>16} {result['recall']:>9.3f} {result['p50_ms']:>6.2f}ms "
+                    f"{result['p95_ms']:>6.2f}ms {result['size_mb']:>7.1f}MB"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Due-reminder query time as delivered-reminder history grows, with and without
+the partial index on active reminders.
+
+A fixed set of active reminders (some due, most in the future) is kept while
+inactive history rows are added up to the largest size. At each size the
+scheduler's claim candidate query and the joined recipient query are timed with
+the ix_reminders_active_due index and without it.
+
+Usage (from the backend directory):
+    python -m benchmarks.reminder_query_benchmark --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Settings are read when the app modules are imported
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='memogenius_reminders_')}/reminders.db"
+
+from sqlalchemy import insert, select, text  # noqa: E402
+
+from app import models  # noqa: E402
+from app.database import engine  # noqa: E402
+from app.migrations import upgrade_schema  # noqa: E402
+from app.reminders import claimable_condition  # noqa: E402
+
+INDEX_DDL = "CREATE INDEX ix_reminders_active_due ON reminders (is_active, due_date) WHERE is_active = 1"
+
+
+def add_rows(connection, start, count, users, active, due, batch_size=50000):
+    for offset in range(0, count, batch_size):
+        connection.execute(insert(models.Reminder), [
+            {
+                "user_id": (start + i) % users + 1,
+                "text": f"reminder {start + i}",
+                "due_date": due(start + i),
+                "is_active": active,
+                "delivery_attempts": 0,
+            }
+            for i in range(offset, min(offset + batch_size, count))
+        ])
+
+
+def time_query(connection, statement, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        connection.execute(statement).all()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="Inactive history rows")
+    parser.add_argument("--active", type=int, default=5000, help="Active reminders")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=200, help="Claim batch size")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    upgrade_schema()
+    now = datetime.now()
+    with engine.begin() as connection:
+        connection.execute(insert(models.User), [
+            {"id": i + 1, "access_key": f"key-{i}", "telegram_id": 100000 + i} for i in range(args.users)
+        ])
+        # 2% of the active reminders are due, the rest spread over the next month
+        add_rows(connection, 0, args.active, args.users, True,
+                 lambda i: now - timedelta(minutes=1) if i % 50 == 0 else now + timedelta(minutes=i % 43200))
+
+    candidates = select(models.Reminder.id)\
+        .where(claimable_condition(now))\
+        .order_by(models.Reminder.due_date)\
+        .limit(args.limit)
+    recipients = select(models.Reminder.id, models.Reminder.text, models.User.telegram_id)\
+        .join(models.User, models.User.id == models.Reminder.user_id)\
+        .where(claimable_condition(now))\
+        .order_by(models.Reminder.due_date)\
+        .limit(args.limit)
+
+    print(f"{'history':>9} {'claim (index)':>14} {'claim (no index)':>17} {'joined (index)':>15} {'joined (no index)':>18}")
+    history = 0
+    for size in sorted(args.sizes):
+        with engine.begin() as connection:
+            add_rows(connection, args.active + history, size - history, args.users, False,
+                     lambda i: now - timedelta(minutes=i % 525600))
+        history = size
+
+        results = []
+        for indexed in (True, False):
+            with engine.begin() as connection:
+                connection.execute(text("DROP INDEX IF EXISTS ix_reminders_active_due"))
+                if indexed:
+                    connection.execute(text(INDEX_DDL))
+                connection.execute(text("ANALYZE"))
+            with engine.connect() as connection:
+                results.append((time_query(connection, candidates, args.runs), time_query(connection, recipients, args.runs)))
+        (claim_indexed, joined_indexed), (claim_plain, joined_plain) = results
+        print(
+            f"{size:>9} {claim_indexed:>12.2f}ms {claim_plain:>15.2f}ms "
+            f"{joined_indexed:>13.2f}ms {joined_plain:>16.2f}ms"
+        )
+
+    with engine.connect() as connection:
+        connection.execute(text(INDEX_DDL))
+        plan = connection.execute(text("EXPLAIN QUERY PLAN " + str(candidates.compile(
+            engine, compile_kwargs={"literal_binds": True}
+        )))).all()
+    print("plan:", "; ".join(row[-1] for row in plan))
+
+
+if __name__ == "__main__":
+    main()
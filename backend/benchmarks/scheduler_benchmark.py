@@ -0,0 +1,120 @@
+"""
+Delivery lag and idle CPU of the reminder scheduler, event-driven vs 5-second polling.
+
+Reminders are created through reminders.create_reminder (so the event-driven
+scheduler receives change notifications) with due times spread over the next
+few seconds. Delivery is recorded instead of sent to Telegram. Idle CPU is
+measured over a period with no reminder due.
+
+Usage (from the backend directory):
+    python -m benchmarks.scheduler_benchmark --reminders 200 --spread 20 --idle 60
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Settings are read when the app modules are imported
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='memogenius_scheduler_')}/reminders.db"
+os.environ.setdefault("SCHEDULER_NOTIFY_PORT", "8012")
+
+from apscheduler.schedulers.background import BackgroundScheduler  # noqa: E402
+
+from app import models, reminders, schemas  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+from app.reminder_events import notify_reminder_changed  # noqa: E402
+from app.scheduler import ReminderScheduler  # noqa: E402
+
+lags = []
+
+
+async def record_delivery():
+    now = datetime.now()
+    db = SessionLocal()
+    try:
+        due = db.query(models.Reminder).filter(
+            models.Reminder.due_date <= now,
+            models.Reminder.is_active == True
+        ).all()
+        for reminder in due:
+            lags.append((now - reminder.due_date).total_seconds())
+            reminder.is_active = False
+        db.commit()
+    finally:
+        db.close()
+    return []
+
+
+def record_delivery_sync():
+    import asyncio
+    asyncio.run(record_delivery())
+
+
+def start(mode):
+    if mode == "event":
+        stop = threading.Event()
+        thread = threading.Thread(target=ReminderScheduler(dispatch=record_delivery).run_forever, args=(stop,), daemon=True)
+        thread.start()
+
+        def shutdown():
+            stop.set()
+            notify_reminder_changed()  # Wake the loop up so it sees the stop flag
+            thread.join()
+        return shutdown
+
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(record_delivery_sync, "interval", seconds=5)
+    scheduler.start()
+    return scheduler.shutdown
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=["event", "polling"], default=["event", "polling"])
+    parser.add_argument("--reminders", type=int, default=200)
+    parser.add_argument("--spread", type=float, default=20, help="Seconds over which reminders come due")
+    parser.add_argument("--idle", type=float, default=60, help="Seconds of idle CPU measurement")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    print(f"{'mode':>8} {'delivered':>10} {'lag p50':>9} {'lag p95':>9} {'lag max':>9} {'idle CPU':>10}")
+    for mode in args.modes:
+        lags.clear()
+        shutdown = start(mode)
+        time.sleep(0.5)
+
+        # Idle: nothing due
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        time.sleep(args.idle)
+        idle_cpu = (time.process_time() - cpu_start) / (time.perf_counter() - wall_start) * 100
+
+        db = SessionLocal()
+        try:
+            now = datetime.now()
+            for i in range(args.reminders):
+                reminders.create_reminder(db, schemas.ReminderCreate(
+                    user_id=1,
+                    text=f"bench {mode} {i}",
+                    due_date=now + timedelta(seconds=1 + random.random() * args.spread)
+                ))
+        finally:
+            db.close()
+        time.sleep(args.spread + 7)
+        shutdown()
+
+        print(
+            f"{mode:>8} {len(lags):>10} {percentile(lags, 0.5):>8.3f}s {percentile(lags, 0.95):>8.3f}s "
+            f"{max(lags, default=0.0):>8.3f}s {idle_cpu:>9.3f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
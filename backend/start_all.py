@@ -1,5 +1,8 @@
 import multiprocessing
+import multiprocessing.connection
+import subprocess
 import uvicorn
+from app.config import settings
 from app.telegram_bot import setup_telegram_bot
 from app.main import app as fastapi_app
 
@@ -14,13 +17,28 @@ def run_telegram():
 
 def run_scheduler():
     """Runs the reminder scheduler."""
-    import app.scheduler  # Import here only to start the scheduler
-    # Process remains active while scheduler is running
-    import time
-    while True:
-        time.sleep(1)
+    from app.scheduler import run_scheduler as run_reminder_scheduler  # Import here only in the scheduler process
+    # Blocks, sleeping until the next reminder is due
+    run_reminder_scheduler()
+
+def start_chroma_server():
+    """Starts the shared Chroma server used by every process in http mode."""
+    return subprocess.Popen([
+        "chroma", "run",
+        "--path", settings.CUSTOM_RAG_PATH,
+        "--host", settings.CHROMA_HOST,
+        "--port", str(settings.CHROMA_PORT),
+    ])
 
 if __name__ == "__main__":
+    # Upgrade the database once, before the processes that use it start
+    from app.migrations import upgrade_schema
+    upgrade_schema()
+    
+    chroma_server = None
+    if settings.CHROMA_MODE == "http" and settings.CHROMA_AUTOSTART:
+        chroma_server = start_chroma_server()
+    
     # Create processes
     fastapi_process = multiprocessing.Process(target=run_fastapi)
     telegram_process = multiprocessing.Process(target=run_telegram)
@@ -31,16 +49,20 @@ if __name__ == "__main__":
     telegram_process.start()
     scheduler_process.start()
 
+    processes = [fastapi_process, telegram_process, scheduler_process]
     try:
-        fastapi_process.join()
-        telegram_process.join()
-        scheduler_process.join()
+        # Returns as soon as one process exits, so a crash stops the whole app
+        multiprocessing.connection.wait([process.sentinel for process in processes])
     except KeyboardInterrupt:
         print("\nShutdown in progress...")
-        fastapi_process.terminate()
-        telegram_process.terminate()
-        scheduler_process.terminate()
-        fastapi_process.join()
-        telegram_process.join()
-        scheduler_process.join()
+    finally:
+        # Also reached on a crash, so the Chroma server never outlives the app
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+        if chroma_server:
+            chroma_server.terminate()
+            chroma_server.wait()
         print("Application terminated.")
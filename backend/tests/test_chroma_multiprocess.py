@@ -0,0 +1,72 @@
+"""
+Cross-process read-after-write consistency of the shared Chroma server mode.
+
+Worker processes share one Chroma server, like the API and Telegram processes
+started by start_all.py, and read back by ID and through search the memories the
+other workers have just written. Needs chromadb and its `chroma` CLI.
+
+Usage (from the backend directory):
+    python -m pytest tests
+"""
+import multiprocessing
+import shutil
+import socket
+import subprocess
+
+import pytest
+
+pytest.importorskip("chromadb")
+pytestmark = pytest.mark.skipif(shutil.which("chroma") is None, reason="the chroma CLI is not installed")
+
+from benchmarks.chroma_multiprocess_benchmark import worker  # noqa: E402
+
+WORKERS = 3
+WRITES = 50
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def chroma_server(tmp_path, monkeypatch):
+    """A Chroma server on a temporary store, with settings for the workers in the environment."""
+    port = free_port()
+    monkeypatch.setenv("CUSTOM_RAG_PATH", str(tmp_path / "custom_rag"))
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'reminders.db'}")
+    monkeypatch.setenv("CHROMA_MODE", "http")
+    monkeypatch.setenv("CHROMA_HOST", "127.0.0.1")
+    monkeypatch.setenv("CHROMA_PORT", str(port))
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "hashing")
+    server = subprocess.Popen(
+        ["chroma", "run", "--path", str(tmp_path / "custom_rag"), "--host", "127.0.0.1", "--port", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        yield
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def test_writes_are_read_back_by_other_processes(chroma_server):
+    # Spawned workers read their settings from the environment set by the fixture
+    context = multiprocessing.get_context("spawn")
+    written, results = context.Queue(), context.Queue()
+    processes = [context.Process(target=worker, args=(i, WRITES, written, results)) for i in range(WORKERS)]
+    for process in processes:
+        process.start()
+    try:
+        reports = [results.get(timeout=300) for _ in processes]
+    finally:
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+
+    checked = sum(report["checked"] for report in reports)
+    assert checked > 0
+    assert sum(report["by_id"] for report in reports) == checked
+    assert sum(report["by_search"] for report in reports) == checked
@@ -0,0 +1,109 @@
+"""
+Multi-process check of lease-based reminder claiming on SQLite.
+
+Several worker processes claim and "deliver" the same set of due reminders
+concurrently through reminders.claim_due_reminders. One worker crashes right
+after its first claim, so its reminders must be picked up by the others once
+the lease expires. Every reminder must be delivered exactly once.
+
+Usage (from the backend directory):
+    python -m pytest tests
+"""
+import multiprocessing
+import os
+import queue
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+REMINDERS = 500
+WORKERS = 4
+BATCH_SIZE = 25
+LEASE_SECONDS = 2
+
+
+def worker(name, crash, delivered):
+    # Spawned workers read DATABASE_URL from the environment set by the fixture
+    from app import models, reminders
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        while True:
+            claimed = reminders.claim_due_reminders(db, name, datetime.now(), LEASE_SECONDS, BATCH_SIZE)
+            if crash and claimed:
+                # Die holding the lease, the other workers retry after it expires
+                os._exit(1)
+            if not claimed:
+                remaining = db.query(models.Reminder).filter(models.Reminder.is_active == True).count()
+                if not remaining:
+                    return
+                time.sleep(0.1)
+                continue
+            for reminder_id in claimed:
+                delivered.put((reminder_id, name))
+            reminders.complete_reminders(db, claimed)
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def due_reminders(tmp_path, monkeypatch):
+    """A temporary database holding REMINDERS due reminders, named in the environment for the workers."""
+    from app import models
+    from app.migrations import upgrade_schema
+
+    url = f"sqlite:///{tmp_path / 'reminders.db'}"
+    monkeypatch.setenv("DATABASE_URL", url)
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    upgrade_schema(engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        db.add(models.User(id=1, access_key="claim-check", telegram_id=1))
+        due = datetime.now() - timedelta(seconds=1)
+        db.bulk_insert_mappings(models.Reminder, [
+            {"user_id": 1, "text": f"reminder {i}", "due_date": due, "is_active": True}
+            for i in range(REMINDERS)
+        ])
+        db.commit()
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def test_reminders_are_delivered_exactly_once(due_reminders):
+    context = multiprocessing.get_context("spawn")
+    delivered = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(f"worker-{i}", i == 0, delivered))
+        for i in range(WORKERS)
+    ]
+    for process in processes:
+        process.start()
+
+    results = []
+    deadline = time.monotonic() + 120
+    try:
+        while any(process.is_alive() for process in processes) or not delivered.empty():
+            assert time.monotonic() < deadline, "workers did not finish"
+            try:
+                results.append(delivered.get(timeout=0.2))
+            except queue.Empty:
+                pass
+    finally:
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+
+    counts = {}
+    for reminder_id, _ in results:
+        counts[reminder_id] = counts.get(reminder_id, 0) + 1
+    duplicates = [reminder_id for reminder_id, count in counts.items() if count > 1]
+    assert duplicates == []
+    assert len(counts) == REMINDERS
+    # The crashed worker delivered nothing, its leased reminders went to the others
+    assert "worker-0" not in {name for _, name in results}
@@ -0,0 +1,67 @@
+"""
+Near-duplicate merging of new memories (MEMORY_DEDUP_DISTANCE).
+
+Memories whose vectors are close but whose words differ are distinct facts and
+must both be kept; only restatements of the same words update the existing one.
+
+Usage (from the backend directory):
+    python -m pytest tests
+"""
+import pytest
+
+pytest.importorskip("chromadb")
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from app.config import Settings, settings  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.memory_db import MemoryDB  # noqa: E402
+from app.migrations import upgrade_schema  # noqa: E402
+
+# Wide on purpose: the two dentist appointments below are within it, only their words differ
+DEDUP_DISTANCE = 0.5
+
+
+@pytest.fixture
+def memory_store(tmp_path, monkeypatch):
+    """A MemoryDB on a temporary store and database, with deduplication enabled."""
+    monkeypatch.setattr(settings, "CUSTOM_RAG_PATH", str(tmp_path / "custom_rag"))
+    monkeypatch.setattr(settings, "CHROMA_MODE", "persistent")
+    monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "hashing")
+    monkeypatch.setattr(settings, "MEMORY_DEDUP_DISTANCE", DEDUP_DISTANCE)
+    engine = create_engine(f"sqlite:///{tmp_path / 'reminders.db'}", connect_args={"check_same_thread": False})
+    upgrade_schema(engine)
+    original_bind = SessionLocal.kw["bind"]
+    SessionLocal.configure(bind=engine)
+    try:
+        yield MemoryDB()
+    finally:
+        SessionLocal.configure(bind=original_bind)
+        engine.dispose()
+
+
+def test_deduplication_is_off_by_default():
+    assert Settings.model_fields["MEMORY_DEDUP_DISTANCE"].default == 0
+
+
+def test_close_but_distinct_facts_are_both_kept(memory_store):
+    monday, tuesday = memory_store.create_embeddings(["Dentist appointment on Monday", "Dentist appointment on Tuesday"])
+    distance = 1.0 - sum(a * b for a, b in zip(monday, tuesday)) / (
+        sum(a * a for a in monday) ** 0.5 * sum(b * b for b in tuesday) ** 0.5
+    )
+    assert distance <= DEDUP_DISTANCE
+
+    first = memory_store.add_memory("Dentist appointment on Monday", user_id=1)
+    second = memory_store.add_memory("Dentist appointment on Tuesday", user_id=1)
+
+    assert first != second
+    assert memory_store.get_memory(first, 1)["content"] == "Dentist appointment on Monday"
+    assert memory_store.get_memory(second, 1)["content"] == "Dentist appointment on Tuesday"
+
+
+def test_restated_memory_updates_the_existing_one(memory_store):
+    first = memory_store.add_memory("Dentist appointment on Monday", user_id=1)
+    second = memory_store.add_memory("dentist appointment on monday!", user_id=1)
+
+    assert second == first
+    assert memory_store.get_memory(first, 1)["content"] == "dentist appointment on monday!"
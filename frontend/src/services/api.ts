@@ -1,5 +1,6 @@
 import axios from 'axios';
 import { ReminderFormData } from '../types/reminder';
+import { Memory, MemoryFilters } from '../types/memory';
 
 export const api = axios.create({
   baseURL: '/api'
@@ -60,3 +61,32 @@ export const reminderService = {
     return response.data;
   }
 };
+
+export const memoryService = {
+  // Reads the NDJSON stream line by line, so large memory sets are never buffered whole
+  stream: async (onMemory: (memory: Memory) => void, filters: MemoryFilters = {}) => {
+    const webToken = localStorage.getItem('webToken');
+    const params = new URLSearchParams({ user_id: webToken ?? '' });
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value) params.append(key, value);
+    });
+
+    const response = await fetch(`/api/memories?${params}`);
+    if (!response.ok || !response.body) {
+      throw new Error(`Failed to load memories: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      buffer += decoder.decode(value, { stream: !done });
+      const lines = buffer.split('\n');
+      buffer = lines.pop() ?? '';
+      lines.filter((line) => line.trim()).forEach((line) => onMemory(JSON.parse(line)));
+      if (done) break;
+    }
+    if (buffer.trim()) onMemory(JSON.parse(buffer));
+  }
+};
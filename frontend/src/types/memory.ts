@@ -0,0 +1,17 @@
+export interface Memory {
+  id: string;
+  content: string;
+  metadata: {
+    category?: string;
+    category_key?: string;
+    created_at?: string;
+    updated_at?: string;
+    [key: string]: unknown;
+  };
+}
+
+export interface MemoryFilters {
+  category?: string;
+  created_after?: string;
+  created_before?: string;
+}